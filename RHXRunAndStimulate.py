@@ -5,6 +5,8 @@ import os
 import tkinter as tk
 from tkinter import filedialog
 
+from stim_conditions import condition_key
+
 
 def connect_to_server(ip_address='127.0.0.1', port=5000):
     """
@@ -248,7 +250,7 @@ def cancel_config(scommand, channels):
     time.sleep(0.1)
 
 
-def configure_stimulation(scommand, channels, digital_out, amplitude, duration, trigger, numberOfstimpulses):
+def configure_stimulation(scommand, channels, digital_out, amplitude, duration, trigger, numberOfstimpulses, conditions=None):
     """
     根据输入的通道、幅值和duration，生成对应的刺激信号，并发送给ITNAN,待触发；
 
@@ -262,6 +264,8 @@ def configure_stimulation(scommand, channels, digital_out, amplitude, duration,
     :param duration: 时间列表，分别代表第一个刺激脉宽时间，第二个刺激脉宽时间，刺激前放大器稳定时间和刺激后放大器稳定时间，单位为微秒。
     :param trigger: 字符串，表示触发器 'keypressf1 - keypressf8'。
     :param numberOfstimpulses:  脉冲串个数
+    :param conditions: 可选的 stim_conditions.StimConditions，传入时按这组刺激参数登记这些通道的刺激条件，
+                       采集端的伪迹模板、诱发平均和 PSTH 据此区分条件。
 
     :return: 包含配置多个通道刺激设置所需的所有命令的字符串。命令用分号连接，并准备通过TCP发送。
 
@@ -284,6 +288,10 @@ def configure_stimulation(scommand, channels, digital_out, amplitude, duration,
     scommand.sendall(com_config.encode())
     time.sleep(0.1)
 
+    if conditions is not None:
+        conditions.set_condition(condition_key(amplitude, duration, numberOfstimpulses,
+                                               period_us=duration[2] if numberOfstimpulses >= 2 else None), channels)
+
     # return ';'.join(com_configs)
 
 
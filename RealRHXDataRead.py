@@ -1,25 +1,42 @@
 import numpy as np
 import os
 import time
-from threading import Thread
+from threading import Thread, Lock
 
-from PyQt5.QtCore import QThread
+from PyQt5.QtCore import QThread, pyqtSignal
 from log_manager import LogManager
 
 # 导入重构后的模块
 from file_monitor import FileMonitor
 from file_processor import FileProcessor, FileInfo
 from data_readers import DataReaderFactory
-from circular_buffer import CircularBuffer
+from sample_ring_buffer import SampleRingBuffer
+from tiered_history import SpillStore
+from buffer_budget import BufferBudget, MemoryBudgetError
+from shared_ring import SharedSampleRingBuffer
+from ingest_pipeline import IngestPipeline, IngestChunk, ChannelManifest
+from ring_reader import RingReaderMixin, DataWindow
 
 
-class RealTimeDataReader(QThread):
+class RealTimeDataReader(QThread, RingReaderMixin):
     """
     重构后的实时数据读取器
     现在只负责：协调其他组件，管理数据流，提供对外接口
+
+    新数据写入缓冲区后发出 dataReady(DataWindow)，句柄覆盖上次发出之后的所有新样本，
+    发出频率不超过 data_ready_max_rate_hz，界面可以直接连接这个信号刷新而不用定时轮询 read_data。
     """
     
-    def __init__(self):
+    dataReady = pyqtSignal(object)
+    
+    def __init__(self, memory_budget_bytes=None, history_seconds=100, budget_policy='degrade'):
+        """
+        Args:
+            memory_budget_bytes: 样本缓冲区加上处理阶段派生数据流的内存上限（字节），例如 2 * 1024 ** 3；None 表示不限制。
+                开始加载前添加的处理阶段先分配，剩下的预算决定原始缓冲区的历史时长
+            history_seconds: 期望在内存中保留的历史时长（秒）
+            budget_policy: 预算不够时的处理方式，'degrade' 缩短历史，'strict' 拒绝开始加载
+        """
         QThread.__init__(self, parent=None)
         
         # 初始化各个职责组件
@@ -30,24 +47,50 @@ class RealTimeDataReader(QThread):
         # 设置文件监控回调
         self.file_monitor.set_file_created_callback(self._on_new_file)
         
-        # 数据缓冲相关（暂时保留）
-        self.circular_buffer = CircularBuffer(1000)
+        # 数据缓冲相关：按样本存储的环形缓冲区，通道数确定后（_check_ready_to_load）再分配
+        self.sample_buffer = None  # type: SampleRingBuffer
+        self.buffer_budget = BufferBudget(memory_budget_bytes, history_seconds, budget_policy)
         self.samples_per_100ms = None
-        self.temp_data_t = None
-        self.temp_data_d = None
-        self.temp_data_s = None
-        self.temp_data_di = None
+        # read_data 的消费位置（绝对样本索引），落后超过 max_read_lag_ms 时直接跳到最新
+        self._read_cursor = 0
+        self._read_epoch = 0
+        self.max_read_lag_ms = 500
+        # 可选的磁盘历史层，见 enable_history_spill
+        self.spill_directory = None
+        self.spill_history_seconds = 0
+        # 可选的共享内存发布，见 enable_shared_memory；每次分配用名称加序号，旧的一代还有人用时不会撞名
+        self.shared_memory_name = None
+        self._shared_generation = 0
+        
+        # dataReady 信号的限速：多块数据合并成一个句柄发出
+        self.data_ready_max_rate_hz = 60
+        self._ready_start = 0
+        self._last_ready_emit = 0.0
+        # stream() 协程的唤醒点
+        self._stream_waiters = []
+        
+        # 写入缓冲区之后依次执行的处理阶段，见 add_stage
+        self.pipeline = IngestPipeline()
         
         # 线程相关（暂时保留）
         self.loading_running = False
         self.data_loading_thread = None
         self.ready_to_load = False
+        # 必需的文件已到齐、等加载线程分配缓冲区，见 _check_ready_to_load
+        self._layout_pending = False
+        # 文件监控线程改动文件列表和加载线程的每一步互斥，缓冲区不会在读到一半时被换掉
+        self._file_lock = Lock()
         
         # 其他配置（暂时保留）
         self.sample_rate = 30000
         self.min_samples_per_read = 3000
         self.stored_samples = 0
         
+        # 分段续接相关：新段的时间戳若回退，则整体平移以保证时间戳连续
+        self._last_timestamp = None
+        self._timestamp_offset = 0
+        self._segment_start_pending = False
+        
         # 使用统一的日志管理器
         self._logger = LogManager.get_logger("RealTimeDataReader")
         
@@ -61,26 +104,46 @@ class RealTimeDataReader(QThread):
         # 停止当前监控
         self.file_monitor.stop()
         
-        # 停止数据加载
-        self.ready_to_load = False
-        
-        # 清理文件处理器
-        self.file_processor.close_all_files()
-        
-        # 重置读取器
-        self.reader_factory.reset_all()
-        
-        # 清空缓冲区
-        self.circular_buffer.clear()
-        
-        # 重置状态
-        self.stored_samples = 0
+        with self._file_lock:
+            # 停止数据加载
+            self.ready_to_load = False
+            self._layout_pending = False
+            
+            # 清理文件处理器（包括已预打开的下一段）
+            self.file_processor.reset()
+            
+            # 重置读取器
+            self.reader_factory.reset_all()
+            
+            # 清空缓冲区
+            if self.sample_buffer is not None:
+                self.sample_buffer.clear()
+            self._read_cursor = 0
+            self._ready_start = 0
+            self._notify_streams()
+            self.pipeline.reset()
+            
+            # 重置状态
+            self.stored_samples = 0
+            self._last_timestamp = None
+            self._timestamp_offset = 0
+            self._segment_start_pending = False
         
         # 启动新的监控
         self.file_monitor.start(directory)
         
     def _on_new_file(self, filepath):
         """处理新文件的回调"""
+        with self._file_lock:
+            self._handle_new_file(filepath)
+        
+    def _handle_new_file(self, filepath):
+        """登记新文件，持有 _file_lock 时调用"""
+        # 下一段的文件只做预打开，当前段继续读，不打断加载
+        if self.ready_to_load and os.path.dirname(filepath) != self.file_processor.current_directory:
+            self.file_processor.process_new_file(filepath)
+            return
+        
         # 暂停数据加载
         self.ready_to_load = False
         
@@ -110,21 +173,150 @@ class RealTimeDataReader(QThread):
         has_digital = self.file_processor.get_file_count_by_type('digital_in') > 0
         
         if has_timestamp and has_amp and has_digital:
-            # 初始化临时缓冲区
-            amp_count = self.file_processor.get_file_count_by_type('amp')
-            stim_count = self.file_processor.get_file_count_by_type('stim')
-            digital_count = self.file_processor.get_file_count_by_type('digital_in')
+            # 这时后面可能还有通道文件陆续出现，缓冲区等加载线程看到时间戳开始写入后再分配，见 _prepare_to_load
+            self._layout_pending = True
             
-            # TODO 这儿的格式初始化逻辑可能有问题 最终敲定就是这个格式？ 比如 temp_data_s 一旦返回带状态的字典就该崩溃了
-            self.temp_data_t = np.empty(0, dtype=np.float32)
-            self.temp_data_d = np.empty((amp_count, 0), dtype=np.float32)
-            self.temp_data_s = np.empty((stim_count, 0), dtype=np.float32) if stim_count > 0 else None
-            self.temp_data_di = np.empty((digital_count, 0), dtype=np.float32) if digital_count > 0 else None
-            
-            self.samples_per_100ms = int(self.sample_rate * 0.1)
-            self.ready_to_load = True
-            self._logger.info("Ready to load data")
+    def _prepare_to_load(self):
+        """加载线程里调用：时间戳文件开始增长后按最终的通道数分配缓冲区，然后开始加载
+        
+        Intan 先创建一个段的全部文件再开始写数据，时间戳增长时通道集合已经确定，不会每来一个文件重建一次
+        """
+        timestamp_files = self.file_processor.get_files_by_type('timestamp')
+        if os.path.getsize(timestamp_files[0].filename) == 0:
+            return
+        self._layout_pending = False
+        
+        # 按通道数初始化样本缓冲区，通道数没变时沿用已有的缓冲区
+        channel_counts = {}
+        for file_type in ['amp', 'stim', 'digital_in']:
+            channel_counts[file_type] = self.file_processor.get_file_count_by_type(file_type)
+        
+        if self.sample_buffer is None or self.sample_buffer.channel_counts != channel_counts:
+            try:
+                self._allocate_sample_buffer(channel_counts)
+            except MemoryBudgetError as e:
+                self._logger.error("Refusing to load data: {}", e)
+                return
+        
+        self.samples_per_100ms = int(self.sample_rate * 0.1)
+        self.ready_to_load = True
+        self._logger.info("Ready to load data")
             
+    def _allocate_sample_buffer(self, channel_counts):
+        """按通道数分配样本缓冲区，配置了磁盘历史层时一并创建"""
+        if self.sample_buffer is not None and self.sample_buffer.spill is not None:
+            self.sample_buffer.spill.close()
+        if isinstance(self.sample_buffer, SharedSampleRingBuffer):
+            # 只删除名字：其他线程可能还在读旧的一代，它们放手后映射才解除
+            self.sample_buffer.unlink()
+        
+        dtypes = {k: self.reader_factory.get_reader(k).dtype for k in channel_counts}
+        channel_names = {k: self.file_processor.get_channel_names(k) for k in channel_counts}
+        # 先配置处理阶段，派生数据流占用的内存从预算里扣掉
+        self.pipeline.configure(ChannelManifest(self.sample_rate, channel_counts, channel_names, dtypes))
+        capacity = self.buffer_budget.plan_capacity(self.sample_rate, channel_counts, dtypes,
+                                                    reserved_bytes=sum(self._stream_bytes().values()))
+        spill = None
+        if self.spill_directory:
+            spill = SpillStore(self.spill_directory, int(self.sample_rate * self.spill_history_seconds),
+                               self.sample_rate, channel_counts, dtypes)
+        if self.shared_memory_name:
+            self._shared_generation += 1
+            name = '{}_{}'.format(self.shared_memory_name, self._shared_generation)
+            self.sample_buffer = SharedSampleRingBuffer(name, capacity, self.sample_rate,
+                                                        channel_counts, dtypes, channel_names, spill=spill)
+        else:
+            self.sample_buffer = SampleRingBuffer(capacity, self.sample_rate, channel_counts, dtypes, spill=spill)
+        self._read_cursor = 0
+        self._read_epoch = 0
+        self._ready_start = 0
+        self._notify_streams()
+        
+    def add_stage(self, stage):
+        """
+        添加采集管线的处理阶段（ingest_pipeline.PipelineStage），
+        每次新数据写入缓冲区后在加载线程里按添加顺序执行。
+        """
+        self.pipeline.add_stage(stage)
+        
+    def remove_stage(self, stage):
+        """移除处理阶段"""
+        self.pipeline.remove_stage(stage)
+        
+    def get_stream(self, name):
+        """获取处理阶段输出的派生数据流（stream_ring.StreamRing），例如滤波后的 'spikes'，没有时返回 None"""
+        return self.pipeline.get_ring(name)
+        
+    def get_channel_stats(self):
+        """
+        逐通道的增量统计快照（channel_stats.ChannelStatsStage.snapshot），
+        需要先 add_stage(ChannelStatsStage())，否则返回 None
+        """
+        stage = self.pipeline.get_stage('channel_stats')
+        return stage.snapshot() if stage is not None else None
+        
+    def enable_history_spill(self, directory, history_seconds=1800):
+        """
+        开启磁盘历史层：内存环只保留构造时指定的 history_seconds，
+        更老的样本以 int16 memmap 的形式落到 directory，read_range / read_around 可以透明地查到。
+        需要在 set_monitoring_directory 之前调用。
+
+        Args:
+            directory: 本地 spill 目录
+            history_seconds: 磁盘层保存的秒数，例如 30 分钟为 1800
+        """
+        self.spill_directory = directory
+        self.spill_history_seconds = history_seconds
+        
+    def enable_shared_memory(self, name='brain_core_ring'):
+        """
+        把样本缓冲区发布到 multiprocessing.shared_memory，其他进程用
+        SharedSampleRingBuffer.attach(sample_buffer.name) 只读挂载，直接拿到零拷贝的 NumPy 视图，不必各自再读一遍文件。
+        需要在 set_monitoring_directory 之前调用。
+
+        每次分配缓冲区都发布成新的一代，名称为 name 加序号（例如 brain_core_ring_1）：
+        Windows 上只要还有句柄开着，同名的共享内存就不能重新创建。
+
+        Args:
+            name: 共享内存名称前缀
+        """
+        self.shared_memory_name = name
+        
+    def get_memory_usage(self):
+        """
+        获取样本缓冲区和派生数据流的实际内存占用
+
+        Returns:
+            dict: budget_bytes 预算、ring_bytes 原始缓冲区各信号类型占用、
+                  stream_bytes 处理阶段各派生数据流（StreamRing）占用、total_bytes 两者合计（与预算对应）、
+                  history_seconds 实际历史时长、requested_history_seconds 期望历史时长、
+                  spill_bytes 磁盘历史层占用（未开启为 0，不计入 total_bytes）
+        """
+        usage = {
+            'budget_bytes': self.buffer_budget.memory_budget_bytes,
+            'ring_bytes': {},
+            'stream_bytes': self._stream_bytes(),
+            'total_bytes': 0,
+            'history_seconds': 0.0,
+            'requested_history_seconds': self.buffer_budget.history_seconds,
+            'spill_bytes': 0
+        }
+        usage['total_bytes'] = sum(usage['stream_bytes'].values())
+        buffer = self.sample_buffer
+        if buffer is None:
+            return usage
+        
+        usage['ring_bytes'] = buffer.nbytes
+        usage['total_bytes'] += sum(usage['ring_bytes'].values())
+        usage['history_seconds'] = buffer.capacity / float(self.sample_rate)
+        if buffer.spill is not None:
+            usage['spill_bytes'] = sum(buffer.spill.nbytes.values())
+        return usage
+        
+    def _stream_bytes(self):
+        """处理阶段各派生数据流占用的字节数，名称 -> 字节"""
+        return {name: sum(ring.sample_buffer.nbytes.values()) for name, ring in self.pipeline.rings().items()}
+        
     def _read_sample_rate_from_info(self, file_info):
         """从info文件读取采样率"""
         try:
@@ -141,41 +333,90 @@ class RealTimeDataReader(QThread):
         """数据加载任务 - 使用新的组件"""
         while self.loading_running:
             try:
-                if not self.ready_to_load:
-                    time.sleep(0.01)
-                    continue
-                    
-                # 计算可读取的样本数
-                num_samples = self._calculate_available_samples()
-                
-                if num_samples >= self.min_samples_per_read:
-                    # 读取各类型数据
-                    t_start = time.perf_counter()  # 开始时间点
-                    
-                    new_data = self._read_all_data(num_samples)
-                    
-                    t_end = time.perf_counter()  # 结束时间点
-                    elapsed_ms = (t_end - t_start) * 1000  # 转换为毫秒
-                    self._logger.debug("all data read_delay {} ms", elapsed_ms) # 所有文件读取延迟计算
-                    
-                    # 处理数据块
-                    t_start = time.perf_counter()  # 开始时间点
-                    
-                    self._process_data_blocks(new_data)
-                    
-                    t_end = time.perf_counter()  # 结束时间点
-                    elapsed_ms = (t_end - t_start) * 1000  # 转换为毫秒
-                    self._logger.debug("all data postprocess_delay {} ms", elapsed_ms) # 所有文件读取延迟计算
-                    
-                    self.stored_samples += num_samples
-                    self._logger.debug("Loaded {} samples", num_samples)
-                else:
+                with self._file_lock:
+                    loaded = self._load_step()
+                if not loaded:
                     time.sleep(0.01)
                     
             except Exception as e:
                 self._logger.error("Error in data loading: {}", e)
                 time.sleep(0.01)
                 
+    def _load_step(self):
+        """加载线程的一步，持有 _file_lock 时调用
+        
+        Returns:
+            是否读到了数据，没有时加载线程稍等再试
+        """
+        if not self.ready_to_load:
+            if self._layout_pending:
+                self._prepare_to_load()
+            return False
+            
+        # 计算可读取的样本数
+        num_samples = self._calculate_available_samples()
+        
+        if num_samples >= self.min_samples_per_read:
+            self._load_samples(num_samples)
+        elif self._next_segment_ready():
+            # 下一段已经开始写入，说明当前段已经写完：读完尾巴后直接切换，缓冲区不清空
+            if num_samples > 0:
+                self._load_samples(num_samples)
+            self._rollover_segment()
+        else:
+            # 限速期间攒下的数据在空闲时补发
+            self._emit_data_ready()
+            return False
+        return True
+                
+    def _load_samples(self, num_samples):
+        """读取并处理 num_samples 个样本"""
+        # 读取各类型数据
+        t_start = time.perf_counter()  # 开始时间点
+        
+        new_data = self._read_all_data(num_samples)
+        
+        t_end = time.perf_counter()  # 结束时间点
+        elapsed_ms = (t_end - t_start) * 1000  # 转换为毫秒
+        self._logger.debug("all data read_delay {} ms", elapsed_ms) # 所有文件读取延迟计算
+        
+        # 处理数据块
+        t_start = time.perf_counter()  # 开始时间点
+        
+        self._process_data_blocks(new_data)
+        
+        t_end = time.perf_counter()  # 结束时间点
+        elapsed_ms = (t_end - t_start) * 1000  # 转换为毫秒
+        self._logger.debug("all data postprocess_delay {} ms", elapsed_ms) # 所有文件读取延迟计算
+        
+        self.stored_samples += num_samples
+        self._logger.debug("Loaded {} samples", num_samples)
+        
+    def _next_segment_ready(self):
+        """下一段的文件是否已经齐全并开始写入数据
+        
+        通道数必须与当前段一致，否则续接后的数据块形状会变化
+        """
+        if not self.file_processor.has_pending_segment():
+            return False
+        
+        for file_type in ['timestamp', 'amp', 'stim', 'digital_in']:
+            if (self.file_processor.get_pending_file_count_by_type(file_type) !=
+                    self.file_processor.get_file_count_by_type(file_type)):
+                return False
+        
+        timestamp_files = self.file_processor.get_pending_files_by_type('timestamp')
+        return os.path.getsize(timestamp_files[0].filename) > 0
+        
+    def _rollover_segment(self):
+        """切换到预打开的下一段，样本缓冲区保持不变"""
+        # mmap 状态按文件路径记录，旧段的映射在这里释放
+        self.reader_factory.reset_all()
+        directory = self.file_processor.promote_pending_segment()
+        self.stored_samples = 0
+        self._segment_start_pending = True
+        self._logger.info("Continuing sample stream in new segment: {}", directory)
+        
     def _calculate_available_samples(self):
         """计算可用的样本数
         没有安全检查，有点痛，只考虑时间戳的样本数，其他的加上延迟太大
@@ -199,84 +440,71 @@ class RealTimeDataReader(QThread):
         timestamp_files = self.file_processor.get_files_by_type('timestamp')
         if timestamp_files:
             reader = self.reader_factory.get_reader('timestamp')
-            result['t'] = reader.read(timestamp_files[0].file_descriptor, num_samples)
+            result['t'] = self._align_timestamps(reader.read_raw(timestamp_files[0].file_descriptor, num_samples))
             
-        # 读取各类型数据
+        # 读取各类型数据，保持文件里的原始类型，换算推迟到对外读取时
         for file_type in ['amp', 'stim', 'digital_in']:
             files = self.file_processor.get_files_by_type(file_type)
             if files:
                 reader = self.reader_factory.get_reader(file_type)
-                data_list = []
-                for file_info in files:
-                    data = reader.read(file_info.file_descriptor, num_samples)
-                    data_list.append(data)
-                    # 这里的 reset 其实没啥意思，怕外部调用，所以留着呢
-                    # reader.reset()  # 重置每个文件的读取位置
+                data_array = np.empty((len(files), num_samples), dtype=reader.dtype)
+                for i, file_info in enumerate(files):
+                    data_array[i] = reader.read_raw(file_info.file_descriptor, num_samples)
                     
-                result[file_type] = np.array(data_list)
+                result[file_type] = data_array
                 
         return result
         
-    def _process_data_blocks(self, new_data):
-        """处理数据块（简化版，保持原有逻辑）"""
-
-        # 添加到临时缓冲区
-        self.temp_data_t = np.concatenate((self.temp_data_t, new_data.get('t', [])))
-
-        if 'amp' in new_data:
-            self.temp_data_d = np.concatenate((self.temp_data_d, new_data['amp']), axis=1)
-
-        if 'stim' in new_data:
-            self.temp_data_s = np.concatenate((self.temp_data_s, new_data['stim']), axis=1)
-        
-        if 'digital_in' in new_data and self.temp_data_di is not None:
-            self.temp_data_di = np.concatenate((self.temp_data_di, new_data['digital_in']), axis=1)   
+    def _align_timestamps(self, t):
+        """保证跨段时间戳连续：新段的第一个时间戳如果没有接在上一段之后，就平移整段
         
-        # 生成100ms块（保持原有逻辑）
-        complete_blocks = self.temp_data_t.size // self.samples_per_100ms
-        
-        if complete_blocks > 0:
-            end_idx = complete_blocks * self.samples_per_100ms
-            
-            for start in range(0, end_idx, self.samples_per_100ms):
-                block_data = self._create_block_data(start, start + self.samples_per_100ms)
-                self.circular_buffer.write(block_data)
-                
-            # 更新剩余数据 是不是得成功后才需要更新？
-            if self.temp_data_t is not None:
-                self.temp_data_t = self.temp_data_t[end_idx:]
-            if self.temp_data_d is not None:
-                self.temp_data_d = self.temp_data_d[:, end_idx:]
-            if self.temp_data_s is not None:
-                self.temp_data_s = self.temp_data_s[:, end_idx:]
-            if self.temp_data_di is not None:
-                self.temp_data_di = self.temp_data_di[:, end_idx:]
-                
-    def _create_block_data(self, start, end):
-        """创建数据块（保持原有格式）"""
-        block_data = {
-            't': self.temp_data_t[start:end],
-            'd': {},
-            's': {},
-            'di': {}
-        }
+        时间戳按 Intan 样本计数处理，转为 int64，避免长时间记录后 int32 溢出
+        """
+        t = t.astype(np.int64)
+        if t.size == 0:
+            return t
+        
+        if self._segment_start_pending:
+            self._segment_start_pending = False
+            if self._last_timestamp is not None:
+                expected = self._last_timestamp + 1
+                # 正常情况下 Intan 的时间戳跨文件是连续的，偏移为0；只有回退时才平移
+                self._timestamp_offset = int(expected - t[0]) if t[0] < expected else 0
+                if self._timestamp_offset:
+                    self._logger.info("Timestamp restarted in new segment, offset {} samples", self._timestamp_offset)
+        
+        if self._timestamp_offset:
+            t += self._timestamp_offset
+        self._last_timestamp = t[-1]
+        return t
         
-        # 添加amp数据
-        if self.temp_data_d is not None:
-            for i in range(self.temp_data_d.shape[0]):
-                block_data['d']['d_{}'.format(i+1)] = self.temp_data_d[i, start:end]
-            
-        # 添加stim数据
-        if self.temp_data_s is not None:
-            for i in range(self.temp_data_s.shape[0]):
-                block_data['s']['s_{}'.format(i+1)] = self.temp_data_s[i, start:end]
-            
-        # 添加digital数据
-        if self.temp_data_di is not None:
-            for i in range(self.temp_data_di.shape[0]):
-                block_data['di']['di_{}'.format(i+1)] = self.temp_data_di[i, start:end]
-                
-        return block_data
+    def _process_data_blocks(self, new_data):
+        """把新读到的样本写入样本缓冲区，然后交给处理管线"""
+        signals = {k: v for k, v in new_data.items() if k != 't'}
+        start = self.sample_buffer.total_written
+        self.sample_buffer.write(new_data['t'], signals)
+        self._notify_streams(self.sample_buffer.total_written)
+        
+        if self.pipeline.stages and new_data['t'].size:
+            converters = {k: self.reader_factory.get_reader(k).convert for k in signals}
+            self.pipeline.process(IngestChunk(start, new_data['t'], signals, self.sample_rate, converters))
+        self._emit_data_ready()
+        
+    def _emit_data_ready(self):
+        """有未通知的新样本、且距上次发出超过限速间隔时发出 dataReady"""
+        buffer = self.sample_buffer
+        if buffer is None:
+            return
+        stop = buffer.total_written
+        if stop <= self._ready_start:
+            return
+        now = time.perf_counter()
+        if self.data_ready_max_rate_hz and now - self._last_ready_emit < 1.0 / self.data_ready_max_rate_hz:
+            return
+        start = max(self._ready_start, buffer.oldest_index)
+        self._ready_start = stop
+        self._last_ready_emit = now
+        self.dataReady.emit(DataWindow(self, start, stop, buffer.epoch))
         
     # 保留原有的其他方法...
     def start_data_loading_thread(self):
@@ -292,123 +520,50 @@ class RealTimeDataReader(QThread):
             self.data_loading_thread.join()
             self.data_loading_thread = None
             
-    def read_data(self, timespan_ms):
-        """
-        根据指定的时间跨度（毫秒）从环形缓冲区中读取拼接后的二维数组和时间戳。
-
-        参数:
-        - timespan_ms: 整数，表示时间跨度，以毫秒为单位，应为100ms的整数倍。
-
-        返回值:
-        - NumPy多维数组，形状为 (通道数, 样本数)，其中样本数为 timespan_ms 转换后的样本数。
-        - NumPy多维数组，形状为 (刺激通道数, 样本数)，表示对应的刺激数据。
-        - NumPy数组，长度与样本数一致，表示时间戳。
-        - NumPy多维数组，形状为 (数字通道数, 样本数)，表示数字输入数据，如果没有则返回None。
-        """
-        
+    def close(self):
+        """停止监控和加载，关闭文件，释放共享内存和磁盘历史层"""
+        self.file_monitor.stop()
+        self.stop_data_loading_thread()
+        self.ready_to_load = False
+        self.file_processor.reset()
+        self.reader_factory.reset_all()
+        if self.sample_buffer is not None:
+            if self.sample_buffer.spill is not None:
+                self.sample_buffer.spill.close()
+            if isinstance(self.sample_buffer, SharedSampleRingBuffer):
+                self.sample_buffer.close()
+            self.sample_buffer = None
+            
+    def _check_read_ready(self):
+        """read_data 之前的检查"""
         if not self.ready_to_load or not self.sample_rate:
             self._logger.warning("Data not ready for reading")
-            return None, None, None, None
-        
-        # self._logger.debug("Start read_data time: {}", time.time())
-        samples_needed = int(self.sample_rate * (timespan_ms / 1000.0))
-        blocks_needed = samples_needed // self.samples_per_100ms
-
-        # 获取各类型文件的数量（通道数）
-        amp_count = self.file_processor.get_file_count_by_type('amp')
-        stim_count = self.file_processor.get_file_count_by_type('stim')
-        digital_count = self.file_processor.get_file_count_by_type('digital_in')
+            return False
         
-        if amp_count == 0:
+        if self.file_processor.get_file_count_by_type('amp') == 0:
             self._logger.warning("No amp files available")
-            return None, None, None, None
-
-        # 初始化收集数据的容器
-        collected_t = np.empty(0, dtype=np.float32)
-        collected_d = np.empty((amp_count, 0), dtype=np.float32)
-        collected_s = np.empty((stim_count, 0), dtype=np.float32) if stim_count > 0 else None
-        collected_di = np.empty((digital_count, 0), dtype=np.float32) if digital_count > 0 else None
-
-        blocks_collected = 0
-
-        while blocks_collected < blocks_needed:
-            if self.circular_buffer.size > 0:  # 确保缓冲区内有数据
-                # 从环形缓冲区读取最新的数据块
-                channel_data_dict = self.circular_buffer.read_optimized()
-                
-                if not channel_data_dict:
-                    self._logger.debug("No data block available from buffer")
-                    break
-
-                # 提取并拼接时间戳和数据
-                collected_t = np.concatenate((collected_t, channel_data_dict['t']))
-                
-                # 拼接amp数据
-                if channel_data_dict['d']:
-                    new_data_d = np.array([channel_data_dict['d']['d_{}'.format(i + 1)] 
-                                        for i in range(amp_count)])
-                    collected_d = np.concatenate((collected_d, new_data_d), axis=1)
-                
-                # 拼接stim数据
-                if collected_s is not None and channel_data_dict['s']:
-                    new_data_s = np.array([channel_data_dict['s']['s_{}'.format(i + 1)] 
-                                        for i in range(stim_count)])
-                    collected_s = np.concatenate((collected_s, new_data_s), axis=1)
-                
-                # 拼接digital数据
-                if collected_di is not None and channel_data_dict['di']:
-                    new_data_di = np.array([channel_data_dict['di']['di_{}'.format(i + 1)] 
-                                        for i in range(digital_count)])
-                    collected_di = np.concatenate((collected_di, new_data_di), axis=1)
-                    
-                blocks_collected += 1
-            else:
-                self._logger.debug("No new data available in the buffer")
-                break
-
-        # self._logger.debug("End read_data time: {}", time.time())
-        
-        # 检查数据是否足够 TODO 数字输入的状态没检查哦
-        data_sufficient = (collected_t.size >= samples_needed and 
-                        collected_d.shape[1] >= samples_needed)
-        
-        if collected_s is not None:
-            data_sufficient = data_sufficient and collected_s.shape[1] >= samples_needed
-            
-        if collected_di is not None:
-            data_sufficient = data_sufficient and collected_di.shape[1] >= samples_needed
-        
-        if data_sufficient:
-            # 截取到精确的样本数
-            final_t = collected_t[:samples_needed]
-            final_d = collected_d[:, :samples_needed]
-            final_s = collected_s[:, :samples_needed] if collected_s is not None else None
-            final_di = collected_di[:, :samples_needed] if collected_di is not None else None
-            
-            self._logger.debug("Successfully read {} samples from {} blocks for {}ms timespan", 
-                            samples_needed, blocks_collected, timespan_ms)
-            
-            return final_d, final_s, final_t, final_di
-        else:
-            self._logger.debug("Insufficient data available: need {}, got t={}, d={}", 
-                            samples_needed, collected_t.size, collected_d.shape[1])
-            return None, None, None, None
+            return False
+        return True
         
         
 if __name__ == "__main__":
+    from PyQt5.QtCore import QCoreApplication
 
+    app = QCoreApplication([])
     directory_to_monitor1 = "F:\\Intan"  # 要监控的目录
     # directory_to_monitor2 = "E:/TCP/Data/2"  # 要监控的目录
     reader = RealTimeDataReader()
-    reader.set_monitoring_directory(directory_to_monitor1)
-    print("开始读取数据")
-    while True:
+    reader.data_ready_max_rate_hz = 2
+    
+    def on_data_ready(window):
+        """有新数据时由 dataReady 推送，不再定时轮询"""
         t_start = time.perf_counter()  # 开始时间点
-        once_data, sti_time, timestamp, digital = reader.read_data(100)    # 输入参数表示100ms
+        once_data, sti_time, timestamp, digital = window.read(last_ms=100)    # 只取最新的100ms
         t_end = time.perf_counter()  # 结束时间点
         elapsed_ms = (t_end - t_start) * 1000  # 转换为毫秒
         reader._logger.debug("extern data read_delay {} ms", elapsed_ms) # 所有文件读取延迟计算
-        time.sleep(0.5)
-    
     
-    
\ No newline at end of file
+    reader.dataReady.connect(on_data_ready)
+    reader.set_monitoring_directory(directory_to_monitor1)
+    print("开始读取数据")
+    app.exec_()
@@ -0,0 +1,133 @@
+import numpy as np
+
+from log_manager import LogManager
+from ingest_pipeline import PipelineStage
+from stream_ring import StreamRing
+
+
+class ArtifactTemplateStage(PipelineStage):
+    """
+    刺激伪迹模板相减：对每个 (刺激条件, 刺激通道) 维护所有记录通道的平均伪迹模板（(通道数, 窗口样本数)），
+    每个新脉冲开始后的 window_ms 内减去模板，不像置零那样丢掉整段信号，适合高频脉冲串。
+
+    刺激事件来自 StimArtifactStage（IngestChunk.events[stim_stage]，带条件序号），本阶段要排在它后面。
+    模板按脉冲开始前一个样本去基线，前 n_average 个脉冲取算术平均，之后按 1 / n_average 指数更新以跟上缓慢的漂移；
+    一个脉冲的窗口完整之后才更新模板，减的是脉冲开始时已有的模板，累计不到 min_pulses 个脉冲的条件不相减。
+    每个脉冲的相减和模板更新都是对所有通道的一次切片运算，窗口跨块时分段相减。
+    设置了 channel_mask 时只对可用的通道相减、更新模板，被排除的通道输出为 0，模板里这些通道保持原值。
+    """
+
+    name = 'artifact_template'
+
+    def __init__(self, source='amp', output='artifact_free', stim_stage='stim_artifact', window_ms=3.0, n_average=50,
+                 min_pulses=3, history_seconds=10):
+        """
+        Args:
+            source: 输入数据流（未置零的数据）
+            output: 输出数据流名称
+            stim_stage: 提供刺激事件的阶段名称
+            window_ms: 脉冲开始后相减的时长（毫秒）
+            n_average: 模板的有效平均脉冲数
+            min_pulses: 模板至少平均了这么多脉冲才开始相减
+            history_seconds: 输出保留的历史时长（秒）
+        """
+        self.source = source
+        self.output = output
+        self.stim_stage = stim_stage
+        self.window_ms = window_ms
+        self.n_average = n_average
+        self.min_pulses = min_pulses
+        self.history_seconds = history_seconds
+        self.templates = {}
+        self.rings = {}
+        self._window = 1
+        self._logger = LogManager.get_logger("ArtifactTemplateStage")
+        self.reset()
+
+    def configure(self, manifest):
+        """换算窗口长度，分配输出数据流"""
+        self._window = max(1, int(round(self.window_ms * manifest.sample_rate / 1000.0)))
+        names = manifest.channel_names.get(self.source) or \
+            [str(i) for i in range(manifest.channel_counts.get(self.source, 0))]
+        self.rings = {self.output: StreamRing(self.output, manifest.sample_rate, names, self.history_seconds)}
+        self.reset()
+
+    def template(self, condition, stim_channel):
+        """
+        取一个条件的当前模板
+
+        Returns:
+            (template, count)：template 为 (通道数, 窗口样本数) float32，没有时为 (None, 0)
+        """
+        return self.templates.get((int(condition), int(stim_channel)), (None, 0))
+
+    def process(self, chunk):
+        """登记新脉冲，减去窗口与这一块重叠部分的模板，窗口完整的脉冲更新模板"""
+        data = chunk.stream(self.source)
+        n = data.shape[1]
+        if self._history is None:
+            # 第一块之前没有数据，用第一个样本填充基线
+            self._history = np.repeat(data[:, :1], self._window + 1, axis=1)
+        pulses = chunk.events.get(self.stim_stage)
+        if pulses is not None:
+            for pulse in pulses:
+                key = (int(pulse['condition']), int(pulse['channel']))
+                template, count = self.templates.get(key, (None, 0))
+                self._active.append((int(pulse['index']), key, template if count >= self.min_pulses else None))
+        rows = self.active_channels(data.shape[0])
+        if not self._active:
+            self._history = np.concatenate((self._history, data), axis=1)[:, -(self._window + 1):]
+            if rows is not None:
+                clean = np.zeros_like(data)
+                clean[rows] = data[rows]
+                data = clean
+            chunk.streams[self.output] = data
+            self.rings[self.output].write(chunk.start, chunk.timestamps, data)
+            return
+
+        clean = data.copy() if rows is None else data[rows]
+        extended = np.concatenate((self._history, data), axis=1)
+        extended_start = chunk.start - self._history.shape[1]
+        work = extended if rows is None else extended[rows]
+        remaining = []
+        for onset, key, template in self._active:
+            first = max(onset, chunk.start)
+            last = min(onset + self._window, chunk.stop)
+            if template is not None and last > first:
+                subtract = template if rows is None else template[rows]
+                clean[:, first - chunk.start:last - chunk.start] -= subtract[:, first - onset:last - onset]
+            if onset + self._window <= chunk.stop:
+                begin = onset - extended_start
+                self._update(key, work[:, begin:begin + self._window] - work[:, begin - 1:begin], rows)
+            else:
+                remaining.append((onset, key, template))
+        self._active = remaining
+        self._history = extended[:, -(self._window + 1):]
+        if rows is not None:
+            part, clean = clean, np.zeros_like(data)
+            clean[rows] = part
+        chunk.streams[self.output] = clean
+        self.rings[self.output].write(chunk.start, chunk.timestamps, clean)
+
+    def _update(self, key, window, rows=None):
+        """把一个完整的去基线窗口并入模板（模板整体替换，已经登记的脉冲仍用旧模板）；rows 为 window 各行对应的通道"""
+        template, count = self.templates.get(key, (None, 0))
+        count += 1
+        if rows is None:
+            if template is None:
+                template = window.astype(np.float32)
+            else:
+                template = template + (window - template) / float(min(count, self.n_average))
+        else:
+            template = np.zeros((self._history.shape[0], self._window), dtype=np.float32) if template is None \
+                else template.copy()
+            template[rows] += (window - template[rows]) / float(min(count, self.n_average))
+        self.templates[key] = (template, count)
+
+    def reset(self):
+        """清空模板、跨块状态和输出"""
+        self.templates = {}
+        self._active = []
+        self._history = None
+        for ring in self.rings.values():
+            ring.clear()
@@ -0,0 +1,195 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import signal
+
+from log_manager import LogManager
+from ingest_pipeline import PipelineStage
+from stream_ring import StreamRing
+
+DEFAULT_BANDS = {'theta': (4.0, 8.0), 'beta': (13.0, 30.0), 'gamma': (30.0, 80.0)}
+
+
+class BandPowerStage(PipelineStage):
+    """
+    流式 Welch 频带功率：对 LFP（默认降采样后的 'lfp_1k'）或宽带数据按 1 / rate_hz 的步长切重叠的段，
+    所有通道、这一块里所有新段一起做一次 numpy.fft.rfft，窗函数和频带积分矩阵在配置时算好。
+    每段的频谱只算一次并保留最近 n_average 段，Welch 估计是这几段的平均，重叠部分不会重复计算。
+
+    每个新段产生一个特征向量：各通道各频带的功率（微伏²），写入输出数据流（默认 'band_power'，
+    采样率为 rate_hz，通道名为 '通道名:频带名'，按通道、再按频带排列）。最新的频谱和频带功率在 spectrum / band_power。
+    与降采样一样，输出的索引 k 和时间戳 k 指同一时刻：都取段的最后一个样本除以步长。
+
+    source 是处理阶段输出的数据流时从它的 StreamRing 按绝对索引增量读取（采样率可以与原始数据不同），
+    否则直接用 IngestChunk.stream(source)。设置了 channel_mask 时只对可用的通道做 FFT，被排除的通道功率为 0；
+    通道恢复后从它自己的新段重新开始平均。
+    """
+
+    name = 'band_power'
+
+    def __init__(self, source='lfp_1k', output='band_power', bands=None, window_seconds=1.0, rate_hz=4.0,
+                 n_average=4, window='hann', history_seconds=600):
+        """
+        Args:
+            source: 输入数据流
+            output: 输出数据流名称
+            bands: 频带名 -> (低, 高) Hz，None 时为 theta / beta / gamma
+            window_seconds: 每段时长（秒），决定频率分辨率
+            rate_hz: 输出特征的频率，段的步长为 采样率 / rate_hz
+            n_average: Welch 平均的段数
+            window: 窗函数名称（scipy.signal.get_window）
+            history_seconds: 输出保留的历史时长（秒）
+        """
+        self.source = source
+        self.output = output
+        self.bands = dict(bands or DEFAULT_BANDS)
+        self.window_seconds = window_seconds
+        self.rate_hz = rate_hz
+        self.n_average = max(1, int(n_average))
+        self.window = window
+        self.history_seconds = history_seconds
+        self.sample_rate = None
+        self.frequencies = None
+        self.spectrum = None
+        self.band_power = None
+        self.rings = {}
+        self._logger = LogManager.get_logger("BandPowerStage")
+        self.reset()
+
+    def configure(self, manifest):
+        """source 是原始信号时立即确定采样率，否则等第一块数据从数据流取"""
+        self.sample_rate = None
+        self.rings = {}
+        if self.source in manifest.channel_counts:
+            names = manifest.channel_names.get(self.source) or \
+                [str(i) for i in range(manifest.channel_counts[self.source])]
+            self._setup(manifest.sample_rate, names)
+        self.reset()
+
+    def _setup(self, sample_rate, channel_names):
+        """按采样率缓存窗函数、频带积分矩阵，分配输出数据流"""
+        self.sample_rate = sample_rate
+        self._nperseg = max(2, int(round(self.window_seconds * sample_rate)))
+        self._step = max(1, int(round(sample_rate / float(self.rate_hz))))
+        self._window = signal.get_window(self.window, self._nperseg).astype(np.float32)
+        self.frequencies = np.fft.rfftfreq(self._nperseg, 1.0 / sample_rate)
+        # 单边功率谱密度的系数：直流和奈奎斯特以外乘 2
+        scale = np.full(self.frequencies.size, 2.0 / (sample_rate * np.sum(self._window.astype(np.float64) ** 2)))
+        scale[0] /= 2.0
+        if self._nperseg % 2 == 0:
+            scale[-1] /= 2.0
+        self._scale = scale.astype(np.float32)
+        # (频点数, 频带数)：频带内的频点乘以频率分辨率，功率谱密度 @ 矩阵 = 频带功率
+        df = sample_rate / float(self._nperseg)
+        self._band_matrix = np.stack([((self.frequencies >= low) & (self.frequencies < high)) * df
+                                      for low, high in self.bands.values()], axis=1).astype(np.float32)
+        names = ['{}:{}'.format(channel, band) for channel in channel_names for band in self.bands]
+        self.rings = {self.output: StreamRing(self.output, sample_rate / float(self._step), names,
+                                              self.history_seconds)}
+        self._logger.info("Band power on '{}': {} samples per segment, step {}, bands {}",
+                          self.source, self._nperseg, self._step, list(self.bands))
+
+    def process(self, chunk):
+        """取新样本，计算所有完整的新段"""
+        fetched = self._fetch(chunk)
+        if fetched is None:
+            return
+        start, timestamps, data = fetched
+        if self._buffer is None or start != self._buffer_start + self._buffer.shape[1]:
+            # 第一次或者数据不连续：重新开始，第一段对齐到步长的整数倍
+            self._buffer, self._buffer_t, self._buffer_start = data, timestamps, start
+            self._next = -(-start // self._step) * self._step
+            self._recent = None
+        else:
+            self._buffer = np.concatenate((self._buffer, data), axis=1)
+            self._buffer_t = np.concatenate((self._buffer_t, timestamps))
+
+        available = self._buffer_start + self._buffer.shape[1] - self._nperseg - self._next
+        if available >= 0:
+            n_segments = available // self._step + 1
+            offset = self._next - self._buffer_start
+            segments = sliding_window_view(self._buffer, self._nperseg, axis=1)[
+                :, offset:offset + (n_segments - 1) * self._step + 1:self._step]
+            self._emit(segments, self._buffer_t[offset + self._nperseg - 1::self._step][:n_segments])
+            self._next += n_segments * self._step
+
+        keep = max(0, self._next - self._buffer_start)
+        if keep:
+            self._buffer = self._buffer[:, keep:]
+            self._buffer_t = self._buffer_t[keep:]
+            self._buffer_start += keep
+
+    def _fetch(self, chunk):
+        """(起始绝对索引, 时间戳, 数据)：从 source 的数据流增量读取，没有数据流时用这一块的数据"""
+        ring = chunk.ring(self.source)
+        if ring is None:
+            if self.sample_rate is None:
+                return None
+            return chunk.start, np.asarray(chunk.timestamps, dtype=np.int64), chunk.stream(self.source)
+
+        if self.sample_rate is None:
+            self._setup(ring.sample_rate, ring.channel_names)
+        buffer = ring.sample_buffer
+        stop = buffer.total_written
+        if self._cursor is None or self._cursor < buffer.oldest_index:
+            self._cursor = max(buffer.oldest_index, stop - self._nperseg)
+        if stop <= self._cursor:
+            return None
+        window = buffer.read_samples(self._cursor, stop)
+        if window is None:
+            self._cursor = None
+            return None
+        start, self._cursor = self._cursor, stop
+        return start, np.asarray(window['t'], dtype=np.int64), window['data']
+
+    def _emit(self, segments, end_timestamps):
+        """一次 rfft 算所有新段的频谱，与最近的段一起做 Welch 平均，输出频带功率"""
+        n_channels = segments.shape[0]
+        rows = self.active_channels(n_channels)
+        if rows is None:
+            rows = slice(None)
+        else:
+            segments = segments[rows]
+        if self._recent is None:
+            self._counts = np.zeros(n_channels, dtype=np.int64)
+        segments = segments - segments.mean(axis=2, keepdims=True)
+        spectra = np.abs(np.fft.rfft(segments * self._window, axis=2)) ** 2 * self._scale
+        n_new = spectra.shape[1]
+        history = spectra if self._recent is None else np.concatenate((self._recent[rows], spectra), axis=1)
+        n_old = history.shape[1] - n_new
+        # 第 k 个新段的估计为它和之前最多 n_average - 1 段的平均，用累加和一次算出
+        total = np.concatenate((np.zeros_like(history[:, :1]), np.cumsum(history, axis=1, dtype=np.float64)), axis=1)
+        # 每个通道只往前取它自己算过的段，被排除期间填的 0 不参与平均
+        stop = np.arange(n_old + 1, n_old + n_new + 1)
+        first = np.maximum(stop[None, :] - self.n_average, (n_old - self._counts[rows])[:, None])
+        psd = ((total[:, stop] - np.take_along_axis(total, first[:, :, None], axis=1))
+               / (stop[None, :] - first)[:, :, None]).astype(np.float32)
+        if self.n_average > 1:
+            recent = history[:, -(self.n_average - 1):]
+            self._recent = np.zeros((n_channels,) + recent.shape[1:], dtype=recent.dtype)
+            self._recent[rows] = recent
+            counts = np.zeros(n_channels, dtype=np.int64)
+            counts[rows] = np.minimum(self._counts[rows] + n_new, self.n_average - 1)
+            self._counts = counts
+
+        features = np.zeros((n_channels, n_new, len(self.bands)), dtype=np.float32)
+        features[rows] = psd @ self._band_matrix     # (通道数, 段数, 频带数)
+        self.spectrum = np.zeros((n_channels, psd.shape[2]), dtype=np.float32)
+        self.spectrum[rows] = psd[:, -1]
+        self.band_power = features[:, -1]
+        output = features.transpose(0, 2, 1).reshape(-1, n_new)
+        end = self._next + self._nperseg - 1
+        self.rings[self.output].write(end // self._step, end_timestamps // self._step, output)
+
+    def reset(self):
+        """清空缓存的样本、频谱和输出"""
+        self._buffer = None
+        self._buffer_t = None
+        self._buffer_start = 0
+        self._next = 0
+        self._recent = None
+        self._counts = None
+        self._cursor = None
+        self.spectrum = None
+        self.band_power = None
+        for ring in self.rings.values():
+            ring.clear()
@@ -0,0 +1,85 @@
+import numpy as np
+from log_manager import LogManager
+
+
+class MemoryBudgetError(Exception):
+    """内存预算装不下要求的历史长度"""
+    pass
+
+
+class BufferBudget(object):
+    """
+    根据内存预算和期望的历史时长计算样本缓冲区的容量。
+
+    每个样本帧的字节数 = 时间戳（int64）+ 各信号类型 通道数 × 原始数据类型字节数，
+    容量 = 期望历史时长 × 采样率，超出预算时按 policy 处理：
+    'degrade' 缩短历史时长到预算能装下的长度，'strict' 直接拒绝。
+
+    预算是原始缓冲区和处理阶段派生数据流（StreamRing）合计的内存：派生数据流的历史时长由各阶段自己决定，
+    它们占用的字节数作为 reserved_bytes 先从预算里扣掉，剩下的才给原始缓冲区。磁盘历史层不算在内。
+    """
+
+    def __init__(self, memory_budget_bytes=None, history_seconds=100, policy='degrade', min_history_seconds=1.0):
+        """
+        Args:
+            memory_budget_bytes: 原始缓冲区加派生数据流可用的内存上限（字节），None 表示不限制
+            history_seconds: 期望保留的历史时长（秒）
+            policy: 'degrade' 或 'strict'
+            min_history_seconds: degrade 时至少要保留的时长，低于它同样拒绝
+        """
+        if policy not in ('degrade', 'strict'):
+            raise ValueError("Unknown budget policy: {}".format(policy))
+        self.memory_budget_bytes = memory_budget_bytes
+        self.history_seconds = history_seconds
+        self.policy = policy
+        self.min_history_seconds = min_history_seconds
+        self._logger = LogManager.get_logger("BufferBudget")
+
+    @staticmethod
+    def bytes_per_second(sample_rate, channel_counts, dtypes):
+        """
+        每秒数据占用的字节数，按信号类型分开
+
+        Returns:
+            dict: 信号类型 -> 字节/秒，'t' 为时间戳
+        """
+        usage = {'t': sample_rate * np.dtype(np.int64).itemsize}
+        for signal_type, count in channel_counts.items():
+            usage[signal_type] = sample_rate * count * np.dtype(dtypes[signal_type]).itemsize
+        return usage
+
+    def plan_capacity(self, sample_rate, channel_counts, dtypes, reserved_bytes=0):
+        """
+        计算缓冲区容量（样本数）
+
+        Args:
+            sample_rate: 采样率
+            channel_counts: 信号类型 -> 通道数（来自文件清单）
+            dtypes: 信号类型 -> 原始数据类型
+            reserved_bytes: 预算里已经被派生数据流占用的字节数
+
+        Returns:
+            容量（样本数）
+
+        Raises:
+            MemoryBudgetError: 预算装不下（strict）或连最短历史都装不下（degrade）
+        """
+        requested = int(sample_rate * self.history_seconds)
+        if self.memory_budget_bytes is None:
+            return requested
+
+        rates = self.bytes_per_second(sample_rate, channel_counts, dtypes)
+        frame_bytes = sum(rates.values()) / float(sample_rate)
+        affordable = int(max(self.memory_budget_bytes - reserved_bytes, 0) // frame_bytes)
+        if affordable >= requested:
+            return requested
+
+        affordable_seconds = affordable / float(sample_rate)
+        message = "Budget {:.1f} MB ({:.1f} MB used by derived streams) holds {:.1f} s of {} channels, " \
+                  "{} s requested".format(self.memory_budget_bytes / 1e6, reserved_bytes / 1e6, affordable_seconds,
+                                          sum(channel_counts.values()), self.history_seconds)
+        if self.policy == 'strict' or affordable_seconds < self.min_history_seconds:
+            raise MemoryBudgetError(message)
+
+        self._logger.warning("{}, degrading history", message)
+        return affordable
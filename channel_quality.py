@@ -0,0 +1,118 @@
+import numpy as np
+
+from log_manager import LogManager
+from ingest_pipeline import PipelineStage
+
+# 坏通道原因的标志位
+FLAG_FLAT = 1
+FLAG_SATURATED = 2
+FLAG_NOISY = 4
+
+
+class ChannelQualityStage(PipelineStage):
+    """
+    通道质量判断：根据 ChannelStatsStage 的增量统计标记平直、饱和、噪声异常的通道，
+    并把可用通道的掩码（True 为可用）写到下游逐通道处理的阶段的 channel_mask 上（滤波、降采样、伪迹处理、参考、
+    尖峰检测、包络、频带功率、协方差、数据流服务）。这些阶段只取出可用通道的行来计算，坏通道不做任何处理、输出为 0，
+    也不再默认推送。原始数据照常写入缓冲区，不受影响。
+
+    需要排在 ChannelStatsStage 之后、使用掩码的阶段之前。ChannelStatsStage 本身不加掩码：
+    被排除的通道仍要统计，才能判断它什么时候恢复。通道被标记后至少保持 recover_seconds，
+    在健康状态持续这么久之后才恢复，避免在阈值附近来回切换。
+    """
+
+    name = 'channel_quality'
+
+    def __init__(self, stats='channel_stats', time_constant=1.0, max_saturation_fraction=0.01, noise_factor=5.0,
+                 max_noise_uv=None, recover_seconds=5.0,
+                 targets=('filter_bank', 'decimator', 'stim_artifact', 'artifact_template', 'reference',
+                          'spike_detection', 'mua_envelope', 'band_power', 'covariance', 'stream_server')):
+        """
+        Args:
+            stats: 统计阶段的名称
+            time_constant: 使用统计里最接近这个时间常数（秒）的一组指数加权统计
+            max_saturation_fraction: 饱和样本比例超过它判为饱和
+            noise_factor: 标准差超过所有正常通道中位数的这个倍数判为噪声异常
+            max_noise_uv: 标准差的绝对上限（微伏），None 表示不限
+            recover_seconds: 被标记的通道恢复正常后还要保持的时长
+            targets: 自动设置 channel_mask 的阶段名称，空表示只标记不应用
+        """
+        self.stats = stats
+        self.time_constant = time_constant
+        self.max_saturation_fraction = max_saturation_fraction
+        self.noise_factor = noise_factor
+        self.max_noise_uv = max_noise_uv
+        self.recover_seconds = recover_seconds
+        self.targets = tuple(targets)
+        self.channel_names = []
+        self.flags = None
+        self.mask = None
+        self._bad_until = None
+        self._recover = 0
+        self._logger = LogManager.get_logger("ChannelQualityStage")
+
+    def configure(self, manifest):
+        self.channel_names = list(manifest.channel_names.get('amp', []))
+        self._recover = int(self.recover_seconds * manifest.sample_rate)
+        self.reset()
+
+    @property
+    def bad_channels(self):
+        """当前被排除的通道名"""
+        if self.mask is None:
+            return []
+        return [self.channel_names[i] if i < len(self.channel_names) else str(i) for i in np.flatnonzero(~self.mask)]
+
+    def process(self, chunk):
+        """按最新统计重新判断，掩码变化时应用到下游阶段"""
+        if chunk.pipeline is None:
+            return
+        stage = chunk.pipeline.get_stage(self.stats)
+        snapshot = stage.snapshot() if stage is not None else None
+        if snapshot is None:
+            return
+
+        flags = self.evaluate(snapshot)
+        if self._bad_until is None:
+            self._bad_until = np.zeros(flags.size, dtype=np.int64)
+        self._bad_until[flags != 0] = chunk.stop + self._recover
+        self.flags = flags
+        mask = self._bad_until <= chunk.stop
+        if self.mask is None or not np.array_equal(mask, self.mask):
+            self.mask = mask
+            self._logger.info("Channel mask changed: {} of {} channels excluded {}",
+                              int(np.count_nonzero(~mask)), mask.size, self.bad_channels)
+            self.apply(chunk.pipeline)
+
+    def evaluate(self, snapshot):
+        """
+        按一份统计快照判断每个通道的问题
+
+        Returns:
+            每个通道的标志位（FLAG_FLAT | FLAG_SATURATED | FLAG_NOISY），0 表示正常
+        """
+        row = int(np.argmin(np.abs(np.asarray(snapshot['time_constants']) - self.time_constant)))
+        std = snapshot['std'][row]
+        flags = np.zeros(std.size, dtype=np.uint8)
+        flags[snapshot['flatline']] |= FLAG_FLAT
+        flags[snapshot['saturation_fraction'][row] > self.max_saturation_fraction] |= FLAG_SATURATED
+
+        normal = flags == 0
+        if np.any(normal):
+            limit = self.noise_factor * np.median(std[normal])
+            if self.max_noise_uv is not None:
+                limit = min(limit, self.max_noise_uv)
+            flags[std > limit] |= FLAG_NOISY
+        return flags
+
+    def apply(self, pipeline):
+        """把当前掩码设置到 targets 里的阶段"""
+        for name in self.targets:
+            stage = pipeline.get_stage(name)
+            if stage is not None:
+                stage.channel_mask = None if self.mask is None else self.mask.copy()
+
+    def reset(self):
+        self.flags = None
+        self.mask = None
+        self._bad_until = None
@@ -0,0 +1,141 @@
+import numpy as np
+
+from log_manager import LogManager
+from ingest_pipeline import PipelineStage
+
+
+class ChannelStatsStage(PipelineStage):
+    """
+    增量的逐通道统计，给通道健康面板用，每块数据对所有通道向量化更新一次。
+
+    - 全程：Welford / Chan 合并的样本数、均值、方差，饱和样本计数，峰值
+    - 每个时间常数（默认 1 s、10 s、60 s）：指数加权的均值、方差、RMS、峰值保持和饱和比例，
+      按块合并：权重 w = exp(-块长 / τ)，均值和方差用加权 Welford 公式合并，不需要逐样本循环
+    - 平直检测：原始数据连续不变的样本数（跨块延续），超过 flatline_ms 判为平直
+
+    snapshot() 返回最近一次更新后的统计（写线程每块整体替换，读的一方拿到的是一致的一份）。
+    """
+
+    name = 'channel_stats'
+
+    def __init__(self, source='amp', time_constants=(1.0, 10.0, 60.0), saturation_level=32767, flatline_ms=50.0):
+        """
+        Args:
+            source: 统计的信号类型，饱和和平直按原始数据判断，均值方差按换算后的物理量
+            time_constants: 指数加权的时间常数（秒）
+            saturation_level: 原始数据绝对值达到它即算饱和（int16 满量程）
+            flatline_ms: 连续不变超过这个时长判为平直
+        """
+        self.source = source
+        self.time_constants = np.asarray(time_constants, dtype=np.float64)
+        self.saturation_level = saturation_level
+        self.flatline_ms = flatline_ms
+        self.channel_names = []
+        self._sample_rate = 30000.0
+        self._flat_samples = 1
+        self._state = None
+        self._logger = LogManager.get_logger("ChannelStatsStage")
+
+    def configure(self, manifest):
+        self.channel_names = list(manifest.channel_names.get(self.source, []))
+        self._sample_rate = float(manifest.sample_rate)
+        self._flat_samples = max(1, int(self.flatline_ms * manifest.sample_rate / 1000.0))
+        self.reset()
+
+    def process(self, chunk):
+        raw = chunk.signals.get(self.source)
+        if raw is None or raw.shape[1] == 0:
+            return
+        data = chunk.stream(self.source)
+        n = data.shape[1]
+        previous = self._state
+
+        chunk_mean = data.mean(axis=1, dtype=np.float64)
+        chunk_var = data.var(axis=1, dtype=np.float64)
+        chunk_square = chunk_var + chunk_mean ** 2
+        chunk_peak = np.abs(data).max(axis=1)
+        saturated = np.count_nonzero(np.abs(raw.astype(np.int32)) >= self.saturation_level, axis=1)
+        flat_run = self._flat_run(raw, previous)
+
+        state = {'samples': n, 'last_index': chunk.stop}
+        if previous is None:
+            state['mean_all'] = chunk_mean
+            state['m2_all'] = chunk_var * n
+            state['peak_all'] = chunk_peak
+            state['saturation_count'] = saturated
+            state['mean'] = np.tile(chunk_mean, (self.time_constants.size, 1))
+            state['var'] = np.tile(chunk_var, (self.time_constants.size, 1))
+            state['square'] = np.tile(chunk_square, (self.time_constants.size, 1))
+            state['peak'] = np.tile(chunk_peak, (self.time_constants.size, 1))
+            state['saturation_fraction'] = np.tile(saturated / float(n), (self.time_constants.size, 1))
+        else:
+            # 全程：Chan 的并行 Welford 合并
+            total = previous['samples'] + n
+            delta = chunk_mean - previous['mean_all']
+            state['samples'] = total
+            state['mean_all'] = previous['mean_all'] + delta * (n / float(total))
+            state['m2_all'] = previous['m2_all'] + chunk_var * n + delta ** 2 * (previous['samples'] * n / float(total))
+            state['peak_all'] = np.maximum(previous['peak_all'], chunk_peak)
+            state['saturation_count'] = previous['saturation_count'] + saturated
+
+            # 指数加权：旧统计的权重 w，这一块的权重 1 - w
+            w = np.exp(-n / (chunk.sample_rate * self.time_constants))[:, None]
+            delta = chunk_mean - previous['mean']
+            state['mean'] = previous['mean'] + (1 - w) * delta
+            state['var'] = w * previous['var'] + (1 - w) * chunk_var + w * (1 - w) * delta ** 2
+            state['square'] = w * previous['square'] + (1 - w) * chunk_square
+            state['peak'] = np.maximum(previous['peak'] * w, chunk_peak)
+            state['saturation_fraction'] = (w * previous['saturation_fraction']
+                                            + (1 - w) * (saturated / float(n)))
+        state['flat_run'] = flat_run
+        state['last_sample'] = raw[:, -1].copy()
+        self._state = state
+
+    def _flat_run(self, raw, previous):
+        """每个通道末尾连续不变的样本数，与上一块衔接"""
+        n = raw.shape[1]
+        changed = raw[:, 1:] != raw[:, :-1]
+        any_change = changed.any(axis=1)
+        run = np.full(raw.shape[0], n, dtype=np.int64)
+        if n > 1:
+            # 最后一次变化之后的样本数
+            last_change = n - 1 - np.argmax(changed[:, ::-1], axis=1)
+            run = np.where(any_change, n - last_change, n)
+        if previous is not None:
+            continues = ~any_change & (raw[:, 0] == previous['last_sample'])
+            run = np.where(continues, previous['flat_run'] + n, run)
+        return run
+
+    def snapshot(self):
+        """
+        当前统计，开销只是几个 (时间常数数, 通道数) 的小数组
+
+        Returns:
+            dict：channel_names、time_constants、samples；
+                  mean / std / rms / peak / saturation_fraction 为 (时间常数数, 通道数)；
+                  mean_all / std_all / peak_all / saturation_count 为全程统计；
+                  flat_ms 为末尾连续不变的时长，flatline 为是否平直；还没有数据时返回 None
+        """
+        state = self._state
+        if state is None:
+            return None
+        return {
+            'channel_names': self.channel_names,
+            'time_constants': self.time_constants,
+            'samples': state['samples'],
+            'last_index': state['last_index'],
+            'mean': state['mean'],
+            'std': np.sqrt(state['var']),
+            'rms': np.sqrt(state['square']),
+            'peak': state['peak'],
+            'saturation_fraction': state['saturation_fraction'],
+            'mean_all': state['mean_all'],
+            'std_all': np.sqrt(state['m2_all'] / max(state['samples'] - 1, 1)),
+            'peak_all': state['peak_all'],
+            'saturation_count': state['saturation_count'],
+            'flat_ms': state['flat_run'] * 1000.0 / self._sample_rate,
+            'flatline': state['flat_run'] >= self._flat_samples
+        }
+
+    def reset(self):
+        self._state = None
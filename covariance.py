@@ -0,0 +1,170 @@
+import numpy as np
+
+from log_manager import LogManager
+from ingest_pipeline import PipelineStage
+
+
+class CovarianceStage(PipelineStage):
+    """
+    增量的通道间协方差 / 相关矩阵，供连接性监测使用，每块数据只做一次 (通道数 × 样本数) @ (样本数 × 通道数) 的矩阵乘法。
+
+    - mode='exponential'：指数遗忘，每块把旧的二阶矩乘以 w = exp(-块长 / τ) 再加上这一块的 X Xᵀ
+    - mode='window'：精确的滑动窗口（window_seconds），加上新样本的 X Xᵀ、减去移出窗口的样本的 X Xᵀ；
+      移出的样本从本阶段自己的环形缓冲区 (通道数, 窗口样本数) 读取，窗口长、通道多时注意内存。
+      每 recompute_seconds 从缓冲区整体重算一次，消除累计的舍入误差
+
+    累加前减去第一块的通道均值作为固定偏移，避免直流偏置大时 E[xxᵀ] - E[x]E[x]ᵀ 的抵消误差；
+    二阶矩用 float64 累加。covariance() / correlation() 随时可以调用，读到的总是某一块之后一致的状态。
+
+    设置了 channel_mask 时只累加可用通道之间的子矩阵，被排除的通道所在行列为 0；掩码变化时从头重新累加。
+    """
+
+    name = 'covariance'
+
+    def __init__(self, source='lfp', mode='exponential', time_constant=10.0, window_seconds=2.0,
+                 recompute_seconds=60.0):
+        """
+        Args:
+            source: 输入数据流（全采样率）
+            mode: 'exponential' 或 'window'
+            time_constant: 指数遗忘的时间常数（秒）
+            window_seconds: 滑动窗口时长（秒）
+            recompute_seconds: 滑动窗口模式下整体重算的间隔（秒）
+        """
+        if mode not in ('exponential', 'window'):
+            raise ValueError("Unknown covariance mode: {}".format(mode))
+        self.source = source
+        self.mode = mode
+        self.time_constant = time_constant
+        self.window_seconds = window_seconds
+        self.recompute_seconds = recompute_seconds
+        self.channel_names = []
+        self._window = 1
+        self._recompute = 1
+        self._logger = LogManager.get_logger("CovarianceStage")
+        self.reset()
+
+    def configure(self, manifest):
+        """换算窗口长度"""
+        fs = manifest.sample_rate
+        self.channel_names = manifest.channel_names.get('amp') or \
+            [str(i) for i in range(manifest.channel_counts.get('amp', 0))]
+        self._window = max(2, int(round(self.window_seconds * fs)))
+        self._recompute = max(1, int(round(self.recompute_seconds * fs)))
+        self.reset()
+
+    def process(self, chunk):
+        """用这一块更新二阶矩"""
+        data = chunk.stream(self.source)
+        n = data.shape[1]
+        if n == 0:
+            return
+        rows = self.active_channels(data.shape[0])
+        if rows is None:
+            rows = np.arange(data.shape[0])
+        if self._rows is None or not np.array_equal(rows, self._rows):
+            if self._rows is not None:
+                self._logger.info("Channel mask changed, restarting covariance over {} channels", rows.size)
+            self.reset()
+            self._rows = rows
+            self._channels = data.shape[0]
+        if rows.size < data.shape[0]:
+            data = data[rows]
+        if self._shift is None:
+            self._shift = data.mean(axis=1, keepdims=True, dtype=np.float64).astype(np.float32)
+        x = data - self._shift
+        if self.mode == 'exponential':
+            self._update_exponential(x, chunk.sample_rate)
+        else:
+            self._update_window(x, chunk.start)
+        # 读的一方一次拿到状态和对应的通道
+        self._published = (self._state, self._rows, self._channels)
+
+    def _update_exponential(self, x, sample_rate):
+        n = x.shape[1]
+        x = x.astype(np.float64)
+        product = x @ x.T
+        total = x.sum(axis=1)
+        if self._state is None:
+            self._state = (product, total, float(n))
+            return
+        moment, sums, weight = self._state
+        w = np.exp(-n / (sample_rate * self.time_constant))
+        self._state = (w * moment + product, w * sums + total, w * weight + n)
+
+    def _update_window(self, x, start):
+        length = self._window
+        if self._buffer is None:
+            self._buffer = np.zeros((x.shape[0], length), dtype=np.float32)
+            self._buffer_start = start
+        n = x.shape[1]
+        stop = start + n
+        # 一块比窗口还长时只看最后一个窗口
+        if n >= length:
+            x, start, n = x[:, n - length:], stop - length, length
+        positions = np.arange(start, stop) % length
+        outgoing_start = max(start - length, self._buffer_start)
+        outgoing = self._buffer[:, np.arange(outgoing_start, stop - length) % length].astype(np.float64) \
+            if stop - length > outgoing_start else None
+        # 缓冲区存 float32，加入和移出时用同样的值转成 float64 计算，两边的乘积才能精确抵消
+        self._buffer[:, positions] = x
+        x = x.astype(np.float64)
+
+        if self._state is None or stop - self._last_recompute >= self._recompute or n == length:
+            first = max(self._buffer_start, stop - length)
+            window = self._buffer[:, np.arange(first, stop) % length].astype(np.float64)
+            self._state = (window @ window.T, window.sum(axis=1),
+                           float(stop - first))
+            self._last_recompute = stop
+            return
+        moment, sums, weight = self._state
+        moment = moment + x @ x.T
+        sums = sums + x.sum(axis=1)
+        weight += n
+        if outgoing is not None:
+            moment = moment - outgoing @ outgoing.T
+            sums = sums - outgoing.sum(axis=1)
+            weight -= outgoing.shape[1]
+        self._state = (moment, sums, weight)
+
+    @property
+    def samples(self):
+        """当前估计的有效样本数（指数遗忘时为权重和）"""
+        state = self._published[0]
+        return 0.0 if state is None else state[2]
+
+    def covariance(self):
+        """(通道数, 通道数) 的协方差矩阵（float64），还没有数据时返回 None"""
+        state, rows, channels = self._published
+        if state is None:
+            return None
+        moment, sums, weight = state
+        mean = sums / weight
+        cov = moment / weight - np.outer(mean, mean)
+        if rows.size == channels:
+            return cov
+        full = np.zeros((channels, channels))
+        full[np.ix_(rows, rows)] = cov
+        return full
+
+    def correlation(self):
+        """(通道数, 通道数) 的相关系数矩阵，方差为 0 的通道（平直、被掩蔽）所在行列为 0"""
+        cov = self.covariance()
+        if cov is None:
+            return None
+        std = np.sqrt(np.clip(np.diag(cov), 0, None))
+        denominator = np.outer(std, std)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            corr = np.where(denominator > 0, cov / denominator, 0.0)
+        return np.clip(corr, -1.0, 1.0)
+
+    def reset(self):
+        """清空累计的矩和缓冲区"""
+        self._state = None
+        self._shift = None
+        self._buffer = None
+        self._buffer_start = 0
+        self._last_recompute = 0
+        self._rows = None
+        self._channels = 0
+        self._published = (None, None, 0)
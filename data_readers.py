@@ -18,11 +18,37 @@ class DataReader(ABC):
         # 使用统一的日志管理器
         self._logger = LogManager.get_logger("RealTimeDataReader")
         
+    # 子类指定：日志名、文件中的原始数据类型及每个样本的字节数
+    name = None
+    dtype = None
+    bytes_per_sample = None
+    
     @abstractmethod
-    def read(self, file_descriptor, num_samples):
-        """读取数据的抽象方法"""
+    def convert(self, data):
+        """把原始数据转换为物理量的抽象方法"""
         pass
     
+    def read(self, file_descriptor, num_samples):
+        """读取数据并转换为物理量"""
+        return self.convert(self.read_raw(file_descriptor, num_samples))
+    
+    def read_raw(self, file_descriptor, num_samples):
+        """读取文件中的原始数据，不做换算"""
+        if self.use_mmap == True:
+            t_start = time.perf_counter()  # 开始时间点
+            data = self._read_from_mmap(file_descriptor, num_samples, self.dtype, self.bytes_per_sample)
+            t_end = time.perf_counter()  # 结束时间点
+            elapsed_ms = (t_end - t_start) * 1000  # 转换为毫秒
+            self._logger.debug("mmap {} read_delay {} ms", self.name, elapsed_ms)
+        else:
+            t_start = time.perf_counter()  # 开始时间点
+            data = np.fromfile(file_descriptor, dtype=self.dtype, count=num_samples)
+            t_end = time.perf_counter()  # 结束时间点
+            elapsed_ms = (t_end - t_start) * 1000  # 转换为毫秒
+            self._logger.debug("fromfile {} read_delay {} ms", self.name, elapsed_ms)
+        self.stored_samples += len(data)
+        return data
+    
     def _read_from_mmap(self, file_descriptor, num_samples, dtype, bytes_per_sample):
         """从mmap读取增量数据"""
         file_path = file_descriptor.name
@@ -110,72 +136,44 @@ class DataReader(ABC):
 class TimestampReader(DataReader):
     """时间戳数据读取器"""
     
-    def read(self, file_descriptor, num_samples):
-        """读取时间戳数据"""
-        if self.use_mmap == True:
-            t_start = time.perf_counter()  # 开始时间点
-            data = self._read_from_mmap(file_descriptor, num_samples, np.int32, 4)
-            t_end = time.perf_counter()  # 结束时间点
-            elapsed_ms = (t_end - t_start) * 1000  # 转换为毫秒
-            self._logger.debug("mmap Timestamp read_delay {} ms", elapsed_ms)
-        else:
-            t_start = time.perf_counter()  # 开始时间点
-            data = np.fromfile(file_descriptor, dtype=np.int32, count=num_samples)
-            t_end = time.perf_counter()  # 结束时间点
-            elapsed_ms = (t_end - t_start) * 1000  # 转换为毫秒
-            self._logger.debug("fromfile Timestamp read_delay {} ms", elapsed_ms)
-        self.stored_samples += len(data)
+    name = 'Timestamp'
+    dtype = np.int32
+    bytes_per_sample = 4
+    
+    def convert(self, data):
+        """样本计数转换为秒"""
         return data / float(self.sample_rate)
 
 class AmpDataReader(DataReader):
     """放大器数据读取器"""
     
+    name = 'Amp'
+    dtype = np.int16
+    bytes_per_sample = 2
+    
     def __init__(self, sample_rate=30000, scale_factor=0.195):
         super(AmpDataReader, self).__init__(sample_rate)
         self.scale_factor = scale_factor
         
-    def read(self, file_descriptor, num_samples):
-        """读取放大器数据"""
-        if self.use_mmap == True:
-            t_start = time.perf_counter()  # 开始时间点
-            data = self._read_from_mmap(file_descriptor, num_samples, np.int16, 2)
-            t_end = time.perf_counter()  # 结束时间点
-            elapsed_ms = (t_end - t_start) * 1000  # 转换为毫秒
-            self._logger.debug("mmap Amp read_delay {} ms", elapsed_ms)
-        else:
-            t_start = time.perf_counter()  # 开始时间点
-            data = np.fromfile(file_descriptor, dtype=np.int16, count=num_samples)
-            t_end = time.perf_counter()  # 结束时间点
-            elapsed_ms = (t_end - t_start) * 1000  # 转换为毫秒
-            self._logger.debug("fromfile Amp read_delay {} ms", elapsed_ms)
-        self.stored_samples += len(data)
+    def convert(self, data):
+        """转换为微伏"""
         return data * self.scale_factor
 
 class StimDataReader(DataReader):
     """刺激数据读取器"""
     
+    name = 'Stim'
+    dtype = np.uint16
+    bytes_per_sample = 2
+    
     def __init__(self, sample_rate=30000, stim_step_size=10):
         super(StimDataReader, self).__init__(sample_rate)
         self.stim_step_size = stim_step_size
         
-    def read(self, file_descriptor, num_samples):
-        """读取刺激数据"""
-        if self.use_mmap == True:
-            t_start = time.perf_counter()  # 开始时间点
-            data = self._read_from_mmap(file_descriptor, num_samples, np.uint16, 2)
-            t_end = time.perf_counter()  # 结束时间点
-            elapsed_ms = (t_end - t_start) * 1000  # 转换为毫秒
-            self._logger.debug("mmap Stim read_delay {} ms", elapsed_ms)
-        else:
-            t_start = time.perf_counter()  # 开始时间点
-            data = np.fromfile(file_descriptor, dtype=np.uint16, count=num_samples)
-            t_end = time.perf_counter()  # 结束时间点
-            elapsed_ms = (t_end - t_start) * 1000  # 转换为毫秒
-            self._logger.debug("fromfile Stim read_delay {} ms", elapsed_ms)
-        self.stored_samples += len(data)
-        
+    def convert(self, data):
+        """转换为带符号的刺激电流"""
         current_magnitude = np.bitwise_and(data, 255) * self.stim_step_size
-        sign = (128 - np.bitwise_and(data, 256)) / 128.0
+        sign = (128 - np.bitwise_and(data, 256).astype(np.int32)) / 128.0
         return current_magnitude * sign
         
     def read_withStatus(self, file_descriptor, num_samples):
@@ -187,11 +185,8 @@ class StimDataReader(DataReader):
         self._logger.debug("mmap Stim read_withStatus read_delay {} ms", elapsed_ms)
         self.stored_samples += len(data)
         
-        current_magnitude = np.bitwise_and(data, 255) * self.stim_step_size
-        sign = (128 - np.bitwise_and(data, 256)) / 128.0
-        
         return {
-            'Stimdata': current_magnitude * sign,
+            'Stimdata': self.convert(data),
             'compliance_limit': np.bitwise_and(data, 32768) != 0,
             'charge_recovery': np.bitwise_and(data, 16384) != 0,
             'amplifier_settle': np.bitwise_and(data, 8192) != 0
@@ -200,21 +195,12 @@ class StimDataReader(DataReader):
 class DigitalDataReader(DataReader):
     """数字输入数据读取器"""
     
-    def read(self, file_descriptor, num_samples):
-        """读取数字输入数据"""
-        if self.use_mmap == True:
-            t_start = time.perf_counter()  # 开始时间点
-            data = self._read_from_mmap(file_descriptor, num_samples, np.uint16, 2)
-            t_end = time.perf_counter()  # 结束时间点
-            elapsed_ms = (t_end - t_start) * 1000  # 转换为毫秒
-            self._logger.debug("mmap Digital read_delay {} ms", elapsed_ms)
-        else:
-            t_start = time.perf_counter()  # 开始时间点
-            data = np.fromfile(file_descriptor, dtype=np.uint16, count=num_samples)
-            t_end = time.perf_counter()  # 结束时间点
-            elapsed_ms = (t_end - t_start) * 1000  # 转换为毫秒
-            self._logger.debug("fromfile Digital read_delay {} ms", elapsed_ms)
-        self.stored_samples += len(data)
+    name = 'Digital'
+    dtype = np.uint16
+    bytes_per_sample = 2
+    
+    def convert(self, data):
+        """数字输入保持原样"""
         return data
 
 class DataReaderFactory(object):
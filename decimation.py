@@ -0,0 +1,127 @@
+import numpy as np
+from scipy import signal
+
+from log_manager import LogManager
+from ingest_pipeline import PipelineStage
+from stream_ring import StreamRing
+
+
+class DecimatorStage(PipelineStage):
+    """
+    多相 FIR 降采样：把全采样率数据（默认 30 kHz 的放大器数据）抗混叠滤波后抽取 factor 倍，写入低采样率的 LFP 数据流。
+
+    抗混叠 FIR 长度为 taps_per_phase × factor，按相位拆成 factor 个子滤波器，只计算保留下来的输出样本：
+    每块数据切成长度为 factor 的整块 (通道数, 块数, factor)，对每个子滤波器做一次矩阵乘法，
+    每个原始样本每通道只需 taps_per_phase 次乘加。
+
+    降采样后的第 k 个样本对应原始绝对索引 k × factor，时间戳为 Intan 样本计数 // factor，
+    所以 read_range / read_around 的秒数与原始数据一致，历史可以比原始缓冲区长得多。
+
+    设置了 channel_mask 时只对可用的通道做矩阵乘法，被排除的通道输出为 0，重新启用时滤波历史按稳态重新填充。
+    """
+
+    name = 'decimator'
+
+    def __init__(self, source='amp', factor=30, output='lfp_1k', history_seconds=300, taps_per_phase=10,
+                 cutoff_ratio=0.8):
+        """
+        Args:
+            source: 输入数据流
+            factor: 降采样倍数，30 kHz / 30 = 1 kHz
+            output: 输出数据流名称
+            history_seconds: 输出保留的历史时长（秒）
+            taps_per_phase: 每个相位子滤波器的长度，FIR 总长度为 taps_per_phase × factor
+            cutoff_ratio: 抗混叠截止频率占输出奈奎斯特频率的比例
+        """
+        self.source = source
+        self.factor = int(factor)
+        self.output = output
+        self.history_seconds = history_seconds
+        self.taps_per_phase = int(taps_per_phase)
+        self.cutoff_ratio = cutoff_ratio
+        self.rings = {}
+        self._phases = None
+        self._logger = LogManager.get_logger("DecimatorStage")
+        self.reset()
+
+    def configure(self, manifest):
+        """设计抗混叠滤波器，分配输出数据流"""
+        q = self.factor
+        fs = manifest.sample_rate
+        names = manifest.channel_names.get(self.source) or \
+            [str(i) for i in range(manifest.channel_counts.get(self.source, 0))]
+        taps = signal.firwin(self.taps_per_phase * q, self.cutoff_ratio * fs / (2.0 * q), fs=fs)
+        # y[k] = sum_m blocks[k - m] · phases[m]，块内按时间先后排列，所以每个相位的系数倒序
+        self._phases = taps.reshape(self.taps_per_phase, q)[:, ::-1].astype(np.float32)
+        self.rings = {self.output: StreamRing(self.output, fs / float(q), names, self.history_seconds)}
+        self.reset()
+        self._logger.info("Decimating {} by {} into '{}' ({} taps)", self.source, q, self.output, taps.size)
+
+    def process(self, chunk):
+        """把新样本拼到未满的块后面，对所有完整的块计算输出"""
+        q = self.factor
+        data = chunk.stream(self.source)
+        timestamps = np.asarray(chunk.timestamps, dtype=np.int64)
+        if self._pending is None:
+            self._start(chunk.start, data, timestamps)
+        pending = np.concatenate((self._pending, data), axis=1)
+        pending_t = np.concatenate((self._pending_t, timestamps))
+
+        n_blocks = pending.shape[1] // q
+        used = n_blocks * q
+        self._pending = pending[:, used:]
+        self._pending_t = pending_t[used:]
+        if n_blocks == 0:
+            return
+
+        rows = self.active_channels(pending.shape[0])
+        new_blocks = pending[:, :used].reshape(pending.shape[0], n_blocks, q)
+        history = self._history if rows is None else self._history[rows]
+        if rows is not None:
+            new_blocks = new_blocks[rows]
+            # 被排除过的通道历史已经过时，按这一块的第一个样本重新填充
+            resumed = self._idle[rows]
+            if resumed.any():
+                history[resumed] = new_blocks[resumed, :1, :1]
+        elif self._idle.any():
+            history[self._idle] = new_blocks[self._idle, :1, :1]
+        blocks = np.concatenate((history, new_blocks), axis=1)
+        length = self.taps_per_phase - 1
+        output = blocks[:, length:length + n_blocks] @ self._phases[0]
+        for m in range(1, self.taps_per_phase):
+            output += blocks[:, length - m:length - m + n_blocks] @ self._phases[m]
+        if rows is None:
+            self._history = blocks[:, blocks.shape[1] - length:]
+            self._idle[:] = False
+        else:
+            self._history[rows] = blocks[:, blocks.shape[1] - length:]
+            self._idle[:] = True
+            self._idle[rows] = False
+            part, output = output, np.zeros((pending.shape[0], n_blocks), dtype=output.dtype)
+            output[rows] = part
+
+        # 每块的最后一个样本对应输出样本
+        output_t = pending_t[q - 1:used:q] // q
+        self.rings[self.output].write(self._next_index, output_t, output)
+        self._next_index += n_blocks
+
+    def _start(self, start, data, timestamps):
+        """第一块数据：对齐到 factor 的整数倍，之前缺的样本和滤波历史都用第一个样本填充（稳态启动）"""
+        q = self.factor
+        first_block = -(-start // q)          # 第一个输出样本的降采样索引
+        pad = first_block * q - q + 1 - start  # 第一个完整块的起点相对 start 的位置（<= 0）
+        self._pending = np.repeat(data[:, :1], -pad, axis=1)
+        self._pending_t = timestamps[0] + np.arange(pad, 0, dtype=np.int64)
+        self._history = np.repeat(data[:, None, :1], self.taps_per_phase - 1, axis=1).repeat(q, axis=2)
+        self._idle = np.zeros(data.shape[0], dtype=bool)
+        self._next_index = first_block
+
+    def reset(self):
+        """清空滤波状态和输出"""
+        self._pending = None
+        self._pending_t = None
+        self._history = None
+        self._idle = None
+        self._next_index = 0
+        for ring in self.rings.values():
+            ring.clear()
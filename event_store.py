@@ -0,0 +1,132 @@
+import numpy as np
+
+from log_manager import LogManager
+
+
+class EventStore(object):
+    """
+    按样本索引排序的事件环形存储（尖峰、刺激等），预分配结构化数组，写满后覆盖最老的事件。
+
+    每条事件有一个从 0 开始单调递增的序号，物理位置为 序号 % capacity；dtype 必须包含 int64 的 'index' 字段
+    （事件所在的绝对样本索引），并且按 'index' 非递减的顺序追加，所以可以按时间二分查找。
+    与 SampleRingBuffer 相同，单写多读不加锁：读线程拷贝后检查预留游标，被覆盖时返回 None。
+    """
+
+    max_read_retries = 3
+
+    def __init__(self, dtype, capacity=1000000):
+        """
+        Args:
+            dtype: 事件的结构化数据类型，必须包含 'index' 字段
+            capacity: 最多保留的事件数
+        """
+        self.dtype = np.dtype(dtype)
+        if 'index' not in self.dtype.names:
+            raise ValueError("Event dtype needs an 'index' field")
+        self.capacity = int(capacity)
+        self.records = np.zeros(self.capacity, dtype=self.dtype)
+        self.total_written = 0
+        self._write_reserved = 0
+        self.epoch = 0
+        self._logger = LogManager.get_logger("EventStore")
+
+    @property
+    def oldest(self):
+        """最老事件的序号"""
+        return max(0, self.total_written - self.capacity)
+
+    @property
+    def size(self):
+        """当前保存的事件数"""
+        return self.total_written - self.oldest
+
+    def append(self, records):
+        """追加一批事件（按 'index' 排好序，且不早于已有的事件）"""
+        n = records.size
+        if n == 0:
+            return
+        if n > self.capacity:
+            records = records[n - self.capacity:]
+            self.total_written += n - self.capacity
+            n = self.capacity
+        self._write_reserved = self.total_written + n
+        pos = self.total_written % self.capacity
+        first = min(n, self.capacity - pos)
+        self.records[pos:pos + first] = records[:first]
+        self.records[:n - first] = records[first:]
+        self.total_written += n
+
+    def clear(self):
+        """清空事件"""
+        self.epoch += 1
+        self.total_written = 0
+        self._write_reserved = 0
+
+    def read(self, start, stop):
+        """
+        按序号读取 [start, stop) 的事件拷贝，早于 oldest 的部分被截掉；读的过程中被覆盖时返回 None
+        """
+        for _ in range(self.max_read_retries):
+            epoch = self.epoch
+            start = max(start, self.oldest)
+            stop = min(stop, self.total_written)
+            if stop <= start:
+                return np.zeros(0, dtype=self.dtype)
+            pos = start % self.capacity
+            n = stop - start
+            if pos + n <= self.capacity:
+                result = self.records[pos:pos + n].copy()
+            else:
+                result = np.concatenate((self.records[pos:], self.records[:pos + n - self.capacity]))
+            if self.epoch == epoch and self._write_reserved - self.capacity <= start:
+                return result
+        self._logger.debug("Event reader lapped by writer while reading [{}, {})", start, stop)
+        return None
+
+    def since(self, sequence):
+        """
+        读取序号 sequence 之后的新事件，供增量消费者使用
+
+        Returns:
+            (records, next_sequence)：下次从 next_sequence 继续；落后太多时从最老的事件开始
+        """
+        stop = self.total_written
+        records = self.read(sequence, stop)
+        if records is None:
+            return np.zeros(0, dtype=self.dtype), stop
+        return records, stop
+
+    def sequence_of_index(self, index):
+        """第一个 'index' 不小于 index 的事件的序号，在两段有序的物理数组上二分查找"""
+        oldest = self.oldest
+        newest = self.total_written
+        if newest == oldest:
+            return newest
+        keys = self.records['index']
+        pos = oldest % self.capacity
+        if pos == 0:
+            return oldest + int(np.searchsorted(keys[:newest - oldest], index))
+        older = keys[pos:]
+        k = int(np.searchsorted(older, index))
+        if k < older.size:
+            return oldest + k
+        newer = keys[:newest - oldest - older.size]
+        return oldest + older.size + int(np.searchsorted(newer, index))
+
+    def query(self, start_index=None, stop_index=None, channels=None):
+        """
+        查询样本索引在 [start_index, stop_index) 内的事件
+
+        Args:
+            start_index, stop_index: 绝对样本索引，None 表示不限
+            channels: 只保留这些通道（需要 'channel' 字段），None 表示全部
+
+        Returns:
+            结构化数组，读的过程中被覆盖时返回 None
+        """
+        start = self.oldest if start_index is None else self.sequence_of_index(start_index)
+        stop = self.total_written if stop_index is None else self.sequence_of_index(stop_index)
+        records = self.read(start, stop)
+        if records is None or channels is None:
+            return records
+        return records[np.isin(records['channel'], channels)]
@@ -0,0 +1,127 @@
+import numpy as np
+
+from log_manager import LogManager
+from ingest_pipeline import PipelineStage
+
+
+class EvokedResponseStage(PipelineStage):
+    """
+    在线诱发响应平均：对每个 (刺激条件, 刺激通道) 维护所有记录通道刺激前后窗口的均值和方差（Welford），
+    每个脉冲的窗口 [开始 - pre_ms, 开始 + post_ms) 完整后立即并入，不需要保存或重读每个 epoch。
+
+    刺激事件来自 StimArtifactStage（IngestChunk.events[stim_stage]），本阶段要排在它后面；
+    source 通常是伪迹处理后的数据流（'clean'、'artifact_free'）或滤波后的 'lfp'。
+    同一块里完成的同一条件的窗口一次花式索引切出 (窗口数, 通道数, 样本数)，再用 Chan 的合并公式批量并入。
+    """
+
+    name = 'evoked_response'
+
+    def __init__(self, source='artifact_free', stim_stage='stim_artifact', pre_ms=10.0, post_ms=50.0,
+                 subtract_baseline=False):
+        """
+        Args:
+            source: 输入数据流
+            stim_stage: 提供刺激事件的阶段名称
+            pre_ms, post_ms: 刺激开始之前、之后的时长（毫秒）
+            subtract_baseline: 每个窗口先减去刺激前部分的均值
+        """
+        self.source = source
+        self.stim_stage = stim_stage
+        self.pre_ms = pre_ms
+        self.post_ms = post_ms
+        self.subtract_baseline = subtract_baseline
+        self.sample_rate = 0
+        self.channel_names = []
+        self.responses = {}
+        self._pre = 0
+        self._post = 1
+        self._logger = LogManager.get_logger("EvokedResponseStage")
+        self.reset()
+
+    def configure(self, manifest):
+        """换算窗口长度"""
+        self.sample_rate = manifest.sample_rate
+        self._pre = int(round(self.pre_ms * manifest.sample_rate / 1000.0))
+        self._post = max(1, int(round(self.post_ms * manifest.sample_rate / 1000.0)))
+        self.channel_names = manifest.channel_names.get('amp') or \
+            [str(i) for i in range(manifest.channel_counts.get('amp', 0))]
+        self.reset()
+
+    @property
+    def conditions(self):
+        """已经有响应的 (条件, 刺激通道) 列表"""
+        return sorted(self.responses.keys())
+
+    def response(self, condition, stim_channel):
+        """
+        取一个 (条件, 刺激通道) 的当前平均响应
+
+        Returns:
+            dict：count、mean、std、sem 为 (记录通道数, 窗口样本数)，t_ms 为相对刺激开始的毫秒；没有时返回 None
+        """
+        state = self.responses.get((int(condition), int(stim_channel)))
+        if state is None:
+            return None
+        count, mean, m2 = state
+        var = m2 / max(count - 1, 1)
+        return {
+            'count': count,
+            'mean': mean,
+            'std': np.sqrt(var),
+            'sem': np.sqrt(var / count),
+            't_ms': np.arange(-self._pre, self._post) * 1000.0 / self.sample_rate
+        }
+
+    def process(self, chunk):
+        """登记新脉冲，窗口已经完整的脉冲并入平均"""
+        data = chunk.stream(self.source)
+        length = self._pre + self._post
+        if self._history is None:
+            self._history = np.zeros((data.shape[0], 0), dtype=data.dtype)
+        pulses = chunk.events.get(self.stim_stage)
+        if pulses is not None and pulses.size:
+            self._pending = np.concatenate((self._pending, pulses)) if self._pending is not None else pulses
+
+        extended = np.concatenate((self._history, data), axis=1)
+        extended_start = chunk.stop - extended.shape[1]
+        if self._pending is not None and self._pending.size:
+            split = int(np.searchsorted(self._pending['index'], chunk.stop - self._post, side='right'))
+            ready, self._pending = self._pending[:split], self._pending[split:]
+            # 刺激前的部分早于已有数据（采集刚开始）的脉冲丢掉
+            ready = ready[ready['index'] - self._pre >= extended_start]
+            if ready.size:
+                self._accumulate(extended, extended_start, ready)
+        self._history = extended[:, -length:]
+
+    def _accumulate(self, extended, extended_start, pulses):
+        """按 (条件, 刺激通道) 分组批量并入"""
+        offsets = np.arange(-self._pre, self._post)
+        keys = np.stack((pulses['condition'].astype(np.int64), pulses['channel'].astype(np.int64)), axis=1)
+        unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        for k, (condition, stim_channel) in enumerate(unique):
+            starts = pulses['index'][inverse == k] - extended_start
+            # (窗口数, 通道数, 样本数)
+            epochs = extended[:, starts[:, None] + offsets].transpose(1, 0, 2).astype(np.float64)
+            if self.subtract_baseline and self._pre:
+                epochs -= epochs[:, :, :self._pre].mean(axis=2, keepdims=True)
+            n = epochs.shape[0]
+            batch_mean = epochs.mean(axis=0)
+            batch_m2 = ((epochs - batch_mean) ** 2).sum(axis=0)
+            key = (int(condition), int(stim_channel))
+            state = self.responses.get(key)
+            if state is None:
+                self.responses[key] = (n, batch_mean, batch_m2)
+            else:
+                count, mean, m2 = state
+                total = count + n
+                delta = batch_mean - mean
+                # 整体替换，读线程拿到的三项总是一致的
+                self.responses[key] = (total, mean + delta * (n / float(total)),
+                                       m2 + batch_m2 + delta ** 2 * (count * n / float(total)))
+
+    def reset(self):
+        """清空平均和跨块状态"""
+        self.responses = {}
+        self._pending = None
+        self._history = None
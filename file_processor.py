@@ -22,13 +22,14 @@ class FileProcessor(object):
         # 计数器 计数不同类型的文件个数
         self.file_counts_by_type = {}
         # 构建缓存，不然每次轮询 files 取对应类型的所有文件 性能太低
-        self.files_by_type = {
-            'timestamp': [],
-            'amp': [],
-            'stim': [],
-            'digital_in': [],
-            'info': []
-        }
+        self.files_by_type = self._empty_type_cache()
+
+        # 下一段记录（NewSaveFilePeriodMinutes / CreateNewDirectory 产生的新目录）的预打开文件
+        # 当前段还在读的时候，新目录的文件先暂存在这里，等当前段读完再整体切换
+        self.pending_directory = None  # type: str
+        self.pending_files = {}  # type: dict[str, FileInfo]
+        self.pending_file_counts_by_type = {}
+        self.pending_files_by_type = self._empty_type_cache()
         
         # 文件类型识别规则，违反开闭，但是因为变动不多，其实没必要再使用注册机制进行轮询了
         self.file_patterns = {
@@ -52,13 +53,21 @@ class FileProcessor(object):
         
         if filepath in self.files:
             return self.files[filepath]  # 已处理过，直接返回
+        if filepath in self.pending_files:
+            return self.pending_files[filepath]
 
         directory = os.path.dirname(filepath)
         basename = os.path.basename(filepath)
         
-        # 检查是否需要切换目录
+        # 检查是否需要切换目录：当前段已经有文件在读时，新目录作为下一段暂存，不直接关闭当前文件
+        staged = False
         if self.current_directory != directory:
-            self._switch_directory(directory)
+            if self.files:
+                if self.pending_directory != directory:
+                    self._stage_directory(directory)
+                staged = True
+            else:
+                self._switch_directory(directory)
             
         # 识别文件类型
         file_type = self._identify_file_type(basename)
@@ -73,22 +82,40 @@ class FileProcessor(object):
             file_type=file_type
         )
         
+        if staged:
+            files, files_by_type, counts = self.pending_files, self.pending_files_by_type, self.pending_file_counts_by_type
+        else:
+            files, files_by_type, counts = self.files, self.files_by_type, self.file_counts_by_type
+
         # 尝试打开文件
         try:
             file_info.file_descriptor = open(filepath, 'rb')
-            self.files[filepath] = file_info
+            files[filepath] = file_info
             # 直接添加到对应类型的列表 - 缓存
-            self.files_by_type[file_type].append(file_info)
+            files_by_type[file_type].append(file_info)
             # 更新计数器
-            count = self.file_counts_by_type.get(file_type, 0)
-            self.file_counts_by_type[file_type] = count + 1
+            counts[file_type] = counts.get(file_type, 0) + 1
             
-            self._logger.info("Added {} file: {}", file_type, basename)
+            if staged:
+                self._logger.info("Pre-opened next segment {} file: {}", file_type, basename)
+            else:
+                self._logger.info("Added {} file: {}", file_type, basename)
             return file_info
         except IOError as e:
             self._logger.error("Failed to open {}: {}", filepath, e)
             return None
             
+    @staticmethod
+    def _empty_type_cache():
+        """按类型分组的文件缓存"""
+        return {
+            'timestamp': [],
+            'amp': [],
+            'stim': [],
+            'digital_in': [],
+            'info': []
+        }
+
     def _identify_file_type(self, basename):
         """识别文件类型"""
         for file_type, pattern_func in self.file_patterns.items():
@@ -112,11 +139,87 @@ class FileProcessor(object):
         # 更新当前目录
         self.current_directory = new_directory
         self.files.clear()
+        self.files_by_type = self._empty_type_cache()
+
+    def _stage_directory(self, new_directory):
+        """把新目录登记为下一段，当前段的文件保持打开"""
+        if self.pending_directory is not None:
+            # 上一个暂存段还没来得及切换又来了新目录，只保留最新的
+            self._logger.warning("Discarding unpromoted segment: {}", self.pending_directory)
+            self._close_files(self.pending_files)
+        self._logger.info("Staging next segment directory: {}", new_directory)
+        self.pending_directory = new_directory
+        self.pending_files = {}
+        self.pending_file_counts_by_type = {}
+        self.pending_files_by_type = self._empty_type_cache()
+
+    def has_pending_segment(self):
+        """是否已经有预打开的下一段"""
+        return self.pending_directory is not None
+
+    def get_pending_file_count_by_type(self, file_type):
+        """获取下一段中指定类型的文件数量"""
+        return self.pending_file_counts_by_type.get(file_type, 0)
+
+    def get_pending_files_by_type(self, file_type):
+        """获取下一段中指定类型的所有文件"""
+        return self.pending_files_by_type.get(file_type, [])
+
+    def promote_pending_segment(self):
+        """
+        当前段读完后切换到下一段：关闭当前段的文件，下一段的文件描述符直接接管
+
+        Returns:
+            新的当前目录，没有暂存段时返回 None
+        """
+        if self.pending_directory is None:
+            return None
+
+        # 下一段的文件按被发现的顺序登记，排成与当前段相同的通道顺序，续接后每一行仍是同一个通道
+        for file_type, pending in self.pending_files_by_type.items():
+            order = {file_info.basename: i for i, file_info in enumerate(self.files_by_type.get(file_type, []))}
+            pending.sort(key=lambda file_info: (order.get(file_info.basename, len(order)), file_info.basename))
+
+        closed_count = self.close_all_files()
+        self._logger.info("Rolled over to {} ({} files closed)", self.pending_directory, closed_count)
+
+        self.current_directory = self.pending_directory
+        self.files = self.pending_files
+        self.files_by_type = self.pending_files_by_type
+        self.file_counts_by_type = self.pending_file_counts_by_type
+
+        self.pending_directory = None
+        self.pending_files = {}
+        self.pending_file_counts_by_type = {}
+        self.pending_files_by_type = self._empty_type_cache()
+        return self.current_directory
         
     def close_all_files(self):
         """关闭所有打开的文件"""
+        return self._close_files(self.files)
+
+    def reset(self):
+        """关闭所有文件（包括暂存段）并清空状态，用于重新设置监控目录"""
+        closed_count = self.close_all_files() + self.close_pending_files()
+        self.current_directory = None
+        self.files.clear()
+        self.files_by_type = self._empty_type_cache()
+        self.file_counts_by_type.clear()
+        return closed_count
+
+    def close_pending_files(self):
+        """关闭并丢弃暂存的下一段文件"""
+        closed_count = self._close_files(self.pending_files)
+        self.pending_directory = None
+        self.pending_files = {}
+        self.pending_file_counts_by_type = {}
+        self.pending_files_by_type = self._empty_type_cache()
+        return closed_count
+
+    def _close_files(self, files):
+        """关闭给定文件表中的文件"""
         closed_count = 0
-        for file_info in self.files.values():
+        for file_info in files.values():
             if file_info.file_descriptor:
                 try:
                     file_info.file_descriptor.close()
@@ -139,4 +242,18 @@ class FileProcessor(object):
         
     def get_file_count_by_type(self, file_type):
         """获取指定类型的文件数量"""
-        return self.file_counts_by_type.get(file_type, 0)
\ No newline at end of file
+        return self.file_counts_by_type.get(file_type, 0)
+        
+    def get_channel_names(self, file_type):
+        """
+        获取指定类型的通道名，顺序与 get_files_by_type 一致
+        
+        例如 amp-A-000.dat -> A-000，board-DIGITAL-IN-01.dat -> DIGITAL-IN-01
+        """
+        prefixes = {'amp': 'amp-', 'stim': 'stim-', 'digital_in': 'board-'}
+        prefix = prefixes.get(file_type, '')
+        names = []
+        for file_info in self.get_files_by_type(file_type):
+            name = os.path.splitext(file_info.basename)[0]
+            names.append(name[len(prefix):] if name.startswith(prefix) else name)
+        return names
\ No newline at end of file
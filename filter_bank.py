@@ -0,0 +1,127 @@
+import numpy as np
+from scipy import signal
+
+from log_manager import LogManager
+from ingest_pipeline import PipelineStage
+from stream_ring import StreamRing
+
+
+def design_sos(kind, frequency, sample_rate, order=4, quality=30.0):
+    """
+    设计二阶节（SOS）级联滤波器
+
+    Args:
+        kind: 'highpass'、'lowpass'、'bandpass' 或 'notch'
+        frequency: 截止频率（Hz），bandpass 为 (低, 高)，notch 为陷波中心频率
+        sample_rate: 采样率
+        order: Butterworth 阶数
+        quality: 陷波器的品质因数
+
+    Returns:
+        (n_sections, 6) 的 SOS 系数
+    """
+    if kind == 'notch':
+        b, a = signal.iirnotch(frequency, quality, fs=sample_rate)
+        return signal.tf2sos(b, a)
+    if kind not in ('highpass', 'lowpass', 'bandpass'):
+        raise ValueError("Unknown filter kind: {}".format(kind))
+    return signal.butter(order, frequency, btype=kind, output='sos', fs=sample_rate)
+
+
+class FilterBankStage(PipelineStage):
+    """
+    因果滤波器组：对所有通道一次性做 SOS 级联滤波，滤波器状态跨块保存，没有每个窗口重新开始的边缘瞬态。
+
+    每路输出写入自己的 StreamRing（与原始缓冲区同一套样本索引），同时放进 IngestChunk.streams 供后面的阶段使用。
+    默认两路：'spikes' 为 300 Hz 高通，'lfp' 为 1-300 Hz 带通，都先经过工频陷波。
+
+    设置了 channel_mask 时只滤波可用的通道，被排除的通道输出为 0、滤波器状态不更新，重新启用时按稳态重新初始化。
+    """
+
+    name = 'filter_bank'
+
+    def __init__(self, source='amp', filters=None, notch_hz=50, notch_harmonics=1, order=4, history_seconds=10):
+        """
+        Args:
+            source: 输入数据流，默认换算成微伏的放大器数据
+            filters: 输出名 -> (kind, frequency) 或现成的 SOS 系数；None 时使用默认的 'spikes' 和 'lfp'
+            notch_hz: 工频（50 或 60），None 表示不陷波
+            notch_harmonics: 陷波的谐波个数，1 表示只陷基频
+            order: Butterworth 阶数
+            history_seconds: 每路输出保留的历史时长（秒）
+        """
+        self.source = source
+        self.filter_specs = filters or {'spikes': ('highpass', 300), 'lfp': ('bandpass', (1, 300))}
+        self.notch_hz = notch_hz
+        self.notch_harmonics = notch_harmonics
+        self.order = order
+        self.history_seconds = history_seconds
+        self.sos = {}
+        self.rings = {}
+        self._state = {}
+        self._idle = None
+        self._logger = LogManager.get_logger("FilterBankStage")
+
+    def configure(self, manifest):
+        """按采样率设计滤波器，为每路输出分配数据流"""
+        fs = manifest.sample_rate
+        names = manifest.channel_names.get(self.source) or \
+            [str(i) for i in range(manifest.channel_counts.get(self.source, 0))]
+        notch = [design_sos('notch', self.notch_hz * k, fs) for k in range(1, self.notch_harmonics + 1)
+                 if self.notch_hz and self.notch_hz * k < fs / 2.0]
+        self.sos = {}
+        self.rings = {}
+        for output, spec in self.filter_specs.items():
+            if isinstance(spec, tuple):
+                sos = design_sos(spec[0], spec[1], fs, self.order)
+            else:
+                sos = np.asarray(spec, dtype=np.float64)
+            self.sos[output] = np.vstack(notch + [sos])
+            self.rings[output] = StreamRing(output, fs, names, self.history_seconds)
+        self._state = {}
+        self._idle = None
+        self._logger.info("Filter bank configured: {}", ', '.join(
+            '{} ({} sections)'.format(k, v.shape[0]) for k, v in self.sos.items()))
+
+    def process(self, chunk):
+        """逐路滤波，状态延续到下一块"""
+        data = chunk.stream(self.source)
+        rows = self.active_channels(data.shape[0])
+        work = data if rows is None else data[rows]
+        resumed = None
+        if self._idle is not None:
+            resumed = self._idle if rows is None else self._idle[rows]
+            if not resumed.any():
+                resumed = None
+        for output, sos in self.sos.items():
+            state = self._state.get(output)
+            if state is None:
+                # 按第一块的第一个样本初始化为稳态，避免开头的阶跃瞬态
+                state = signal.sosfilt_zi(sos)[:, None, :] * data[:, :1][None, :, :].astype(np.float64)
+            active = state if rows is None else state[:, rows]
+            if resumed is not None:
+                # 被排除过的通道状态已经过时，同样按这一块的第一个样本重新初始化
+                active[:, resumed] = signal.sosfilt_zi(sos)[:, None, :] * work[resumed, :1][None, :, :]
+            filtered, active = signal.sosfilt(sos, work, axis=1, zi=active)
+            if rows is None:
+                state = active
+                filtered = filtered.astype(np.float32)
+            else:
+                state[:, rows] = active
+                part, filtered = filtered, np.zeros(data.shape, dtype=np.float32)
+                filtered[rows] = part
+            self._state[output] = state
+            chunk.streams[output] = filtered
+            self.rings[output].write(chunk.start, chunk.timestamps, filtered)
+        if rows is None:
+            self._idle = None
+        else:
+            self._idle = np.ones(data.shape[0], dtype=bool)
+            self._idle[rows] = False
+
+    def reset(self):
+        """重新开始采集时清空滤波器状态和输出"""
+        self._state = {}
+        self._idle = None
+        for ring in self.rings.values():
+            ring.clear()
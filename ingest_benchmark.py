@@ -0,0 +1,131 @@
+# ingest_benchmark.py - 线程模式与进程模式的采集延迟对比
+#
+# 用法: python ingest_benchmark.py --seconds 20 --channels 64 --gui-load 0.8
+#
+# 一个写入进程按实时速率模拟 Intan 追加 OneFilePerChannel 文件，父进程里另开一个纯 Python 的"界面"线程
+# 按 --gui-load 的占空比持续占用 GIL（模拟重绘和解码）。分别测量：
+#   thread  - RealTimeDataReader 在父进程里加载，加载线程写完一块的时刻
+#   process - ProcessDataReader 在子进程里加载，父进程收到管道通知的时刻
+# 延迟 = 父进程得知某块数据的时刻 - 这块数据最后一个样本按实时速率应当写完的时刻。
+import argparse
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+SAMPLE_RATE = 30000
+
+
+def _writer_main(directory, n_channels, start_time, seconds, block_samples):
+    """写入进程：按实时速率追加时间戳、放大器和数字输入文件"""
+    names = ['amp-A-{:03d}.dat'.format(i) for i in range(n_channels)] + ['board-DIGITAL-IN-01.dat', 'time.dat']
+    files = [open(os.path.join(directory, name), 'ab') for name in names]
+    written = 0
+    total = int(seconds * SAMPLE_RATE)
+    while written < total:
+        due = start_time + (written + block_samples) / float(SAMPLE_RATE)
+        delay = due - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        t = np.arange(written, written + block_samples, dtype=np.int32)
+        amp = (t % 300).astype(np.int16).tobytes()
+        for f in files[:n_channels]:
+            f.write(amp)
+        files[n_channels].write((t % 2).astype(np.uint16).tobytes())
+        files[n_channels + 1].write(t.tobytes())
+        for f in files:
+            f.flush()
+        written += block_samples
+    for f in files:
+        f.close()
+
+
+def _gui_load(stop_event, duty_cycle, period=0.02):
+    """模拟界面线程：每个周期内先做 duty_cycle 比例的纯 Python 计算，再空闲"""
+    while not stop_event.is_set():
+        busy_until = time.perf_counter() + period * duty_cycle
+        x = 0
+        while time.perf_counter() < busy_until:
+            for i in range(200):
+                x += i * i
+        time.sleep(period * (1 - duty_cycle))
+
+
+def _run(mode, args):
+    """跑一轮，返回每块数据的延迟（毫秒）"""
+    root = tempfile.mkdtemp(prefix='ingest_benchmark_')
+    latencies = []
+    start_time = [None]
+
+    def on_data(latest_index):
+        if start_time[0] is not None:
+            latencies.append((time.time() - (start_time[0] + latest_index / float(SAMPLE_RATE))) * 1000)
+
+    if mode == 'thread':
+        from RealRHXDataRead import RealTimeDataReader
+        from ingest_pipeline import PipelineStage
+
+        class _Probe(PipelineStage):
+            name = 'latency_probe'
+
+            def process(self, chunk):
+                on_data(chunk.stop)
+
+        reader = RealTimeDataReader(history_seconds=10)
+        reader.add_stage(_Probe())
+    else:
+        from ingest_process import ProcessDataReader
+        reader = ProcessDataReader('ingest_benchmark_{}'.format(os.getpid()), history_seconds=10)
+        reader.add_data_callback(on_data)
+
+    stop_event = threading.Event()
+    gui_thread = threading.Thread(target=_gui_load, args=(stop_event, args.gui_load), daemon=True)
+    try:
+        reader.set_monitoring_directory(root)
+        time.sleep(1.0)
+        segment = os.path.join(root, 'segment')
+        os.makedirs(segment)
+        start_time[0] = time.time() + 1.0
+        writer = multiprocessing.get_context('spawn').Process(
+            target=_writer_main, args=(segment, args.channels, start_time[0], args.seconds, args.block_samples))
+        writer.start()
+        gui_thread.start()
+        writer.join()
+        time.sleep(0.5)
+    finally:
+        stop_event.set()
+        reader.close()
+        shutil.rmtree(root, ignore_errors=True)
+    # 丢掉第一秒的预热
+    warmup = int(SAMPLE_RATE / args.block_samples)
+    return np.asarray(latencies[warmup:])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare thread vs process ingest latency under GUI load")
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--channels', type=int, default=64)
+    parser.add_argument('--block-samples', type=int, default=3000, help="samples appended per write")
+    parser.add_argument('--gui-load', type=float, default=0.8, help="fraction of time the GUI thread holds the GIL")
+    parser.add_argument('--mode', choices=['thread', 'process', 'both'], default='both')
+    args = parser.parse_args()
+
+    modes = ['thread', 'process'] if args.mode == 'both' else [args.mode]
+    print("{} channels, {} s, GUI load {:.0%}".format(args.channels, args.seconds, args.gui_load))
+    print("{:<8} {:>6} {:>9} {:>9} {:>9} {:>9}".format('mode', 'blocks', 'p50 ms', 'p95 ms', 'p99 ms', 'max ms'))
+    for mode in modes:
+        latencies = _run(mode, args)
+        if latencies.size == 0:
+            print("{:<8} no data received".format(mode))
+            continue
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        print("{:<8} {:>6} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f}".format(
+            mode, latencies.size, p50, p95, p99, latencies.max()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+import numpy as np
+
+from log_manager import LogManager
+
+
+class ChannelManifest(object):
+    """采集的通道清单：采样率、各信号类型的通道数、通道名和原始数据类型"""
+
+    def __init__(self, sample_rate, channel_counts, channel_names, dtypes):
+        self.sample_rate = sample_rate
+        self.channel_counts = dict(channel_counts)
+        self.channel_names = dict(channel_names)
+        self.dtypes = dict(dtypes)
+
+
+class IngestChunk(object):
+    """
+    一次加载进来的样本，已经写入样本缓冲区。
+
+    start 是第一个样本的绝对索引（与 SampleRingBuffer 一致），signals 保持原始数据类型。
+    处理阶段可以把派生数据放进 streams，供后面的阶段使用；stream(name) 统一取派生数据或换算后的原始信号。
+    """
+
+    def __init__(self, start, timestamps, signals, sample_rate, converters=None):
+        """
+        Args:
+            converters: 信号类型 -> 原始数据换算为物理量的函数（DataReader.convert），stream() 使用
+        """
+        self.start = start
+        self.timestamps = timestamps
+        self.signals = signals
+        self.sample_rate = sample_rate
+        self.converters = converters or {}
+        self.streams = {}
+        # 处理阶段在这一块里产生的事件（例如检测到的尖峰），阶段名 -> 结构化数组
+        self.events = {}
+        # 正在处理这一块的管线，由 IngestPipeline.process 设置
+        self.pipeline = None
+
+    @property
+    def size(self):
+        """样本数"""
+        return self.timestamps.size
+
+    @property
+    def stop(self):
+        """最后一个样本之后的绝对索引"""
+        return self.start + self.timestamps.size
+
+    def stream(self, name):
+        """
+        取一路数据流，(通道数, 样本数) float32：前面阶段写入的派生数据，或者换算为物理量的原始信号（结果缓存到 streams）
+        """
+        data = self.streams.get(name)
+        if data is None:
+            raw = self.signals[name]
+            convert = self.converters.get(name)
+            data = np.asarray(convert(raw) if convert else raw, dtype=np.float32)
+            self.streams[name] = data
+        return data
+
+    def ring(self, name):
+        """按名称查找处理阶段输出的派生数据流（StreamRing），用于回看已经写入的历史"""
+        if self.pipeline is None:
+            return None
+        return self.pipeline.get_ring(name)
+
+
+class PipelineStage(object):
+    """
+    采集管线中的处理阶段基类。
+
+    阶段在加载线程里按注册顺序执行，每次收到一个 IngestChunk，不能阻塞太久。
+    """
+
+    name = None
+    # 可用通道的掩码（True 为可用，通常由 ChannelQualityStage 设置），None 表示全部可用
+    channel_mask = None
+
+    def configure(self, manifest):
+        """通道清单确定（或变化）后调用，子类在这里分配状态"""
+        pass
+
+    def usable_mask(self, n):
+        """
+        channel_mask 转成长度为 n 的布尔数组。
+
+        掩码长度与 n 不符时（例如通道清单变化前留下的掩码）忽略它并记一次警告，不会按错位的通道计算
+
+        Returns:
+            布尔数组；没有掩码或长度不符时返回 None，表示全部通道可用
+        """
+        if self.channel_mask is None:
+            return None
+        mask = np.asarray(self.channel_mask, dtype=bool)
+        if mask.size != n:
+            if self.channel_mask is not getattr(self, '_ignored_mask', None):
+                self._ignored_mask = self.channel_mask
+                LogManager.get_logger(type(self).__name__).warning(
+                    "Ignoring channel mask of {} channels on {} channels", mask.size, n)
+            return None
+        return mask
+
+    def active_channels(self, n):
+        """
+        channel_mask 里可用通道的序号。支持掩码的阶段只把这些行取出来计算，结果再放回完整的 (n, ...) 数组，
+        被排除的行为 0，不做任何计算
+
+        Returns:
+            序号数组；没有掩码或掩码长度与 n 不符时返回 None，表示处理全部通道
+        """
+        mask = self.usable_mask(n)
+        if mask is None:
+            return None
+        return np.flatnonzero(mask)
+
+    def process(self, chunk):
+        """处理一块新数据"""
+        raise NotImplementedError
+
+    def reset(self):
+        """重新开始采集时调用，清掉跨块保存的状态"""
+        pass
+
+
+class IngestPipeline(object):
+    """按顺序执行的处理阶段列表"""
+
+    def __init__(self):
+        self.stages = []
+        self.manifest = None  # type: ChannelManifest
+        self._logger = LogManager.get_logger("IngestPipeline")
+
+    def add_stage(self, stage):
+        """添加处理阶段，通道清单已知时立即配置"""
+        if self.manifest is not None:
+            stage.configure(self.manifest)
+        self.stages.append(stage)
+        self._logger.info("Added pipeline stage: {}", stage.name or type(stage).__name__)
+
+    def remove_stage(self, stage):
+        """移除处理阶段"""
+        if stage in self.stages:
+            self.stages.remove(stage)
+
+    def configure(self, manifest):
+        """通道清单变化时重新配置所有阶段"""
+        self.manifest = manifest
+        for stage in self.stages:
+            stage.configure(manifest)
+
+    def process(self, chunk):
+        """依次执行所有阶段，单个阶段出错不影响其他阶段"""
+        chunk.pipeline = self
+        for stage in list(self.stages):
+            try:
+                stage.process(chunk)
+            except Exception as e:
+                self._logger.error("Stage {} failed: {}", stage.name or type(stage).__name__, e)
+
+    def get_ring(self, name):
+        """按名称查找处理阶段输出的派生数据流（StreamRing），没有时返回 None"""
+        for stage in self.stages:
+            ring = getattr(stage, 'rings', {}).get(name)
+            if ring is not None:
+                return ring
+        return None
+
+    def rings(self):
+        """所有处理阶段当前的派生数据流，名称 -> StreamRing"""
+        rings = {}
+        for stage in self.stages:
+            rings.update(getattr(stage, 'rings', {}))
+        return rings
+
+    def get_stage(self, name):
+        """按名称查找处理阶段，没有时返回 None"""
+        for stage in self.stages:
+            if stage.name == name:
+                return stage
+        return None
+
+    def reset(self):
+        """重置所有阶段"""
+        for stage in self.stages:
+            stage.reset()
@@ -0,0 +1,220 @@
+import multiprocessing
+import threading
+
+from log_manager import LogManager
+from data_readers import DataReaderFactory
+from ingest_pipeline import PipelineStage
+from shared_ring import SharedSampleRingBuffer
+from ring_reader import RingReaderMixin
+
+
+class _PipeNotifier(PipelineStage):
+    """采集子进程里的最后一个阶段：缓冲区就绪、每块新数据写入后通过管道通知父进程"""
+
+    name = 'pipe_notifier'
+
+    def __init__(self, conn, reader):
+        self.conn = conn
+        self.reader = reader
+        # configure 在文件监控线程里调用，process 在加载线程里调用
+        self._lock = threading.Lock()
+        self._announce = False
+
+    def configure(self, manifest):
+        # 管线在分配缓冲区之前配置（派生数据流要先算进内存预算），这时新的一代共享内存还不存在，
+        # 等第一块数据写入后再把它的名称通知父进程
+        with self._lock:
+            self._announce = True
+
+    def process(self, chunk):
+        with self._lock:
+            if self._announce:
+                self.conn.send(('ready', self.reader.sample_buffer.name))
+                self._announce = False
+            self.conn.send(('data', chunk.stop))
+
+
+def _ingest_process_main(command_conn, notify_conn, shared_memory_name, reader_kwargs):
+    """
+    采集子进程入口：文件读取和样本组装都在这里完成，结果写进共享内存里的样本缓冲区。
+
+    命令管道接收 ('set_directory', 目录) 和 ('stop', None)；开始监控后回复 ('monitoring', 目录)。
+    """
+    from RealRHXDataRead import RealTimeDataReader
+
+    reader = RealTimeDataReader(**reader_kwargs)
+    reader.enable_shared_memory(shared_memory_name)
+    reader.add_stage(_PipeNotifier(notify_conn, reader))
+    try:
+        while True:
+            command, argument = command_conn.recv()
+            if command == 'set_directory':
+                reader.set_monitoring_directory(argument)
+                notify_conn.send(('monitoring', argument))
+            elif command == 'stop':
+                break
+    except EOFError:
+        pass
+    finally:
+        reader.close()
+        notify_conn.send(('closed', None))
+        notify_conn.close()
+
+
+class ProcessDataReader(RingReaderMixin):
+    """
+    进程隔离的实时数据读取器。
+
+    RealTimeDataReader 放在独立的子进程里运行，文件读取和样本组装不再和 Qt 界面争抢 GIL；
+    子进程把样本写进 SharedSampleRingBuffer，父进程只读挂载同一块共享内存，
+    每写入一块新数据子进程通过管道发一个很小的通知。
+    对外接口与 RealTimeDataReader 相同：read_data / read_range / read_around。
+    """
+
+    def __init__(self, shared_memory_name='brain_core_ring', memory_budget_bytes=None, history_seconds=100,
+                 budget_policy='degrade'):
+        """
+        Args:
+            shared_memory_name: 子进程发布样本缓冲区使用的共享内存名称前缀，每次分配加上序号
+            memory_budget_bytes, history_seconds, budget_policy: 同 RealTimeDataReader
+        """
+        self.shared_memory_name = shared_memory_name
+        self.reader_factory = DataReaderFactory()
+        self.sample_buffer = None  # type: SharedSampleRingBuffer
+        self.sample_rate = 30000
+        self._read_cursor = 0
+        self._read_epoch = 0
+        self.max_read_lag_ms = 500
+        # 子进程最近一次通知的最新样本索引
+        self.latest_index = 0
+        self._data_callbacks = []
+        self._stream_waiters = []
+        self._data_cond = threading.Condition()
+        self._monitoring = threading.Event()
+        self._logger = LogManager.get_logger("ProcessDataReader")
+
+        # spawn 启动，子进程不继承父进程里的 Qt 和文件监控状态
+        context = multiprocessing.get_context('spawn')
+        notify_recv, notify_send = context.Pipe(duplex=False)
+        command_recv, self._command_conn = context.Pipe(duplex=False)
+        reader_kwargs = {
+            'memory_budget_bytes': memory_budget_bytes,
+            'history_seconds': history_seconds,
+            'budget_policy': budget_policy
+        }
+        self.process = context.Process(target=_ingest_process_main, name='ingest',
+                                       args=(command_recv, notify_send, shared_memory_name, reader_kwargs),
+                                       daemon=True)
+        self.process.start()
+        # 父进程不保留子进程那一端，子进程退出后 recv 才能收到 EOF
+        notify_send.close()
+        command_recv.close()
+        self._notify_conn = notify_recv
+
+        self.running = True
+        self._listener_thread = threading.Thread(target=self._listen, daemon=True)
+        self._listener_thread.start()
+        self._logger.info("Started ingest process (pid {})", self.process.pid)
+
+    def set_monitoring_directory(self, directory, timeout=10.0):
+        """
+        设置监控目录（由子进程监控和读取），等到子进程开始监控后返回
+
+        Returns:
+            子进程是否在 timeout 秒内开始监控
+        """
+        self._monitoring.clear()
+        self._command_conn.send(('set_directory', directory))
+        if not self._monitoring.wait(timeout):
+            self._logger.warning("Ingest process did not start monitoring {} within {} s", directory, timeout)
+            return False
+        return True
+
+    def add_data_callback(self, callback):
+        """
+        注册新数据回调，每块数据写入后在监听线程里以 callback(latest_index) 调用，回调不能阻塞太久
+        """
+        self._data_callbacks.append(callback)
+
+    def wait_for_data(self, timeout=None):
+        """
+        等待下一块新数据
+
+        Returns:
+            最新样本索引，超时返回 None
+        """
+        with self._data_cond:
+            last = self.latest_index
+            self._data_cond.wait_for(lambda: self.latest_index != last or not self.running, timeout)
+            if self.latest_index == last:
+                return None
+            return self.latest_index
+
+    def _listen(self):
+        """监听线程：处理子进程的通知"""
+        while self.running:
+            try:
+                message, argument = self._notify_conn.recv()
+            except (EOFError, OSError):
+                break
+            if message == 'ready':
+                self._attach(argument)
+            elif message == 'data':
+                with self._data_cond:
+                    self.latest_index = argument
+                    self._data_cond.notify_all()
+                self._notify_streams(argument)
+                for callback in list(self._data_callbacks):
+                    try:
+                        callback(argument)
+                    except Exception as e:
+                        self._logger.error("Data callback failed: {}", e)
+            elif message == 'monitoring':
+                self._monitoring.set()
+            elif message == 'closed':
+                break
+        with self._data_cond:
+            self.running = False
+            self._data_cond.notify_all()
+
+    def _attach(self, name):
+        """
+        子进程（重新）分配了缓冲区，挂载新的一代。
+
+        旧的一代不在这里 close：读线程可能还在读它或拿着它的视图，没有引用之后映射自动解除。
+        """
+        # spawn 出来的子进程和本进程共用 resource_tracker，不能在这里注销子进程登记的共享内存
+        self.sample_buffer = SharedSampleRingBuffer.attach(name, track=True)
+        self.sample_rate = self.sample_buffer.sample_rate
+        self._read_cursor = 0
+        self._read_epoch = self.sample_buffer.epoch
+        self.latest_index = self.sample_buffer.total_written
+        self._notify_streams()
+
+    def _check_read_ready(self):
+        """read_data 之前的检查"""
+        if self.sample_buffer is None:
+            self._logger.warning("Data not ready for reading")
+            return False
+        return True
+
+    def close(self, timeout=5.0):
+        """停止子进程并断开共享内存"""
+        if self.process.is_alive():
+            try:
+                self._command_conn.send(('stop', None))
+            except OSError:
+                pass
+            self.process.join(timeout)
+            if self.process.is_alive():
+                self._logger.warning("Ingest process did not stop, terminating")
+                self.process.terminate()
+                self.process.join()
+        self.running = False
+        self._listener_thread.join(timeout)
+        self._command_conn.close()
+        self._notify_conn.close()
+        if self.sample_buffer is not None:
+            self.sample_buffer.close()
+            self.sample_buffer = None
+        self._logger.info("Ingest process stopped")
@@ -0,0 +1,107 @@
+import numpy as np
+from scipy import signal
+
+from log_manager import LogManager
+from ingest_pipeline import PipelineStage
+from stream_ring import StreamRing
+from filter_bank import design_sos
+
+
+class MUAEnvelopeStage(PipelineStage):
+    """
+    多单元活动（MUA）包络：带通、整流、低通平滑，再抽取 factor 倍写入低采样率的包络数据流（默认 'mua'），
+    每块数据对所有通道各做一次 SOS 滤波，两个滤波器的状态都跨块保存。
+
+    低通截止频率低于输出的奈奎斯特频率，直接抽取即可。输出第 k 个样本取自原始绝对索引 k × factor，
+    时间戳为 Intan 样本计数 // factor，与 DecimatorStage 的输出逐个样本对齐，所以 read_range / read_around 的秒数与原始数据一致。
+    设置了 channel_mask 时只对可用的通道滤波，被排除的通道输出为 0，重新启用时滤波器状态从 0 开始。
+    """
+
+    name = 'mua_envelope'
+
+    def __init__(self, source='amp', output='mua', band=(500, 5000), smoothing_hz=100, factor=30, order=4,
+                 history_seconds=300):
+        """
+        Args:
+            source: 输入数据流
+            output: 输出数据流名称
+            band: 带通范围（Hz）
+            smoothing_hz: 整流后低通平滑的截止频率（Hz）
+            factor: 抽取倍数，30 kHz / 30 = 1 kHz
+            order: Butterworth 阶数
+            history_seconds: 输出保留的历史时长（秒）
+        """
+        self.source = source
+        self.output = output
+        self.band = band
+        self.smoothing_hz = smoothing_hz
+        self.factor = int(factor)
+        self.order = order
+        self.history_seconds = history_seconds
+        self.rings = {}
+        self._bandpass = None
+        self._lowpass = None
+        self._logger = LogManager.get_logger("MUAEnvelopeStage")
+        self.reset()
+
+    def configure(self, manifest):
+        """设计滤波器，分配输出数据流"""
+        fs = manifest.sample_rate
+        if self.smoothing_hz >= fs / (2.0 * self.factor):
+            self._logger.warning("Smoothing cutoff {} Hz is above the output Nyquist frequency", self.smoothing_hz)
+        names = manifest.channel_names.get(self.source) or \
+            [str(i) for i in range(manifest.channel_counts.get(self.source, 0))]
+        high = min(self.band[1], 0.45 * fs)
+        self._bandpass = design_sos('bandpass', (self.band[0], high), fs, self.order)
+        self._lowpass = design_sos('lowpass', self.smoothing_hz, fs, self.order)
+        self.rings = {self.output: StreamRing(self.output, fs / float(self.factor), names, self.history_seconds)}
+        self.reset()
+
+    def process(self, chunk):
+        """带通、整流、低通后抽取"""
+        data = chunk.stream(self.source)
+        if data.shape[1] == 0:
+            return
+        if self._band_state is None:
+            # 带通从零状态开始（直流不通过），低通按 0 开始
+            self._band_state = np.zeros((self._bandpass.shape[0], data.shape[0], 2))
+            self._low_state = np.zeros((self._lowpass.shape[0], data.shape[0], 2))
+            self._idle = np.zeros(data.shape[0], dtype=bool)
+        rows = self.active_channels(data.shape[0])
+        masked = rows is not None
+        if masked:
+            work = data[rows]
+        else:
+            rows, work = slice(None), data
+        # 被排除过的通道状态已经过时，重新从 0 开始
+        self._band_state[:, self._idle] = 0
+        self._low_state[:, self._idle] = 0
+        filtered, self._band_state[:, rows] = signal.sosfilt(self._bandpass, work, axis=1,
+                                                             zi=self._band_state[:, rows])
+        np.abs(filtered, out=filtered)
+        envelope, self._low_state[:, rows] = signal.sosfilt(self._lowpass, filtered, axis=1,
+                                                            zi=self._low_state[:, rows])
+        self._idle[:] = True
+        self._idle[rows] = False
+
+        q = self.factor
+        # 这一块里第一个绝对索引为 factor 整数倍的样本
+        first = (-chunk.start) % q
+        if masked:
+            part = envelope[:, first::q]
+            envelope = np.zeros((data.shape[0], part.shape[1]), dtype=np.float32)
+            envelope[rows] = part
+        else:
+            envelope = envelope[:, first::q].astype(np.float32)
+        if envelope.shape[1] == 0:
+            return
+        timestamps = np.asarray(chunk.timestamps[first::q], dtype=np.int64) // q
+        self.rings[self.output].write((chunk.start + first) // q, timestamps, envelope)
+
+    def reset(self):
+        """清空滤波器状态和输出"""
+        self._band_state = None
+        self._low_state = None
+        self._idle = None
+        for ring in self.rings.values():
+            ring.clear()
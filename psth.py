@@ -0,0 +1,162 @@
+import numpy as np
+
+from log_manager import LogManager
+from ingest_pipeline import PipelineStage
+
+
+class PSTHStage(PipelineStage):
+    """
+    增量 PSTH：把尖峰事件存储和刺激事件存储按样本索引归并，统计每个 (刺激条件, 刺激通道) 下
+    每个记录通道在刺激前后各个时间窗里的尖峰数，计数放在预分配的 (条件数, 通道数, 时间窗数) 数组里。
+
+    两个存储都用 EventStore.since() 增量读取，两边都按时间有序：刺激窗口 [开始 - pre_ms, 开始 + post_ms)
+    结束（再加上尖峰检测的延迟 latency_ms）之后，在缓存的尖峰里二分查找窗口边界，一次性批量计数；
+    早于所有未完成窗口的尖峰随即丢弃，所以缓存只有几百毫秒。
+    """
+
+    name = 'psth'
+
+    def __init__(self, spike_stage='spike_detection', stim_stage='stim_artifact', pre_ms=50.0, post_ms=200.0,
+                 bin_ms=1.0, latency_ms=5.0, max_conditions=16):
+        """
+        Args:
+            spike_stage: 尖峰检测阶段的名称（读它的 events）
+            stim_stage: 刺激事件阶段的名称（读它的 events）
+            pre_ms, post_ms: 刺激开始之前、之后的时长（毫秒）
+            bin_ms: 时间窗宽度（毫秒）
+            latency_ms: 尖峰检测写入事件的延迟，窗口结束这么久之后才计数
+            max_conditions: 预分配的 (条件, 刺激通道) 组合数，不够时翻倍
+        """
+        self.spike_stage = spike_stage
+        self.stim_stage = stim_stage
+        self.pre_ms = pre_ms
+        self.post_ms = post_ms
+        self.bin_ms = bin_ms
+        self.latency_ms = latency_ms
+        self.max_conditions = max_conditions
+        self.sample_rate = 0
+        self.n_channels = 0
+        self.counts = None
+        self.trials = None
+        self._slots = {}
+        self._logger = LogManager.get_logger("PSTHStage")
+
+    def configure(self, manifest):
+        """换算窗口长度，分配计数数组"""
+        fs = manifest.sample_rate
+        self.sample_rate = fs
+        self._bin = max(1, int(round(self.bin_ms * fs / 1000.0)))
+        self._n_bins = max(1, int(round((self.pre_ms + self.post_ms) / self.bin_ms)))
+        self._pre = int(round(self.pre_ms / self.bin_ms)) * self._bin
+        self._span = self._n_bins * self._bin
+        self._latency = int(round(self.latency_ms * fs / 1000.0))
+        self.n_channels = manifest.channel_counts.get('amp', 0)
+        self.reset()
+
+    @property
+    def conditions(self):
+        """已经有计数的 (条件, 刺激通道) 列表"""
+        return sorted(self._slots.keys())
+
+    @property
+    def bin_edges_ms(self):
+        """时间窗边界，相对刺激开始的毫秒"""
+        return (np.arange(self._n_bins + 1) * self._bin - self._pre) * 1000.0 / self.sample_rate
+
+    def psth(self, condition, stim_channel):
+        """
+        取一个 (条件, 刺激通道) 的 PSTH
+
+        Returns:
+            dict：counts 为 (通道数, 时间窗数) 的尖峰数，trials 为刺激次数，
+                  rate 为每次刺激平均的发放率（Hz），bin_edges_ms 为时间窗边界；没有时返回 None
+        """
+        slot = self._slots.get((int(condition), int(stim_channel)))
+        if slot is None:
+            return None
+        counts = self.counts[slot].copy()
+        trials = int(self.trials[slot])
+        return {
+            'counts': counts,
+            'trials': trials,
+            'rate': counts / (max(trials, 1) * self._bin / float(self.sample_rate)),
+            'bin_edges_ms': self.bin_edges_ms
+        }
+
+    def process(self, chunk):
+        """读取新事件，对已经结束的刺激窗口计数"""
+        pipeline = chunk.pipeline
+        if pipeline is None:
+            return
+        spike_stage = pipeline.get_stage(self.spike_stage)
+        stim_stage = pipeline.get_stage(self.stim_stage)
+        if spike_stage is None or stim_stage is None:
+            return
+
+        stims, self._stim_sequence = stim_stage.events.since(self._stim_sequence)
+        if stims.size:
+            self._stims = np.concatenate((self._stims, stims)) if self._stims is not None else stims
+        spikes, self._spike_sequence = spike_stage.events.since(self._spike_sequence)
+        if spikes.size:
+            self._spikes = np.concatenate((self._spikes, spikes)) if self._spikes is not None else spikes
+        if self._stims is None or self._stims.size == 0:
+            self._trim_spikes(chunk.stop)
+            return
+
+        # 窗口结束并且尖峰检测已经追上的刺激
+        split = int(np.searchsorted(self._stims['index'], chunk.stop - self._span + self._pre - self._latency,
+                                    side='right'))
+        ready, self._stims = self._stims[:split], self._stims[split:]
+        if ready.size:
+            self._count(ready)
+        self._trim_spikes(self._stims['index'][0] if self._stims.size else chunk.stop)
+
+    def _count(self, stims):
+        """有序归并：每个刺激窗口在有序的尖峰索引里二分出边界，展开成 (刺激, 尖峰) 对后批量累加"""
+        slots = np.array([self._slot((int(c), int(s))) for c, s in zip(stims['condition'], stims['channel'])],
+                         dtype=np.intp)
+        np.add.at(self.trials, slots, 1)
+        if self._spikes is None or self._spikes.size == 0:
+            return
+        times = self._spikes['index']
+        window_start = stims['index'] - self._pre
+        lo = np.searchsorted(times, window_start)
+        hi = np.searchsorted(times, window_start + self._span)
+        counts = hi - lo
+        total = int(counts.sum())
+        if total == 0:
+            return
+        pair_stim = np.repeat(np.arange(stims.size), counts)
+        # 每对的尖峰位置：lo[刺激] + 该刺激内的序号
+        pair_spike = lo[pair_stim] + np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        bins = (times[pair_spike] - window_start[pair_stim]) // self._bin
+        channels = self._spikes['channel'][pair_spike].astype(np.intp)
+        np.add.at(self.counts, (slots[pair_stim], channels, bins), 1)
+
+    def _slot(self, key):
+        """(条件, 刺激通道) 对应的计数数组下标，预分配的不够时翻倍"""
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = len(self._slots)
+            if slot >= self.counts.shape[0]:
+                self.counts = np.concatenate((self.counts, np.zeros_like(self.counts)))
+                self.trials = np.concatenate((self.trials, np.zeros_like(self.trials)))
+            self._slots[key] = slot
+        return slot
+
+    def _trim_spikes(self, next_onset):
+        """丢掉早于下一个未完成窗口的尖峰"""
+        if self._spikes is not None and self._spikes.size:
+            keep = int(np.searchsorted(self._spikes['index'], next_onset - self._pre))
+            self._spikes = self._spikes[keep:]
+
+    def reset(self):
+        """清零计数和游标"""
+        self.counts = np.zeros((self.max_conditions, self.n_channels, self._n_bins if self.sample_rate else 1),
+                               dtype=np.int64)
+        self.trials = np.zeros(self.max_conditions, dtype=np.int64)
+        self._slots = {}
+        self._stims = None
+        self._spikes = None
+        self._stim_sequence = 0
+        self._spike_sequence = 0
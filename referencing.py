@@ -0,0 +1,131 @@
+import numpy as np
+
+from log_manager import LogManager
+from ingest_pipeline import PipelineStage
+from stream_ring import StreamRing
+
+
+def port_groups(channel_names):
+    """
+    按通道名前缀（Intan 端口，'A-000' -> 'A'）分组
+
+    Returns:
+        有序 dict：组名 -> 通道序号列表
+    """
+    groups = {}
+    for i, name in enumerate(channel_names):
+        groups.setdefault(name.split('-')[0], []).append(i)
+    return groups
+
+
+class ReferenceStage(PipelineStage):
+    """
+    重参考：每块数据只算一次参考并减掉，结果写入参考后的数据流（默认 'referenced'），
+    同时放进 IngestChunk.streams，后面的滤波、检测阶段把 source 设为它即可，不需要每个消费者自己再做一遍。
+
+    method 为 'mean'（共平均参考，CAR）或 'median'（中值参考）；groups 为 'global'（所有通道一组）、
+    'port'（按端口分组）或 组名 -> 通道名/序号列表。参考只用 channel_mask 里可用的通道计算（由 ChannelQualityStage 设置），
+    也只输出这些通道，被排除的通道输出为 0、不参与任何计算。均值参考所有组合在一起是一次矩阵乘法。
+    """
+
+    name = 'reference'
+
+    def __init__(self, source='amp', output='referenced', method='mean', groups='global', history_seconds=10):
+        """
+        Args:
+            source: 输入数据流
+            output: 输出数据流名称
+            method: 'mean' 或 'median'
+            groups: 'global'、'port' 或 dict 组名 -> 通道名/序号列表
+            history_seconds: 输出保留的历史时长（秒）
+        """
+        if method not in ('mean', 'median'):
+            raise ValueError("Unknown reference method: {}".format(method))
+        self.source = source
+        self.output = output
+        self.method = method
+        self.groups = groups
+        self.history_seconds = history_seconds
+        self.channel_mask = None
+        self.rings = {}
+        self._group_of = None
+        self._members = []
+        self._weights = None
+        self._weights_mask = None
+        self._logger = LogManager.get_logger("ReferenceStage")
+
+    def configure(self, manifest):
+        """按通道名确定分组，分配输出数据流"""
+        names = manifest.channel_names.get(self.source) or \
+            [str(i) for i in range(manifest.channel_counts.get(self.source, 0))]
+        n = len(names)
+        if self.groups == 'global':
+            groups = {'all': list(range(n))}
+        elif self.groups == 'port':
+            groups = port_groups(names)
+        else:
+            groups = {key: [names.index(c) if isinstance(c, str) else int(c) for c in members]
+                      for key, members in self.groups.items()}
+        # 不在任何组里的通道自成一组，参考为 0（原样输出）
+        self._group_of = np.full(n, -1, dtype=np.intp)
+        self._members = []
+        for g, members in enumerate(groups.values()):
+            self._group_of[members] = g
+            self._members.append(np.asarray(members, dtype=np.intp))
+        self._weights = None
+        self.rings = {self.output: StreamRing(self.output, manifest.sample_rate, names, self.history_seconds)}
+        self._logger.info("Reference '{}' ({}, {} groups)", self.output, self.method, len(self._members))
+
+    def process(self, chunk):
+        """计算参考并写入输出数据流"""
+        data = chunk.stream(self.source)
+        rows = self.active_channels(data.shape[0])
+        if rows is None:
+            referenced = data - self._reference(data, np.arange(data.shape[0]))
+        else:
+            referenced = np.zeros_like(data)
+            referenced[rows] = data[rows] - self._reference(data[rows], rows)
+        chunk.streams[self.output] = referenced
+        self.rings[self.output].write(chunk.start, chunk.timestamps, referenced)
+
+    def _reference(self, data, rows):
+        """data 为 rows 这些通道的 (通道数, 样本数) 数据，返回同样形状的参考，每个通道为所在组的参考"""
+        n_groups = len(self._members)
+        group_reference = np.zeros((n_groups + 1, data.shape[1]), dtype=data.dtype)
+        if self.method == 'mean':
+            # 被排除的通道权重为 0，只取可用通道的列
+            group_reference[:n_groups] = self._mean_weights()[:, rows] @ data
+        else:
+            position = np.full(self._group_of.size, -1, dtype=np.intp)
+            position[rows] = np.arange(rows.size)
+            for g, members in enumerate(self._members):
+                good = position[members]
+                good = good[good >= 0]
+                if good.size:
+                    group_reference[g] = np.median(data[good], axis=0)
+        # 不在任何组的通道（_group_of = -1）取最后一行的 0
+        return group_reference[self._group_of[rows]]
+
+    def _mean_weights(self):
+        """(组数, 通道数) 的平均权重矩阵，掩码变化时重建"""
+        mask = self._mask(self._group_of.size)
+        if self._weights is None or not np.array_equal(mask, self._weights_mask):
+            weights = np.zeros((len(self._members), mask.size), dtype=np.float32)
+            for g, members in enumerate(self._members):
+                good = members[mask[members]]
+                if good.size:
+                    weights[g, good] = 1.0 / good.size
+            self._weights = weights
+            self._weights_mask = mask
+        return self._weights
+
+    def _mask(self, n):
+        mask = self.usable_mask(n)
+        if mask is None:
+            return np.ones(n, dtype=bool)
+        return mask
+
+    def reset(self):
+        """清空输出"""
+        for ring in self.rings.values():
+            ring.clear()
@@ -0,0 +1,301 @@
+import asyncio
+import threading
+
+
+class RingReaderMixin(object):
+    """
+    基于样本缓冲区的对外读取接口：read_data / read_range / read_around，以及滑动窗口 stream / sliding_windows。
+
+    使用方需要提供 sample_buffer、sample_rate、reader_factory（负责原始数据换算）、
+    _read_cursor、_read_epoch、max_read_lag_ms、_stream_waiters（空列表）、_logger，并实现 _check_read_ready()；
+    新数据写入后要调用 _notify_streams(最新样本索引)，缓冲区被清空或重新分配后调用 _notify_streams()。
+    RealTimeDataReader 和进程模式下的 ProcessDataReader 共用这一套逻辑。
+    """
+    
+    def _check_read_ready(self):
+        """read_data 之前的检查，数据不可读时返回 False"""
+        raise NotImplementedError
+        
+    def read_data(self, timespan_ms):
+        """
+        根据指定的时间跨度（毫秒）从样本缓冲区中读取二维数组和时间戳，读取后消费这段数据。
+
+        参数:
+        - timespan_ms: 整数，表示时间跨度，以毫秒为单位，应为100ms的整数倍。
+
+        返回值:
+        - NumPy多维数组，形状为 (通道数, 样本数)，其中样本数为 timespan_ms 转换后的样本数。
+        - NumPy多维数组，形状为 (刺激通道数, 样本数)，表示对应的刺激数据。
+        - NumPy数组，长度与样本数一致，表示时间戳。
+        - NumPy多维数组，形状为 (数字通道数, 样本数)，表示数字输入数据，如果没有则返回None。
+        """
+        
+        if not self._check_read_ready():
+            return self._convert_window(None)
+        
+        samples_needed = int(self.sample_rate * (timespan_ms / 1000.0))
+        buffer = self.sample_buffer
+        if buffer.epoch != self._read_epoch:
+            # 缓冲区被清空过，从头开始消费
+            self._read_epoch = buffer.epoch
+            self._read_cursor = 0
+        newest = buffer.total_written
+        
+        # 读取落后太多（或已被覆盖）时，跳到最新的一段数据
+        max_lag = int(self.sample_rate * self.max_read_lag_ms / 1000.0)
+        if self._read_cursor < buffer.oldest_index or newest - self._read_cursor > max_lag + samples_needed:
+            self._logger.debug("已积累{}ms延迟，需要进行修正", self.max_read_lag_ms)
+            self._read_cursor = max(newest - samples_needed, buffer.oldest_index)
+        
+        # 数据不够时不消费，下次再读
+        if newest - self._read_cursor < samples_needed:
+            self._logger.debug("Insufficient data available: need {}, got {}", 
+                            samples_needed, newest - self._read_cursor)
+            return self._convert_window(None)
+        
+        window = buffer.read_samples(self._read_cursor, self._read_cursor + samples_needed)
+        if window is None:
+            # 读的过程中被写线程追上，下次调用会按落后处理
+            return self._convert_window(None)
+        self._read_cursor += samples_needed
+        
+        self._logger.debug("Successfully read {} samples for {}ms timespan", samples_needed, timespan_ms)
+        return self._convert_window(window)
+        
+    def read_range(self, t_start, t_end):
+        """
+        按 Intan 时间戳读取 [t_start, t_end)（秒）区间内的数据，不影响 read_data 的消费位置。
+
+        返回值与 read_data 相同，区间不在缓冲区内时返回 (None, None, None, None)。
+        """
+        if self.sample_buffer is None:
+            return self._convert_window(None)
+        return self._convert_window(self.sample_buffer.read_range(t_start, t_end))
+        
+    def read_around(self, t, pre_ms, post_ms):
+        """
+        读取某一 Intan 时刻 t（秒）前 pre_ms 毫秒到后 post_ms 毫秒的数据，例如刺激时刻附近的窗口。
+
+        返回值与 read_data 相同。
+        """
+        if self.sample_buffer is None:
+            return self._convert_window(None)
+        return self._convert_window(self.sample_buffer.read_around(t, pre_ms, post_ms))
+        
+    async def stream(self, window_ms, hop_ms=None, max_backlog_ms=None):
+        """
+        异步迭代数据窗口：async for window in reader.stream(100, 50)
+
+        协程只在下一个窗口凑齐时被写线程通过 loop.call_soon_threadsafe 唤醒，不需要轮询。
+        从调用时的最新数据开始，每次前进 hop_ms；消费者落后超过 max_backlog_ms 时跳到最新，
+        跳过的样本数记在 window.dropped_samples 里。
+
+        参数:
+        - window_ms: 窗口长度（毫秒）
+        - hop_ms: 相邻窗口起点的间隔（毫秒），默认等于 window_ms
+        - max_backlog_ms: 允许积压的时长，默认 max_read_lag_ms
+
+        产出:
+        - StreamWindow，见 DataWindow；backlog_ms 表示窗口末尾之后已经写入、还没被消费的数据时长
+        """
+        waiter = _StreamWaiter(asyncio.get_running_loop())
+        cursor = _WindowCursor(self, window_ms, hop_ms, max_backlog_ms)
+        self._stream_waiters.append(waiter)
+        try:
+            while True:
+                waiter.event.clear()
+                window = cursor.next_window(waiter)
+                if window is None:
+                    await waiter.event.wait()
+                    continue
+                yield window
+        finally:
+            self._stream_waiters.remove(waiter)
+            
+    def sliding_windows(self, window_ms, hop_ms=None, timeout=None, max_backlog_ms=None):
+        """
+        同步版本的 stream()：for window in reader.sliding_windows(200, 20)，解码线程直接用。
+
+        窗口直接指向样本缓冲区，window.view() 在不回绕时是零拷贝的视图，调用方不用再自己维护滑动缓冲区。
+        没有新窗口时阻塞等待写线程唤醒，超过 timeout 秒仍未凑齐时迭代结束。
+
+        参数同 stream()，产出 StreamWindow。
+        """
+        waiter = _ThreadWaiter()
+        cursor = _WindowCursor(self, window_ms, hop_ms, max_backlog_ms)
+        self._stream_waiters.append(waiter)
+        try:
+            while True:
+                waiter.event.clear()
+                window = cursor.next_window(waiter)
+                if window is None:
+                    if not waiter.event.wait(timeout):
+                        return
+                    continue
+                yield window
+        finally:
+            self._stream_waiters.remove(waiter)
+            
+    def _notify_streams(self, newest=None):
+        """写线程调用：唤醒窗口已经凑齐的 stream() / sliding_windows()，newest 为 None 时全部唤醒"""
+        for waiter in list(self._stream_waiters):
+            if newest is None or waiter.target is None or newest >= waiter.target:
+                waiter.wake()
+        
+    def _convert_window(self, window):
+        """把缓冲区中的原始数据换算为 (amp, stim, t, digital) 的物理量"""
+        if window is None:
+            return None, None, None, None
+        
+        converted = {}
+        for file_type in ['amp', 'stim', 'digital_in']:
+            data = window.get(file_type)
+            if data is not None and data.shape[0] > 0:
+                converted[file_type] = self.reader_factory.get_reader(file_type).convert(data)
+            else:
+                converted[file_type] = None
+        final_t = self.reader_factory.get_reader('timestamp').convert(window['t'])
+        return converted['amp'], converted['stim'], final_t, converted['digital_in']
+
+
+class DataWindow(object):
+    """
+    指向样本缓冲区中 [start, stop) 的轻量句柄，只记录索引，不拷贝数据。
+
+    dataReady 信号携带它，界面收到后再决定读多少：read() 读整段，read(last_ms=100) 只读最后 100 毫秒。
+    数据在写线程追上之前一直有效，被覆盖、缓冲区被清空或重新分配后 read() 返回 (None, None, None, None)。
+    """
+
+    def __init__(self, reader, start, stop, epoch):
+        self.reader = reader
+        self.buffer = reader.sample_buffer
+        self.start = start
+        self.stop = stop
+        self.epoch = epoch
+
+    @property
+    def n_samples(self):
+        """样本数"""
+        return self.stop - self.start
+
+    @property
+    def timespan_ms(self):
+        """时间跨度（毫秒）"""
+        return self.n_samples * 1000.0 / self.reader.sample_rate
+
+    def is_valid(self):
+        """数据是否仍在缓冲区中（view() 拿到的视图用完后用它确认没有被覆盖）"""
+        return self.buffer is self.reader.sample_buffer and self.buffer.is_intact(self.start, self.epoch)
+
+    def view(self):
+        """
+        零拷贝读取原始样本：区间在物理上连续时返回指向缓冲区的视图，回绕时退化为拷贝。
+
+        视图在写线程追上之前有效，用完后可以用 is_valid() 确认期间没有被覆盖。
+        """
+        # 缓冲区重新分配过时旧的一代可能已经 close，先比较再访问它
+        if self.buffer is not self.reader.sample_buffer or self.buffer.epoch != self.epoch:
+            return None
+        return self.buffer.view_samples(self.start, self.stop)
+
+    def samples(self, last_ms=None):
+        """读取原始样本，返回值同 SampleRingBuffer.read_samples"""
+        start = self.start
+        if last_ms is not None:
+            start = max(start, self.stop - int(self.reader.sample_rate * last_ms / 1000.0))
+        if self.buffer is not self.reader.sample_buffer or self.buffer.epoch != self.epoch:
+            return None
+        return self.buffer.read_samples(start, self.stop)
+
+    def read(self, last_ms=None):
+        """读取并换算，返回值同 read_data"""
+        return self.reader._convert_window(self.samples(last_ms))
+
+
+class StreamWindow(DataWindow):
+    """stream() 产出的窗口，附带背压信息"""
+
+    def __init__(self, reader, start, stop, epoch, backlog_samples, dropped_samples):
+        super(StreamWindow, self).__init__(reader, start, stop, epoch)
+        self.backlog_samples = backlog_samples
+        self.dropped_samples = dropped_samples
+
+    @property
+    def backlog_ms(self):
+        """产出时窗口之后积压的数据时长（毫秒）"""
+        return self.backlog_samples * 1000.0 / self.reader.sample_rate
+
+
+class _WindowCursor(object):
+    """stream() 和 sliding_windows() 共用的窗口游标"""
+
+    def __init__(self, reader, window_ms, hop_ms, max_backlog_ms):
+        self.reader = reader
+        self.window_ms = window_ms
+        self.hop_ms = hop_ms if hop_ms is not None else window_ms
+        self.max_backlog_ms = max_backlog_ms
+        self.buffer = None
+        self.epoch = None
+        self.cursor = 0
+        self.dropped = 0
+
+    def next_window(self, waiter):
+        """
+        返回下一个凑齐的窗口并前进 hop；还没凑齐时返回 None，并把 waiter.target 设为需要等到的样本索引
+        """
+        reader = self.reader
+        current = reader.sample_buffer
+        if current is None:
+            waiter.target = None
+            return None
+        window = int(reader.sample_rate * self.window_ms / 1000.0)
+        hop = int(reader.sample_rate * self.hop_ms / 1000.0)
+        max_backlog_ms = self.max_backlog_ms if self.max_backlog_ms is not None else reader.max_read_lag_ms
+        max_backlog = int(reader.sample_rate * max_backlog_ms / 1000.0)
+        if current is not self.buffer or current.epoch != self.epoch:
+            # 首次进入，或缓冲区被清空 / 重新分配：从最新数据开始
+            self.buffer, self.epoch = current, current.epoch
+            self.cursor = current.total_written
+
+        newest = current.total_written
+        if self.cursor < current.oldest_index or newest - self.cursor > max_backlog + window:
+            skip_to = max(newest - window, current.oldest_index)
+            self.dropped += skip_to - self.cursor
+            reader._logger.warning("Stream consumer fell behind, skipped {} samples", skip_to - self.cursor)
+            self.cursor = skip_to
+
+        if newest - self.cursor < window:
+            waiter.target = self.cursor + window
+            return None
+
+        start = self.cursor
+        self.cursor += hop
+        waiter.target = self.cursor + window
+        return StreamWindow(reader, start, start + window, self.epoch, newest - start - window, self.dropped)
+
+
+class _StreamWaiter(object):
+    """一个 stream() 协程的唤醒点，target 为它等待的样本索引"""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.event = asyncio.Event()
+        self.target = None
+
+    def wake(self):
+        try:
+            self.loop.call_soon_threadsafe(self.event.set)
+        except RuntimeError:
+            # 事件循环已经关闭
+            pass
+
+
+class _ThreadWaiter(object):
+    """sliding_windows() 的唤醒点"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.target = None
+
+    def wake(self):
+        self.event.set()
@@ -0,0 +1,285 @@
+import numpy as np
+from log_manager import LogManager
+
+
+class SampleRingBuffer(object):
+    """
+    按样本存储的环形缓冲区。
+
+    与 CircularBuffer 存 100ms 字典块不同，这里每种信号一块连续的 (通道数, 容量) 数组，
+    直接保存 Intan 文件里的原始数据类型（amp 为 int16，stim / digital 为 uint16），
+    时间戳保存为 int64 的 Intan 样本计数。所有位置都用从 0 开始单调递增的绝对样本索引表示，
+    索引 i 对应的物理位置是 i % capacity。
+
+    单写多读，不加锁：写线程先把 _write_reserved 推进到本次写入的末尾，再拷贝数据，最后发布 total_written；
+    读线程只读 total_written 之前的样本，拷贝完成后检查 _write_reserved，确认拷贝期间这段没有被覆盖
+    （类似 seqlock），否则重试。clear() 不重新分配数组，只推进 epoch，读到一半的窗口会被丢弃。
+    写线程永远不等读线程。
+    """
+
+    # 读线程拷贝期间被写线程追上时的重试次数
+    max_read_retries = 3
+    # 第一个有效样本的绝对索引，只有 skip_to() 会改变它
+    _base_index = 0
+
+
+    def __init__(self, capacity, sample_rate, channel_counts, dtypes, spill=None):
+        """
+        初始化环形缓冲区。
+
+        参数:
+            capacity (int): 每个通道保存的样本数。
+            sample_rate (int): 采样率，用于时间戳与秒之间的换算。
+            channel_counts (dict): 信号类型 -> 通道数，例如 {'amp': 32, 'digital_in': 1}。
+            dtypes (dict): 信号类型 -> 原始数据类型。
+            spill (SampleRingBuffer): 可选的下一级存储，被覆盖前的样本先写入这里（见 tiered_history.SpillStore）。
+        """
+        self.capacity = int(capacity)
+        self.sample_rate = sample_rate
+        self.channel_counts = dict(channel_counts)
+        self.dtypes = dict(dtypes)
+        self.spill = spill
+        self.timestamps = self._allocate('t', (self.capacity,), np.int64)
+        self.signals = {}
+        for signal_type, count in self.channel_counts.items():
+            self.signals[signal_type] = self._allocate(signal_type, (count, self.capacity), dtypes[signal_type])
+
+        # 已写入的总样本数，即下一个样本的绝对索引（发布游标）
+        self.total_written = 0
+        # 写线程正在覆盖的区域末尾（预留游标），读线程用它判断拷贝是否被撕裂
+        self._write_reserved = 0
+        # 每次 clear() 加一，读线程据此发现缓冲区被重置
+        self.epoch = 0
+        # 最近一次时间戳不连续（丢样本或分段回退）出现的位置，早于 oldest_index 说明保留窗口内没有间断
+        self._last_gap_index = 0
+
+        # 使用统一的日志管理器
+        self._logger = LogManager.get_logger("SampleRingBuffer")
+
+    def _allocate(self, name, shape, dtype):
+        """分配存储数组，子类可以改为其他存储（例如磁盘 memmap）"""
+        return np.zeros(shape, dtype=dtype)
+
+    @property
+    def oldest_index(self):
+        """缓冲区中最老样本的绝对索引"""
+        return max(self._base_index, self.total_written - self.capacity)
+
+    @property
+    def size(self):
+        """当前保存的样本数"""
+        return self.total_written - self.oldest_index
+
+    @property
+    def nbytes(self):
+        """各数组占用的字节数，'t' 为时间戳"""
+        usage = {'t': self.timestamps.nbytes}
+        for signal_type, array in self.signals.items():
+            usage[signal_type] = array.nbytes
+        return usage
+
+    def write(self, timestamps, signals):
+        """
+        写入一段样本。
+
+        参数:
+            timestamps (np.ndarray): 长度为 n 的 Intan 时间戳（样本计数）。
+            signals (dict): 信号类型 -> 形状为 (通道数, n) 的原始数据。
+        """
+        n = timestamps.size
+        if n == 0:
+            return
+        if n > self.capacity:
+            # 一次写入超过容量时拆开写，保证被挤出的样本都能按顺序进入下一级存储
+            for start in range(0, n, self.capacity):
+                self.write(timestamps[start:start + self.capacity],
+                           {k: v[:, start:start + self.capacity] for k, v in signals.items()})
+            return
+
+        evicted = self.total_written + n - self.capacity - self.oldest_index
+        if self.spill is not None and evicted > 0:
+            self._evict(evicted)
+
+        self._track_gaps(timestamps)
+
+        # 先预留再写，最后发布：读线程看到的 total_written 之前的数据一定已经写完
+        self._write_reserved = self.total_written + n
+        pos = self.total_written % self.capacity
+        first = min(n, self.capacity - pos)
+        self.timestamps[pos:pos + first] = timestamps[:first]
+        self.timestamps[:n - first] = timestamps[first:]
+        for signal_type, data in signals.items():
+            target = self.signals.get(signal_type)
+            if target is None:
+                continue
+            target[:, pos:pos + first] = data[:, :first]
+            target[:, :n - first] = data[:, first:]
+
+        self.total_written += n
+
+    def _track_gaps(self, timestamps):
+        """记录时间戳间断的位置，决定按时间定位时能否直接算术换算"""
+        if self.total_written > self._base_index:
+            previous = self.timestamps[(self.total_written - 1) % self.capacity]
+            if timestamps[0] != previous + 1:
+                self._last_gap_index = self.total_written
+        if timestamps[-1] - timestamps[0] != timestamps.size - 1:
+            steps = np.flatnonzero(np.diff(timestamps) != 1)
+            self._last_gap_index = self.total_written + int(steps[-1]) + 1
+
+    def _evict(self, count):
+        """把即将被覆盖的最老 count 个样本写入下一级存储"""
+        start = self.oldest_index
+        pos = start % self.capacity
+        first = min(count, self.capacity - pos)
+        for begin, end in ((pos, pos + first), (0, count - first)):
+            if end > begin:
+                self.spill.write(self.timestamps[begin:end],
+                                 {k: v[:, begin:end] for k, v in self.signals.items()})
+
+    def skip_to(self, index):
+        """
+        让空缓冲区从绝对索引 index 开始写，用于派生数据流中途加入时和原始缓冲区的索引对齐。
+        """
+        if self.total_written != self._base_index:
+            raise RuntimeError("skip_to() requires an empty buffer")
+        self._base_index = index
+        self._write_reserved = index
+        self.total_written = index
+
+    def clear(self):
+        """清除缓冲区中的所有数据（不重新分配数组，正在读的线程不会访问到失效的内存）。"""
+        self.epoch += 1
+        self._base_index = 0
+        self.total_written = 0
+        self._write_reserved = 0
+        self._last_gap_index = 0
+        if self.spill is not None:
+            self.spill.clear()
+
+    @property
+    def earliest_index(self):
+        """包含下一级存储在内，能读到的最老样本的绝对索引"""
+        if self.spill is not None and self.spill.size > 0:
+            return self.spill.oldest_index
+        return self.oldest_index
+
+    def _slice(self, array, start, stop):
+        """按绝对索引取 [start, stop) 的拷贝，处理回绕"""
+        pos = start % self.capacity
+        n = stop - start
+        if pos + n <= self.capacity:
+            return array[..., pos:pos + n].copy()
+        return np.concatenate((array[..., pos:], array[..., :pos + n - self.capacity]), axis=-1)
+
+    def read_samples(self, start, stop):
+        """
+        读取绝对索引区间 [start, stop) 内的样本，可以在写线程运行时从任意线程调用。
+
+        有下一级存储时，早于 oldest_index 的部分从下一级存储读取后拼接。
+
+        返回:
+            (dict): 't' 为时间戳，其余键为各信号类型的 (通道数, 样本数) 数组；区间不在缓冲区内、
+                    或者读的过程中被覆盖/清空时返回 None。
+        """
+        for _ in range(self.max_read_retries):
+            epoch = self.epoch
+            oldest = self.oldest_index
+            if stop <= start or stop > self.total_written:
+                return None
+
+            if start >= oldest:
+                result = self._copy_samples(start, stop)
+            elif self.spill is not None and start >= self.earliest_index:
+                result = self.spill.read_samples(start, min(stop, oldest))
+                if result is None:
+                    return None
+                if stop > oldest:
+                    newer = self._copy_samples(oldest, stop)
+                    result = {k: np.concatenate((result[k], newer[k]), axis=-1) for k in result}
+            else:
+                return None
+
+            # 拷贝完成后校验：没有被清空，且拷贝的内存区域没有被写线程覆盖
+            if self.epoch == epoch and self._write_reserved - self.capacity <= max(start, oldest):
+                return result
+
+        self._logger.debug("Reader lapped by writer while reading [{}, {})", start, stop)
+        return None
+
+    def view_samples(self, start, stop):
+        """
+        零拷贝读取 [start, stop)：区间在物理上连续时直接返回缓冲区（或共享内存）的视图，回绕时退化为拷贝。
+
+        视图在写线程追上之前有效，用完后可以用 is_intact(start) 确认期间没有被覆盖。
+
+        返回:
+            (dict): 同 read_samples；区间不在缓冲区内时返回 None。
+        """
+        if start < self.oldest_index or stop > self.total_written or stop <= start:
+            return None
+        pos = start % self.capacity
+        if pos + (stop - start) > self.capacity:
+            return self.read_samples(start, stop)
+        views = {'t': self.timestamps[pos:pos + stop - start]}
+        for signal_type, array in self.signals.items():
+            views[signal_type] = array[:, pos:pos + stop - start]
+        return views
+
+    def is_intact(self, start, epoch=None):
+        """从 start 开始的数据是否仍未被覆盖（epoch 不为 None 时同时检查缓冲区没有被清空）"""
+        if epoch is not None and epoch != self.epoch:
+            return False
+        return self._write_reserved - self.capacity <= start
+
+    def _copy_samples(self, start, stop):
+        """从内存环拷贝 [start, stop)，不做校验"""
+        result = {'t': self._slice(self.timestamps, start, stop)}
+        for signal_type, array in self.signals.items():
+            result[signal_type] = self._slice(array, start, stop)
+        return result
+
+    def index_of_timestamp(self, timestamp):
+        """
+        找到第一个时间戳不小于 timestamp 的样本的绝对索引。
+
+        保留窗口内没有间断时直接算术换算（O(1)），否则在两段有序的物理数组上二分查找（O(log n)）。
+        """
+        oldest = self.oldest_index
+        newest = self.total_written
+        if newest == oldest:
+            return newest
+
+        first_ts = self.timestamps[oldest % self.capacity]
+        if timestamp < first_ts and self.spill is not None and self.spill.size > 0:
+            return self.spill.index_of_timestamp(timestamp)
+        if self._last_gap_index <= oldest:
+            offset = int(timestamp - first_ts)
+            return min(max(oldest + offset, oldest), newest)
+
+        # 只在有效的 newest - oldest 个样本里查找：skip_to() 之后或者还没写满时，物理数组的其余位置没有写过
+        count = newest - oldest
+        pos = oldest % self.capacity
+        older = self.timestamps[pos:pos + min(count, self.capacity - pos)]
+        k = int(np.searchsorted(older, timestamp))
+        if k < older.size:
+            return oldest + k
+        newer = self.timestamps[:count - older.size]
+        return oldest + older.size + int(np.searchsorted(newer, timestamp))
+
+    def read_range(self, t_start, t_end):
+        """
+        读取时间区间 [t_start, t_end)（秒）内的样本。
+
+        返回:
+            (dict): 同 read_samples；区间与缓冲区没有交集时返回 None。
+        """
+        start = self.index_of_timestamp(int(np.ceil(t_start * self.sample_rate - 1e-6)))
+        stop = self.index_of_timestamp(int(np.ceil(t_end * self.sample_rate - 1e-6)))
+        return self.read_samples(start, stop)
+
+    def read_around(self, t, pre_ms, post_ms):
+        """
+        读取时刻 t（秒）前 pre_ms 到后 post_ms 毫秒的样本。
+        """
+        return self.read_range(t - pre_ms / 1000.0, t + post_ms / 1000.0)
@@ -0,0 +1,271 @@
+import json
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from log_manager import LogManager
+from sample_ring_buffer import SampleRingBuffer
+
+
+class SharedSampleRingBuffer(SampleRingBuffer):
+    """
+    放在 multiprocessing.shared_memory 里的样本环形缓冲区。
+
+    采集进程用它代替 SampleRingBuffer，其他进程（解码、GUI）用 attach() 以只读方式挂上同一块内存，
+    拿到的是直接指向共享内存的 NumPy 视图，N 个消费者只需要一份采集。
+
+    共享内存布局：
+        [0, 128)           int64 头部：magic、版本、序号、发布游标、预留游标、epoch、间断位置、容量、采样率、元数据长度
+        [128, data_offset) JSON 元数据：各信号类型的通道数、数据类型、通道名
+        [data_offset, ...) 时间戳数组，随后是各信号类型的 (通道数, 容量) 数组，均按 64 字节对齐
+
+    发布游标、预留游标和 epoch 直接存在头部，所以父类的无锁读写协议跨进程同样成立。
+
+    所有数组都是同一个覆盖整块共享内存的 uint8 数组的视图，close() 只丢掉引用：
+    view_samples、DataWindow.view 或处理阶段还拿着的视图会让映射一直保留，最后一个视图释放后才解除映射。
+    """
+
+    MAGIC = 0x31524342  # 'BCR1'
+    VERSION = 1
+    HEADER_BYTES = 128
+    ALIGNMENT = 64
+
+    # 头部 int64 槽位
+    _SLOT_MAGIC = 0
+    _SLOT_VERSION = 1
+    _SLOT_SEQUENCE = 2
+    _SLOT_WRITTEN = 3
+    _SLOT_RESERVED = 4
+    _SLOT_EPOCH = 5
+    _SLOT_GAP = 6
+    _SLOT_CAPACITY = 7
+    _SLOT_SAMPLE_RATE = 8  # 按 float64 解释
+    _SLOT_METADATA_BYTES = 9
+
+    def __init__(self, name, capacity, sample_rate, channel_counts, dtypes, channel_names=None, spill=None):
+        """
+        创建共享内存并初始化缓冲区（采集进程调用）。
+
+        参数:
+            name (str): 共享内存名称，消费者按这个名字 attach。
+            capacity (int): 每个通道保存的样本数。
+            sample_rate (int): 采样率。
+            channel_counts (dict): 信号类型 -> 通道数。
+            dtypes (dict): 信号类型 -> 原始数据类型。
+            channel_names (dict): 信号类型 -> 通道名列表，写入头部作为通道表。
+            spill (SampleRingBuffer): 可选的磁盘历史层，只有采集进程能查到。
+        """
+        capacity = int(capacity)
+        metadata = {
+            'signals': [
+                {
+                    'type': signal_type,
+                    'channels': count,
+                    'dtype': np.dtype(dtypes[signal_type]).str,
+                    'names': list((channel_names or {}).get(signal_type, []))
+                }
+                for signal_type, count in channel_counts.items()
+            ]
+        }
+        metadata_bytes = json.dumps(metadata).encode('utf-8')
+        data_offset = self._align(self.HEADER_BYTES + len(metadata_bytes))
+        total_bytes = self._layout_size(data_offset, capacity, metadata['signals'])
+
+        self.name = name
+        self.owner = True
+        self._logger = LogManager.get_logger("SharedSampleRingBuffer")
+        self.shm = shared_memory.SharedMemory(name=name, create=True, size=total_bytes)
+        self._map()
+        self._header[:] = 0
+        self.shm.buf[self.HEADER_BYTES:self.HEADER_BYTES + len(metadata_bytes)] = metadata_bytes
+        self._header[self._SLOT_MAGIC] = self.MAGIC
+        self._header[self._SLOT_VERSION] = self.VERSION
+        self._header[self._SLOT_CAPACITY] = capacity
+        self._header[self._SLOT_METADATA_BYTES] = len(metadata_bytes)
+        self._header[self._SLOT_SAMPLE_RATE:self._SLOT_SAMPLE_RATE + 1].view(np.float64)[0] = sample_rate
+        self.metadata = metadata
+        self._offset = data_offset
+
+        super(SharedSampleRingBuffer, self).__init__(capacity, sample_rate, channel_counts, dtypes, spill=spill)
+        self._logger.info("Publishing sample ring '{}' ({:.1f} MB)", name, total_bytes / 1e6)
+
+    @classmethod
+    def _align(cls, offset):
+        return (offset + cls.ALIGNMENT - 1) // cls.ALIGNMENT * cls.ALIGNMENT
+
+    @classmethod
+    def _layout_size(cls, data_offset, capacity, signals):
+        """按布局计算共享内存总字节数"""
+        size = cls._align(data_offset + capacity * 8)
+        for signal in signals:
+            size = cls._align(size + signal['channels'] * capacity * np.dtype(signal['dtype']).itemsize)
+        return max(size, cls.ALIGNMENT)
+
+    def _map(self):
+        """把整块共享内存包成一个 uint8 数组，最后一个引用它的视图释放时再解除映射"""
+        self._memory = np.ndarray((len(self.shm.buf),), dtype=np.uint8, buffer=self.shm.buf)
+        self._header = self._memory[:self.HEADER_BYTES].view(np.int64)
+        self._finalizer = weakref.finalize(self._memory, _release_shared_memory, self.shm)
+
+    def _allocate(self, name, shape, dtype):
+        """从共享内存中按顺序切出数组"""
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        array = self._memory[self._offset:self._offset + nbytes].view(dtype).reshape(shape)
+        self._offset = self._align(self._offset + nbytes)
+        return array
+
+    @classmethod
+    def attach(cls, name, track=False):
+        """
+        以只读方式挂上已发布的缓冲区（消费者进程调用）。
+
+        参数:
+            name (str): 共享内存名称。
+            track (bool): 是否交给本进程的 resource_tracker。只有发布进程是本进程 spawn 出来的子进程、
+                          两者共用同一个 resource_tracker 时才设为 True。
+
+        返回:
+            (SharedSampleRingBuffer): 数组都是指向共享内存的只读视图，不能 write / clear。
+        """
+        self = cls.__new__(cls)
+        self.name = name
+        self.owner = False
+        self.spill = None
+        self._logger = LogManager.get_logger("SharedSampleRingBuffer")
+        self.shm = _attach_shared_memory(name) if not track else shared_memory.SharedMemory(name=name)
+        self._map()
+        if self._header[cls._SLOT_MAGIC] != cls.MAGIC or self._header[cls._SLOT_VERSION] != cls.VERSION:
+            self.close()
+            raise ValueError("Shared memory '{}' is not a published sample ring".format(name))
+
+        metadata_bytes = int(self._header[cls._SLOT_METADATA_BYTES])
+        self.metadata = json.loads(bytes(self.shm.buf[cls.HEADER_BYTES:cls.HEADER_BYTES + metadata_bytes]).decode('utf-8'))
+        self.capacity = int(self._header[cls._SLOT_CAPACITY])
+        self.sample_rate = float(self._header[cls._SLOT_SAMPLE_RATE:cls._SLOT_SAMPLE_RATE + 1].view(np.float64)[0])
+        self.channel_counts = {s['type']: s['channels'] for s in self.metadata['signals']}
+        self.dtypes = {s['type']: np.dtype(s['dtype']) for s in self.metadata['signals']}
+
+        self._offset = cls._align(cls.HEADER_BYTES + metadata_bytes)
+        self.timestamps = self._allocate('t', (self.capacity,), np.int64)
+        self.signals = {}
+        for signal in self.metadata['signals']:
+            self.signals[signal['type']] = self._allocate(signal['type'], (signal['channels'], self.capacity),
+                                                          signal['dtype'])
+        self.timestamps.flags.writeable = False
+        for array in self.signals.values():
+            array.flags.writeable = False
+
+        self._logger.info("Attached to sample ring '{}'", name)
+        return self
+
+    # 游标存放在共享头部，父类对这些属性的读写直接落到共享内存
+    @property
+    def total_written(self):
+        return int(self._header[self._SLOT_WRITTEN])
+
+    @total_written.setter
+    def total_written(self, value):
+        self._header[self._SLOT_WRITTEN] = value
+
+    @property
+    def _write_reserved(self):
+        return int(self._header[self._SLOT_RESERVED])
+
+    @_write_reserved.setter
+    def _write_reserved(self, value):
+        self._header[self._SLOT_RESERVED] = value
+
+    @property
+    def epoch(self):
+        return int(self._header[self._SLOT_EPOCH])
+
+    @epoch.setter
+    def epoch(self, value):
+        self._header[self._SLOT_EPOCH] = value
+
+    @property
+    def _last_gap_index(self):
+        return int(self._header[self._SLOT_GAP])
+
+    @_last_gap_index.setter
+    def _last_gap_index(self, value):
+        self._header[self._SLOT_GAP] = value
+
+    @property
+    def sequence(self):
+        """每次发布一段数据加一，消费者可以据此判断有没有新数据"""
+        return int(self._header[self._SLOT_SEQUENCE])
+
+    @property
+    def channel_names(self):
+        """信号类型 -> 通道名列表"""
+        return {s['type']: s['names'] for s in self.metadata['signals']}
+
+    def write(self, timestamps, signals):
+        """写入一段样本并推进序号"""
+        if not self.owner:
+            raise RuntimeError("Attached sample ring is read-only")
+        super(SharedSampleRingBuffer, self).write(timestamps, signals)
+        self._header[self._SLOT_SEQUENCE] += 1
+
+    def clear(self):
+        """清除缓冲区中的所有数据。"""
+        if not self.owner:
+            raise RuntimeError("Attached sample ring is read-only")
+        super(SharedSampleRingBuffer, self).clear()
+        self._header[self._SLOT_SEQUENCE] += 1
+
+    def unlink(self):
+        """
+        删除共享内存的名字（采集进程重新分配缓冲区时调用），数组保持可用。
+
+        已经挂载的进程和还拿着这个对象的线程不受影响，对象和它的视图都释放后才解除映射。
+        """
+        if not self.owner:
+            raise RuntimeError("Attached sample ring cannot unlink")
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        """
+        断开共享内存，采集进程同时删除它的名字。
+
+        不会立刻解除映射：别的线程还拿着的视图继续有效，最后一个视图释放后才解除。
+        """
+        if self._memory is None:
+            return
+        self.timestamps = None
+        self.signals = {}
+        self._header = None
+        self._memory = None
+        if self.owner:
+            self.unlink()
+        if self._finalizer.alive:
+            self._logger.debug("Shared ring '{}' still has live views, unmapping when they are released", self.name)
+
+
+def _release_shared_memory(shm):
+    """最后一个视图释放后解除共享内存映射"""
+    shm.close()
+
+
+def _attach_shared_memory(name):
+    """
+    挂上已有的共享内存，不让本进程的 resource_tracker 接管它。
+
+    Python 3.13 之前，attach 的进程退出时 resource_tracker 会把共享内存一起 unlink，导致采集进程的缓冲区被删。
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    except Exception:
+        pass
+    return shm
@@ -0,0 +1,181 @@
+import numpy as np
+
+from log_manager import LogManager
+from ingest_pipeline import PipelineStage
+from event_store import EventStore
+
+# 波形片段的元数据：峰值的绝对样本索引、中心通道、峰值幅度
+SNIPPET_DTYPE = np.dtype([('index', np.int64), ('channel', np.int16), ('amplitude', np.float32)])
+
+
+def adjacent_neighbors(n_channels, n_neighbors):
+    """
+    按通道序号取相邻的 n_neighbors 个通道作为邻域（中心通道居中，靠边时整体平移）
+
+    Returns:
+        (通道数, n_neighbors) 的 int 数组
+    """
+    n_neighbors = min(n_neighbors, n_channels)
+    first = np.clip(np.arange(n_channels) - n_neighbors // 2, 0, n_channels - n_neighbors)
+    return first[:, None] + np.arange(n_neighbors)
+
+
+class SnippetStore(object):
+    """
+    预分配的尖峰波形存储：waveforms 为 (容量, 邻域通道数, 样本数) 的数组，元数据放在 EventStore 里，
+    第 k 条记录的波形在 waveforms[k % capacity]，写满后覆盖最老的。
+    """
+
+    def __init__(self, capacity, neighbors, n_samples, pre_samples):
+        """
+        Args:
+            capacity: 最多保留的片段数
+            neighbors: (通道数, 邻域通道数) 每个中心通道的邻域
+            n_samples: 每个片段的样本数
+            pre_samples: 峰值之前的样本数
+        """
+        self.capacity = int(capacity)
+        self.neighbors = np.asarray(neighbors)
+        self.pre_samples = pre_samples
+        self.events = EventStore(SNIPPET_DTYPE, capacity)
+        self.waveforms = np.zeros((self.capacity, self.neighbors.shape[1], n_samples), dtype=np.float32)
+
+    @property
+    def total_written(self):
+        return self.events.total_written
+
+    def append(self, records, waveforms):
+        """追加一批片段（按 'index' 排序）"""
+        n = records.size
+        if n == 0:
+            return
+        if n > self.capacity:
+            records, waveforms = records[n - self.capacity:], waveforms[n - self.capacity:]
+            n = self.capacity
+        first = self.events.total_written
+        # 覆盖波形之前先预留，读线程据此判断拷贝的波形是否被撕裂
+        self.events._write_reserved = first + n
+        slots = np.arange(first, first + n) % self.capacity
+        self.waveforms[slots] = waveforms
+        self.events.append(records)
+
+    def query(self, start_index=None, stop_index=None, channels=None):
+        """
+        查询峰值在 [start_index, stop_index) 内的片段
+
+        Args:
+            start_index, stop_index: 绝对样本索引，None 表示不限
+            channels: 只保留中心通道在其中的片段
+
+        Returns:
+            (records, waveforms)：波形为 (片段数, 邻域通道数, 样本数) 的拷贝，邻域通道见 neighbors[records['channel']]；
+            读的过程中被覆盖时返回 (None, None)
+        """
+        events = self.events
+        for _ in range(events.max_read_retries):
+            epoch = events.epoch
+            start = events.oldest if start_index is None else events.sequence_of_index(start_index)
+            stop = events.total_written if stop_index is None else events.sequence_of_index(stop_index)
+            start = max(start, events.oldest)
+            records = events.read(start, stop)
+            if records is None:
+                continue
+            waveforms = self.waveforms[np.arange(start, start + records.size) % self.capacity]
+            if events.epoch == epoch and events._write_reserved - self.capacity <= start:
+                break
+        else:
+            return None, None
+        if channels is not None:
+            selected = np.isin(records['channel'], channels)
+            records, waveforms = records[selected], waveforms[selected]
+        return records, waveforms
+
+    def clear(self):
+        self.events.clear()
+
+
+class SnippetExtractionStage(PipelineStage):
+    """
+    尖峰波形提取：接在尖峰检测后面，直接从滤波后的数据流（StreamRing）里批量花式索引切出每个尖峰邻域通道的波形，
+    写入预分配的 SnippetStore。峰值之后的样本还没写入的尖峰留到后面的块再提取。
+    """
+
+    name = 'snippet_extraction'
+
+    def __init__(self, detector='spike_detection', source='spikes', pre_ms=1.0, post_ms=2.0, n_neighbors=4,
+                 neighbors=None, capacity=100000):
+        """
+        Args:
+            detector: 尖峰检测阶段的名称（读 IngestChunk.events[detector]）
+            source: 切波形用的数据流
+            pre_ms, post_ms: 峰值之前、之后的时长（毫秒）
+            n_neighbors: 每个尖峰保存的邻域通道数
+            neighbors: (通道数, 邻域通道数) 的邻域表，None 时按通道序号取相邻通道
+            capacity: 片段存储容量
+        """
+        self.detector = detector
+        self.source = source
+        self.pre_ms = pre_ms
+        self.post_ms = post_ms
+        self.n_neighbors = n_neighbors
+        self.custom_neighbors = neighbors
+        self.capacity = capacity
+        self.store = None  # type: SnippetStore
+        self.lost_spikes = 0
+        self._pending = None
+        self._logger = LogManager.get_logger("SnippetExtractionStage")
+
+    def configure(self, manifest):
+        """按通道数和采样率分配片段存储"""
+        fs = manifest.sample_rate
+        self._pre = int(round(self.pre_ms * fs / 1000.0))
+        self._post = int(round(self.post_ms * fs / 1000.0))
+        if self.custom_neighbors is not None:
+            neighbors = np.asarray(self.custom_neighbors)
+        else:
+            neighbors = adjacent_neighbors(manifest.channel_counts.get('amp', 0), self.n_neighbors)
+        self.store = SnippetStore(self.capacity, neighbors, self._pre + self._post, self._pre)
+        self._pending = None
+        self.lost_spikes = 0
+
+    def process(self, chunk):
+        """提取峰值之后的数据已经写入的尖峰"""
+        spikes = chunk.events.get(self.detector)
+        if spikes is not None and spikes.size:
+            self._pending = spikes if self._pending is None else np.concatenate((self._pending, spikes))
+        if self._pending is None or self._pending.size == 0:
+            return
+        ring = chunk.ring(self.source)
+        if ring is None:
+            return
+
+        buffer = ring.sample_buffer
+        split = int(np.searchsorted(self._pending['index'], buffer.total_written - self._post, side='right'))
+        ready, self._pending = self._pending[:split], self._pending[split:]
+        # 片段开头已经被覆盖的尖峰丢弃
+        available = ready['index'] - self._pre >= buffer.oldest_index
+        self.lost_spikes += int(ready.size - np.count_nonzero(available))
+        ready = ready[available]
+        if ready.size == 0:
+            return
+
+        epoch = buffer.epoch
+        positions = (ready['index'][:, None] + np.arange(-self._pre, self._post)) % buffer.capacity
+        channels = self.store.neighbors[ready['channel']]
+        waveforms = buffer.signals['data'][channels[:, :, None], positions[:, None, :]]
+        if not buffer.is_intact(int(ready['index'][0]) - self._pre, epoch):
+            self.lost_spikes += ready.size
+            return
+
+        records = np.empty(ready.size, dtype=SNIPPET_DTYPE)
+        records['index'] = ready['index']
+        records['channel'] = ready['channel']
+        records['amplitude'] = ready['amplitude']
+        self.store.append(records, waveforms)
+
+    def reset(self):
+        """清空片段"""
+        self._pending = None
+        self.lost_spikes = 0
+        if self.store is not None:
+            self.store.clear()
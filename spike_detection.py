@@ -0,0 +1,184 @@
+import numpy as np
+
+from log_manager import LogManager
+from ingest_pipeline import PipelineStage
+from event_store import EventStore
+
+# 尖峰记录：绝对样本索引（峰值位置）、通道序号、峰值幅度（微伏）
+SPIKE_DTYPE = np.dtype([('index', np.int64), ('channel', np.int16), ('amplitude', np.float32)])
+
+# MAD 换算为高斯噪声标准差的系数
+MAD_TO_SIGMA = 1.0 / 0.6745
+
+
+class SpikeDetectionStage(PipelineStage):
+    """
+    在线阈值穿越尖峰检测，接在滤波器组后面（默认读 'spikes' 高通数据流）。
+
+    每个通道的噪声用 MAD 估计（median(|x|) / 0.6745），按 noise_time_constant 做指数平滑，阈值为 threshold_sigma 倍噪声。
+    每块数据对所有通道一次向量化地找穿越点，然后在穿越后 peak_window_ms 内找峰值作为尖峰位置；
+    峰值窗口跨块的穿越点留到下一块再处理，不会因为块边界丢尖峰。同一通道两个尖峰间隔小于 refractory_ms 时只保留前一个。
+
+    检测结果按样本索引追加到 events（EventStore），当前块的结果同时放在 IngestChunk.events[name]。
+    设置了 channel_mask 时噪声、阈值和穿越点只对可用的通道计算，被排除的通道不检测。
+    """
+
+    name = 'spike_detection'
+
+    def __init__(self, source='spikes', threshold_sigma=4.5, polarity='negative', refractory_ms=1.0,
+                 peak_window_ms=0.5, noise_time_constant=10.0, capacity=1000000):
+        """
+        Args:
+            source: 输入数据流（应为高通滤波后的数据）
+            threshold_sigma: 阈值为噪声标准差的倍数
+            polarity: 'negative'、'positive' 或 'both'
+            refractory_ms: 不应期（毫秒）
+            peak_window_ms: 穿越后找峰值的窗口（毫秒）
+            noise_time_constant: 噪声估计的平滑时间常数（秒）
+            capacity: 事件存储保留的尖峰数
+        """
+        if polarity not in ('negative', 'positive', 'both'):
+            raise ValueError("Unknown polarity: {}".format(polarity))
+        self.source = source
+        self.threshold_sigma = threshold_sigma
+        self.polarity = polarity
+        self.refractory_ms = refractory_ms
+        self.peak_window_ms = peak_window_ms
+        self.noise_time_constant = noise_time_constant
+        self.events = EventStore(SPIKE_DTYPE, capacity)
+        self.noise = None
+        self.channel_mask = None
+        self._refractory = 0
+        self._peak_window = 1
+        self._logger = LogManager.get_logger("SpikeDetectionStage")
+        self.reset()
+
+    def configure(self, manifest):
+        """按采样率换算窗口长度"""
+        fs = manifest.sample_rate
+        self._refractory = max(1, int(round(self.refractory_ms * fs / 1000.0)))
+        self._peak_window = max(1, int(round(self.peak_window_ms * fs / 1000.0)))
+        self.reset()
+
+    @property
+    def thresholds(self):
+        """各通道当前的阈值（微伏，正数），噪声还没有估计时为 None"""
+        if self.noise is None:
+            return None
+        return self.threshold_sigma * self.noise
+
+    def process(self, chunk):
+        """更新噪声估计，检测这一块里峰值窗口完整的穿越点"""
+        data = chunk.stream(self.source)
+        if data.shape[1] == 0:
+            return
+        rows = self.active_channels(data.shape[0])
+        self._update_noise(data if rows is None else data[rows], rows, chunk.sample_rate)
+
+        if self._last_spike is None:
+            self._last_spike = np.full(data.shape[0], -(1 << 62), dtype=np.int64)
+        if self._carry is None:
+            # 第一块前面补一列 0 作为"上一个已判断的位置"，0 不会超过阈值
+            self._carry = np.zeros((data.shape[0], 1), dtype=data.dtype)
+        buffer = np.concatenate((self._carry, data), axis=1)
+        buffer_start = chunk.start - self._carry.shape[1]
+        work = buffer if rows is None else buffer[rows]
+        thresholds = self.thresholds if rows is None else self.thresholds[rows]
+
+        if self.polarity == 'negative':
+            signal = -work
+        elif self.polarity == 'positive':
+            signal = work
+        else:
+            signal = np.abs(work)
+        above = signal > thresholds[:, None]
+
+        # 第 0 列是上一块最后一个已判断的位置；只判断峰值窗口完整的位置，后面的留到下一块
+        evaluate_stop = buffer.shape[1] - self._peak_window
+        if evaluate_stop <= 1:
+            self._carry = buffer
+            self._emit(chunk, np.zeros(0, dtype=SPIKE_DTYPE), None)
+            return
+        onset = above[:, 1:evaluate_stop] & ~above[:, :evaluate_stop - 1]
+        channels, positions = np.nonzero(onset)
+        spikes = self._locate_peaks(work, signal, channels, positions + 1, buffer_start, rows)
+        self._emit(chunk, spikes, buffer_start + evaluate_stop)
+        self._carry = buffer[:, evaluate_stop - 1:]
+
+    def _update_noise(self, data, rows, sample_rate):
+        """用这一块的 MAD 更新噪声估计，rows 为 data 各行对应的通道（None 表示全部通道）"""
+        estimate = np.median(np.abs(data), axis=1) * MAD_TO_SIGMA
+        if rows is None:
+            rows = slice(None)
+        elif self.noise is None:
+            # 一开始就被排除的通道还没有噪声估计，启用后直接用第一块的估计
+            self.noise = np.full(len(self.channel_mask), np.nan)
+        if self.noise is None:
+            self.noise = estimate
+        else:
+            alpha = min(1.0, data.shape[1] / (sample_rate * self.noise_time_constant))
+            noise = self.noise[rows]
+            self.noise[rows] = np.where(np.isnan(noise), estimate, noise + alpha * (estimate - noise))
+
+    def _locate_peaks(self, buffer, signal, channels, positions, buffer_start, rows=None):
+        """在穿越点之后的窗口里找峰值，批量花式索引；再按不应期去重。channels 为 buffer 的行，rows 把它换算为通道序号"""
+        if positions.size == 0:
+            return np.zeros(0, dtype=SPIKE_DTYPE)
+        window = positions[:, None] + np.arange(self._peak_window)
+        offsets = np.argmax(signal[channels[:, None], window], axis=1)
+        peaks = positions + offsets
+        amplitudes = buffer[channels, peaks]
+        if rows is not None:
+            channels = rows[channels]
+
+        order = np.lexsort((peaks, channels))
+        channels, peaks, amplitudes = channels[order], peaks[order], amplitudes[order]
+        absolute = peaks + buffer_start
+        keep = self._apply_refractory(channels, absolute)
+        channels, absolute, amplitudes = channels[keep], absolute[keep], amplitudes[keep]
+        if absolute.size:
+            # 每个通道最后保留的尖峰
+            last = np.r_[channels[1:] != channels[:-1], True]
+            self._last_spike[channels[last]] = absolute[last]
+
+        spikes = np.empty(absolute.size, dtype=SPIKE_DTYPE)
+        spikes['index'] = absolute
+        spikes['channel'] = channels
+        spikes['amplitude'] = amplitudes
+        return spikes
+
+    def _apply_refractory(self, channels, absolute):
+        """按通道、时间排好序的尖峰里去掉不应期内的；只有冲突的少数尖峰逐个处理"""
+        first_in_channel = np.r_[True, channels[1:] != channels[:-1]]
+        previous = np.where(first_in_channel, self._last_spike[channels], np.r_[0, absolute[:-1]])
+        conflict = absolute - previous < self._refractory
+        keep = ~conflict
+        for i in np.flatnonzero(conflict):
+            j = i - 1
+            while j >= 0 and channels[j] == channels[i] and not keep[j]:
+                j -= 1
+            last = absolute[j] if j >= 0 and channels[j] == channels[i] else self._last_spike[channels[i]]
+            keep[i] = absolute[i] - last >= self._refractory
+        return keep
+
+    def _emit(self, chunk, spikes, safe_before):
+        """按样本索引排序后写入事件存储；峰值可能晚于下一块最早峰值的尖峰推迟到下一块，保证存储有序"""
+        if self._deferred.size:
+            spikes = np.concatenate((self._deferred, spikes))
+        spikes = spikes[np.argsort(spikes['index'], kind='stable')]
+        if safe_before is None:
+            ready = spikes[:0]
+            self._deferred = spikes
+        else:
+            split = int(np.searchsorted(spikes['index'], safe_before))
+            ready, self._deferred = spikes[:split], spikes[split:]
+        self.events.append(ready)
+        chunk.events[self.name] = ready
+
+    def reset(self):
+        """清空噪声估计、跨块状态和事件"""
+        self.noise = None
+        self._carry = None
+        self._last_spike = None
+        self._deferred = np.zeros(0, dtype=SPIKE_DTYPE)
+        self.events.clear()
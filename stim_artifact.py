@@ -0,0 +1,197 @@
+import numpy as np
+
+from log_manager import LogManager
+from ingest_pipeline import PipelineStage
+from event_store import EventStore
+from stream_ring import StreamRing
+
+# 刺激数据（stim-*.dat，uint16）的位：0-7 电流幅度，8 符号，13 放大器稳定（amp settle），14 电荷恢复，15 顺从电压超限
+STIM_MAGNITUDE_MASK = 255
+AMP_SETTLE_BIT = 8192
+CHARGE_RECOVERY_BIT = 16384
+COMPLIANCE_LIMIT_BIT = 32768
+
+# 刺激事件：脉冲开始的绝对样本索引、刺激通道序号、第一相的电流（微安，带符号）、刺激条件序号（StimConditions，-1 为未知）
+STIM_DTYPE = np.dtype([('index', np.int64), ('channel', np.int16), ('amplitude', np.float32),
+                       ('condition', np.int16)])
+
+
+def _dilate(active, before, after):
+    """一维布尔数组膨胀：active[j] 为真时 [j - before, j + after] 都为真（cumsum 实现）"""
+    n = active.size
+    counts = np.concatenate(([0], np.cumsum(active)))
+    index = np.arange(n)
+    return counts[np.minimum(index + before + 1, n)] - counts[np.maximum(index - after, 0)] > 0
+
+
+class StimArtifactStage(PipelineStage):
+    """
+    刺激伪迹消除：根据刺激数据的电流、amp settle 和电荷恢复位找出刺激期间的样本，
+    前后各扩展 pre_ms / post_ms 后对所有通道统一置零（'zero'）或线性插值（'interpolate'），
+    输出干净的数据流（默认 'clean'），后面的尖峰检测把 source 设为它即可。
+
+    同时记录每个刺激通道的脉冲开始时刻到 events（EventStore，STIM_DTYPE），当前块的事件放在 IngestChunk.events[name]；
+    间隔小于 merge_ms 的相（双相脉冲的相间延迟）算同一个脉冲。merge_ms 默认 0.25 ms，比常用脉冲串的脉冲间隔短，
+    脉冲串里每个脉冲各记一个事件（模板相减、诱发响应都按脉冲对齐）；置零 / 插值的区间只由刺激样本决定，
+    相邻脉冲的区间重叠时自然连成一段，与事件怎么划分无关。
+    传入 conditions（stim_conditions.StimConditions）时，事件带上刺激通道当前配置的条件序号。
+
+    处理是因果的：post_ms 跨块时延续到下一块，但 pre_ms 不能修改已经输出的上一块，只在当前块内生效。
+    设置了 channel_mask 时只处理、输出可用的通道，被排除的通道输出为 0。
+    """
+
+    name = 'stim_artifact'
+
+    def __init__(self, source='amp', output='clean', stim='stim', pre_ms=0.1, post_ms=1.0, mode='interpolate',
+                 merge_ms=0.25, history_seconds=10, capacity=100000, conditions=None):
+        """
+        Args:
+            source: 输入数据流
+            output: 输出数据流名称
+            stim: 刺激数据的信号类型
+            pre_ms, post_ms: 刺激期间之前、之后额外处理的时长（毫秒）
+            mode: 'zero' 或 'interpolate'
+            merge_ms: 同一通道间隔小于它的刺激算同一个脉冲，要大于相间延迟、小于脉冲串里脉冲之间的空隙
+            history_seconds: 输出保留的历史时长（秒）
+            capacity: 刺激事件存储容量
+            conditions: StimConditions，None 时事件的条件为 -1
+        """
+        if mode not in ('zero', 'interpolate'):
+            raise ValueError("Unknown blanking mode: {}".format(mode))
+        self.source = source
+        self.output = output
+        self.stim = stim
+        self.pre_ms = pre_ms
+        self.post_ms = post_ms
+        self.mode = mode
+        self.merge_ms = merge_ms
+        self.history_seconds = history_seconds
+        self.conditions = conditions
+        self.events = EventStore(STIM_DTYPE, capacity)
+        self.stim_channel_names = []
+        self.blanked_samples = 0
+        self.rings = {}
+        self._pre = 0
+        self._post = 0
+        self._merge = 1
+        self._logger = LogManager.get_logger("StimArtifactStage")
+        self.reset()
+
+    def configure(self, manifest):
+        """换算窗口长度，分配输出数据流"""
+        fs = manifest.sample_rate
+        self._pre = int(round(self.pre_ms * fs / 1000.0))
+        self._post = int(round(self.post_ms * fs / 1000.0))
+        self._merge = max(1, int(round(self.merge_ms * fs / 1000.0)))
+        names = manifest.channel_names.get(self.source) or \
+            [str(i) for i in range(manifest.channel_counts.get(self.source, 0))]
+        self.stim_channel_names = manifest.channel_names.get(self.stim) or \
+            [str(i) for i in range(manifest.channel_counts.get(self.stim, 0))]
+        self.rings = {self.output: StreamRing(self.output, fs, names, self.history_seconds)}
+        self.reset()
+
+    def process(self, chunk):
+        """找出刺激样本，记录脉冲，处理伪迹后写入输出数据流"""
+        data = chunk.stream(self.source)
+        raw = chunk.signals.get(self.stim)
+        n = data.shape[1]
+        active = np.zeros(n, dtype=bool)
+        if raw is not None and raw.shape[0] and n:
+            status = np.bitwise_and(raw, STIM_MAGNITUDE_MASK | AMP_SETTLE_BIT | CHARGE_RECOVERY_BIT) != 0
+            self._record_pulses(chunk, status)
+            active = status.any(axis=0)
+        blank = _dilate(active, self._pre, self._post)
+        # 上一块延续过来的 post 区间
+        carried = min(self._carry_blank, n)
+        blank[:carried] = True
+        self._carry_blank -= carried
+        if active.any():
+            last_active = n - 1 - int(np.argmax(active[::-1]))
+            self._carry_blank = max(self._carry_blank, last_active + self._post + 1 - n)
+
+        rows = self.active_channels(data.shape[0])
+        work = data if rows is None else data[rows]
+        if blank.any():
+            self.blanked_samples += int(np.count_nonzero(blank))
+            last_good = self._last_good
+            if last_good is not None and rows is not None:
+                last_good = last_good[rows]
+            work = self._blank(work, blank, last_good)
+        if rows is None:
+            clean = work
+        else:
+            clean = np.zeros_like(data)
+            clean[rows] = work
+        if n:
+            self._last_good = clean[:, -1:].copy()
+        chunk.streams[self.output] = clean
+        self.rings[self.output].write(chunk.start, chunk.timestamps, clean)
+
+    def _record_pulses(self, chunk, status):
+        """每个刺激通道的脉冲开始：与上一个刺激样本的间隔不小于 merge 的刺激样本"""
+        if self._last_active is None or self._last_active.size != status.shape[0]:
+            self._last_active = np.full(status.shape[0], -(1 << 62), dtype=np.int64)
+        channels, positions = np.nonzero(status)
+        if positions.size == 0:
+            chunk.events[self.name] = np.zeros(0, dtype=STIM_DTYPE)
+            return
+        absolute = positions + chunk.start
+        first_in_channel = np.r_[True, channels[1:] != channels[:-1]]
+        previous = np.where(first_in_channel, self._last_active[channels], np.r_[0, absolute[:-1]])
+        onset = absolute - previous >= self._merge
+        last_in_channel = np.r_[channels[1:] != channels[:-1], True]
+        self._last_active[channels[last_in_channel]] = absolute[last_in_channel]
+
+        channels, positions = channels[onset], positions[onset]
+        current = chunk.stream(self.stim)
+        pulses = np.empty(positions.size, dtype=STIM_DTYPE)
+        pulses['index'] = positions + chunk.start
+        pulses['channel'] = channels
+        pulses['amplitude'] = current[channels, positions]
+        if self.conditions is not None:
+            pulses['condition'] = self.conditions.conditions_of(self.stim_channel_names)[channels]
+        else:
+            pulses['condition'] = -1
+        pulses = pulses[np.argsort(pulses['index'], kind='stable')]
+        self.events.append(pulses)
+        chunk.events[self.name] = pulses
+
+    def _blank(self, data, blank, last_good):
+        """
+        对 blank 的样本置零或插值；末尾的区间延续到下一块时先保持前一个正常值，下一块从这个值插值
+
+        Args:
+            data: (通道数, 样本数) 数据
+            blank: 每个样本是否处理
+            last_good: 同样这些通道上一块的最后一个输出样本 (通道数, 1)，没有时为 None
+        """
+        clean = data.copy()
+        if self.mode == 'zero':
+            clean[:, blank] = 0
+            return clean
+        n = blank.size
+        index = np.arange(n)
+        # 每个样本之前、之后最近的正常样本；-1 表示用上一块的最后一个输出样本
+        before = np.maximum.accumulate(np.where(blank, -1, index))
+        after = np.minimum.accumulate(np.where(blank, n, index)[::-1])[::-1]
+        bad = np.flatnonzero(blank)
+        left_index, right_index = before[bad], after[bad]
+        extended = np.concatenate((last_good if last_good is not None else data[:, :1], data), axis=1)
+        left = extended[:, left_index + 1]
+        # 右边没有正常样本（区间延续到下一块）时保持左边的值
+        has_right = right_index < n
+        right = np.where(has_right, extended[:, np.minimum(right_index, n - 1) + 1], left)
+        span = (right_index - left_index).astype(np.float32)
+        fraction = np.where(has_right, (bad - left_index) / span, 0).astype(np.float32)
+        clean[:, bad] = left + (right - left) * fraction
+        return clean
+
+    def reset(self):
+        """清空跨块状态、输出和事件"""
+        self._carry_blank = 0
+        self._last_good = None
+        self._last_active = None
+        self.blanked_samples = 0
+        self.events.clear()
+        for ring in self.rings.values():
+            ring.clear()
@@ -0,0 +1,78 @@
+import threading
+
+import numpy as np
+
+from log_manager import LogManager
+
+
+def condition_key(amplitude, duration, number_of_pulses, pulse_train=None, period_us=None):
+    """
+    由 configure_stimulation 的参数组成刺激条件的键
+
+    Args:
+        amplitude: [第一相幅度, 第二相幅度]（微安）
+        duration: [第一相脉宽, 第二相脉宽, 刺激前稳定, 刺激后稳定]（微秒）
+        number_of_pulses: 脉冲数
+        pulse_train: 'SinglePulse' 或 'PulseTrain'，None 时按脉冲数判断
+        period_us: 脉冲串周期（微秒）
+
+    Returns:
+        可以作为 dict 键的元组
+    """
+    if pulse_train is None:
+        pulse_train = 'PulseTrain' if number_of_pulses >= 2 else 'SinglePulse'
+    return (tuple(float(a) for a in amplitude), tuple(float(d) for d in duration), int(number_of_pulses),
+            pulse_train, None if period_us is None else float(period_us))
+
+
+class StimConditions(object):
+    """
+    刺激条件表：每个不同的条件键分配一个从 0 开始的序号，并记录每个刺激通道当前配置的条件。
+
+    控制刺激的一方在配置刺激时调用 set_condition（RHXRunAndStimulate.configure_stimulation 传入 conditions 即可），
+    StimArtifactStage 按刺激通道把当前的条件序号写进每个刺激事件，后面的模板、平均、PSTH 都按条件序号区分。
+    没有配置过的通道条件为 -1。
+    """
+
+    def __init__(self):
+        self.keys = []
+        self._ids = {}
+        self._current = {}
+        self._default = -1
+        self._lock = threading.Lock()
+        self._logger = LogManager.get_logger("StimConditions")
+
+    def register(self, key):
+        """返回条件键的序号，新的键分配新序号"""
+        with self._lock:
+            condition = self._ids.get(key)
+            if condition is None:
+                condition = len(self.keys)
+                self.keys.append(key)
+                self._ids[key] = condition
+                self._logger.info("Stimulation condition {}: {}", condition, key)
+            return condition
+
+    def set_condition(self, key, channels=None):
+        """
+        设置刺激通道当前的条件
+
+        Args:
+            key: 条件键（condition_key 的结果或任意可哈希的值）
+            channels: 刺激通道名列表，None 表示所有通道
+        """
+        condition = self.register(key)
+        with self._lock:
+            if channels is None:
+                self._default = condition
+                self._current = {}
+            else:
+                current = dict(self._current)
+                current.update((channel, condition) for channel in channels)
+                self._current = current
+        return condition
+
+    def conditions_of(self, channel_names):
+        """各刺激通道当前的条件序号（int16 数组）"""
+        current = self._current
+        return np.array([current.get(name, self._default) for name in channel_names], dtype=np.int16)
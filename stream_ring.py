@@ -0,0 +1,83 @@
+import numpy as np
+
+from log_manager import LogManager
+from sample_ring_buffer import SampleRingBuffer
+from ring_reader import RingReaderMixin
+
+
+class StreamRing(RingReaderMixin):
+    """
+    派生数据流（滤波、重参考、降采样等处理阶段的输出）的环形缓冲区。
+
+    内部是一个只有 'data' 一种信号的 SampleRingBuffer，时间戳按本数据流自己的采样率计数
+    （降采样 q 倍的数据流时间戳为 Intan 样本计数 // q），所以 read_range / read_around 与原始数据用同样的秒数。
+    全采样率的数据流与原始缓冲区使用同一套绝对样本索引。
+
+    读取接口与 RealTimeDataReader 相同（read_data / read_range / read_around / stream / sliding_windows），
+    返回 (data, t)：data 为 (通道数, 样本数) 的数组，t 为秒。
+    """
+
+    def __init__(self, name, sample_rate, channel_names, history_seconds, dtype=np.float32):
+        """
+        Args:
+            name: 数据流名称，同时是 IngestChunk.streams 里的键
+            sample_rate: 本数据流的采样率
+            channel_names: 通道名列表
+            history_seconds: 保留的历史时长（秒）
+            dtype: 数据类型
+        """
+        self.name = name
+        self.sample_rate = sample_rate
+        self.channel_names = list(channel_names)
+        self.history_seconds = history_seconds
+        self.sample_buffer = SampleRingBuffer(max(1, int(round(sample_rate * history_seconds))), sample_rate,
+                                              {'data': len(self.channel_names)}, {'data': dtype})
+        self._read_cursor = 0
+        self._read_epoch = 0
+        self.max_read_lag_ms = 500
+        self._stream_waiters = []
+        self._logger = LogManager.get_logger("StreamRing")
+
+    @property
+    def total_written(self):
+        """下一个样本的绝对索引"""
+        return self.sample_buffer.total_written
+
+    def write(self, start, timestamps, data):
+        """
+        写入一段数据
+
+        Args:
+            start: 第一个样本的绝对索引，缓冲区为空时据此对齐
+            timestamps: 本数据流采样率下的时间戳计数
+            data: (通道数, 样本数) 数组
+        """
+        buffer = self.sample_buffer
+        if buffer.size == 0 and buffer.total_written != start:
+            buffer.skip_to(start)
+        buffer.write(timestamps, {'data': data})
+        self._notify_streams(buffer.total_written)
+
+    def clear(self):
+        """清空数据流"""
+        self.sample_buffer.clear()
+        self._notify_streams()
+
+    def read_samples(self, start, stop):
+        """按绝对索引读取 [start, stop)，返回 (data, t)"""
+        return self._convert_window(self.sample_buffer.read_samples(start, stop))
+
+    def read_latest(self, timespan_ms):
+        """读取最新的 timespan_ms 毫秒，不影响 read_data 的消费位置，返回 (data, t)"""
+        stop = self.sample_buffer.total_written
+        start = max(stop - int(self.sample_rate * timespan_ms / 1000.0), self.sample_buffer.oldest_index)
+        return self.read_samples(start, stop)
+
+    def _check_read_ready(self):
+        return self.sample_buffer.size > 0
+
+    def _convert_window(self, window):
+        """(data, t)，t 换算为秒"""
+        if window is None:
+            return None, None
+        return window['data'], window['t'] / float(self.sample_rate)
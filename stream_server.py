@@ -0,0 +1,353 @@
+import json
+import os
+import socket
+import struct
+import threading
+from collections import deque
+
+import numpy as np
+
+from log_manager import LogManager
+from ingest_pipeline import PipelineStage
+
+# 帧头：magic、版本、标志、帧序号、首样本绝对索引、首样本 Intan 时间戳、通道数、样本数、采样率
+FRAME_HEADER = struct.Struct('<4sHHQqqIId')
+FRAME_MAGIC = b'BCSF'
+FRAME_VERSION = 1
+
+FLAG_DROPPED = 1     # 这一帧之前有数据因为客户端太慢被丢弃
+FLAG_COALESCED = 2   # 这一帧由多个采集块合并而成
+
+
+class StreamServer(PipelineStage):
+    """
+    本地实时数据流服务，作为采集管线的一个阶段运行。
+
+    每个新采集块按客户端订阅的通道切出来，以二进制帧推送：帧头（FRAME_HEADER）+ 按通道排列的原始数据
+    （通道数 × 样本数，行优先，小端）。客户端连上后先发一行 JSON 订阅，例如 {"channels": ["A-000", 5]}（通道名或序号，
+    省略表示全部），服务端回一行 JSON 说明采样率、通道名和数据类型（dtype，放大器为 '<i2'，数字 / 模拟输入为 '<u2'），
+    之后只有数据帧。订阅在每个客户端自己的线程里读取，迟迟不发订阅的客户端不会挡住其他客户端连接。
+
+    每个客户端一个发送线程和一个有界队列，加载线程只往队列里放数据，永远不会被慢客户端阻塞：
+    队列满时 'drop' 策略丢掉最老的块，'coalesce' 策略把排队的块合并成一帧（最多 max_coalesce_samples 个样本）。
+
+    channel_mask（每个通道一个 bool，通常由 ChannelQualityStage 设置）排除的通道不出现在省略 channels 的默认订阅里；
+    已经连上的客户端通道列表不变，明确订阅的通道照常推送。
+    """
+
+    name = 'stream_server'
+
+    def __init__(self, host='127.0.0.1', port=5100, unix_path=None, signal_type='amp',
+                 max_queue=32, slow_client_policy='drop', max_coalesce_samples=300000):
+        """
+        Args:
+            host: 监听地址，默认只监听本机
+            port: TCP 端口，0 表示由系统分配（启动后见 address）
+            unix_path: 指定时改用 Unix 域套接字（系统支持的话）
+            signal_type: 推送的信号类型，默认放大器数据
+            max_queue: 每个客户端最多排队的块数
+            slow_client_policy: 'drop' 或 'coalesce'
+            max_coalesce_samples: coalesce 时单帧最多的样本数，超出部分从最老的丢
+        """
+        if slow_client_policy not in ('drop', 'coalesce'):
+            raise ValueError("Unknown slow client policy: {}".format(slow_client_policy))
+        self.host = host
+        self.port = port
+        self.unix_path = unix_path
+        self.signal_type = signal_type
+        self.max_queue = max_queue
+        self.slow_client_policy = slow_client_policy
+        self.max_coalesce_samples = max_coalesce_samples
+
+        self.sample_rate = 0
+        self.channel_names = []
+        self.dtype = np.dtype(np.int16)
+        self.channel_mask = None
+        self.address = None
+        self.clients = []
+        self._clients_lock = threading.Lock()
+        self._server_socket = None
+        self._accept_thread = None
+        self.running = False
+        self._logger = LogManager.get_logger("StreamServer")
+
+    def configure(self, manifest):
+        """记录采样率、通道名和原始数据类型，用于解析订阅和握手回复"""
+        self.sample_rate = manifest.sample_rate
+        self.dtype = np.dtype(manifest.dtypes.get(self.signal_type, np.int16)).newbyteorder('<')
+        self.channel_names = list(manifest.channel_names.get(self.signal_type, []))
+        if not self.channel_names:
+            self.channel_names = [str(i) for i in range(manifest.channel_counts.get(self.signal_type, 0))]
+
+    def start(self):
+        """开始监听"""
+        if self.unix_path and hasattr(socket, 'AF_UNIX'):
+            if os.path.exists(self.unix_path):
+                os.remove(self.unix_path)
+            server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            server_socket.bind(self.unix_path)
+            self.address = self.unix_path
+        else:
+            server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            server_socket.bind((self.host, self.port))
+            self.address = server_socket.getsockname()
+        server_socket.listen(8)
+        server_socket.settimeout(0.5)
+        self._server_socket = server_socket
+        self.running = True
+        self._accept_thread = threading.Thread(target=self._accept_loop, daemon=True)
+        self._accept_thread.start()
+        self._logger.info("Stream server listening on {}", self.address)
+
+    def stop(self):
+        """停止监听并断开所有客户端"""
+        self.running = False
+        if self._accept_thread:
+            self._accept_thread.join()
+            self._accept_thread = None
+        if self._server_socket:
+            self._server_socket.close()
+            self._server_socket = None
+        with self._clients_lock:
+            clients = list(self.clients)
+        for client in clients:
+            client.close()
+        if self.unix_path and self.address == self.unix_path and os.path.exists(self.unix_path):
+            os.remove(self.unix_path)
+        self._logger.info("Stream server stopped")
+
+    def process(self, chunk):
+        """把新采集块分发给所有客户端"""
+        data = chunk.signals.get(self.signal_type)
+        if data is None or not self.clients:
+            return
+        with self._clients_lock:
+            clients = list(self.clients)
+        first_timestamp = int(chunk.timestamps[0])
+        for client in clients:
+            client.enqueue(chunk.start, first_timestamp, data)
+
+    def _accept_loop(self):
+        """接受连接，握手交给每个客户端自己的线程"""
+        while self.running:
+            try:
+                sock, peer = self._server_socket.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            threading.Thread(target=self._handshake, args=(sock, peer), daemon=True).start()
+
+    def _handshake(self, sock, peer):
+        """客户端线程：读订阅并注册，失败时断开"""
+        try:
+            self._register_client(sock, peer)
+        except Exception as e:
+            self._logger.warning("Rejected stream client {}: {}", peer, e)
+            sock.close()
+
+    def _register_client(self, sock, peer):
+        """解析订阅、回复说明并启动发送线程"""
+        sock.settimeout(5.0)
+        reader = sock.makefile('rb')
+        request = json.loads(reader.readline().decode('utf-8') or '{}')
+        reader.close()
+        sock.settimeout(None)
+
+        channel_indices = self._resolve_channels(request.get('channels'))
+        names = [self.channel_names[i] for i in channel_indices]
+        hello = {
+            'version': FRAME_VERSION,
+            'signal': self.signal_type,
+            'sample_rate': self.sample_rate,
+            'dtype': self.dtype.str,
+            'channels': names
+        }
+        sock.sendall((json.dumps(hello) + '\n').encode('utf-8'))
+
+        client = _ClientConnection(sock, peer, np.asarray(channel_indices, dtype=np.intp), self.sample_rate,
+                                   self.dtype, self.max_queue, self.slow_client_policy, self.max_coalesce_samples,
+                                   self._on_client_closed)
+        with self._clients_lock:
+            if not self.running:
+                raise RuntimeError("server stopped")
+            self.clients.append(client)
+            client.start()
+        self._logger.info("Stream client {} subscribed to {} channels", peer, len(names))
+
+    def _resolve_channels(self, channels):
+        """通道名或序号 -> 序号列表"""
+        if channels is None:
+            rows = self.active_channels(len(self.channel_names))
+            if rows is not None:
+                return [int(i) for i in rows]
+            return list(range(len(self.channel_names)))
+        indices = []
+        for channel in channels:
+            if isinstance(channel, int):
+                index = channel
+            else:
+                index = self.channel_names.index(channel)
+            if not 0 <= index < len(self.channel_names):
+                raise ValueError("Channel {} out of range".format(channel))
+            indices.append(index)
+        return indices
+
+    def _on_client_closed(self, client):
+        with self._clients_lock:
+            if client in self.clients:
+                self.clients.remove(client)
+        self._logger.info("Stream client {} disconnected ({} chunks dropped)", client.peer, client.dropped_chunks)
+
+
+class _ClientConnection(object):
+    """单个客户端：有界队列 + 发送线程"""
+
+    def __init__(self, sock, peer, channel_indices, sample_rate, dtype, max_queue, policy, max_coalesce_samples,
+                 on_close):
+        self.sock = sock
+        self.peer = peer
+        self.channel_indices = channel_indices
+        self.sample_rate = sample_rate
+        self.dtype = dtype
+        self.max_queue = max_queue
+        self.policy = policy
+        self.max_coalesce_samples = max_coalesce_samples
+        self._on_close = on_close
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._pending_flags = 0
+        self.sequence = 0
+        self.dropped_chunks = 0
+        self.running = False
+        self._thread = None
+
+    def start(self):
+        self.running = True
+        self._thread = threading.Thread(target=self._send_loop, daemon=True)
+        self._thread.start()
+
+    def enqueue(self, start, first_timestamp, data):
+        """加载线程调用：切出订阅的通道放进队列，不阻塞"""
+        selected = np.ascontiguousarray(data[self.channel_indices], dtype=self.dtype)
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                if self.policy == 'coalesce':
+                    self._coalesce()
+                else:
+                    self._queue.popleft()
+                    self.dropped_chunks += 1
+                    self._pending_flags |= FLAG_DROPPED
+            self._queue.append((start, first_timestamp, selected, 0))
+            self._cond.notify()
+
+    def _coalesce(self):
+        """把排队的块合并成一块，超过上限时丢掉最老的样本"""
+        items = list(self._queue)
+        self._queue.clear()
+        data = np.concatenate([item[2] for item in items], axis=1)
+        start, first_timestamp = items[0][0], items[0][1]
+        flags = FLAG_COALESCED
+        excess = data.shape[1] - self.max_coalesce_samples
+        if excess > 0:
+            data = np.ascontiguousarray(data[:, excess:])
+            start += excess
+            first_timestamp += excess
+            self.dropped_chunks += 1
+            flags |= FLAG_DROPPED
+        self._queue.append((start, first_timestamp, data, flags))
+
+    def _send_loop(self):
+        """发送线程：取队列、发帧"""
+        try:
+            while self.running:
+                with self._cond:
+                    while self.running and not self._queue:
+                        self._cond.wait(0.5)
+                    if not self.running:
+                        break
+                    start, first_timestamp, data, flags = self._queue.popleft()
+                    flags |= self._pending_flags
+                    self._pending_flags = 0
+                header = FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, flags, self.sequence, start, first_timestamp,
+                                           data.shape[0], data.shape[1], self.sample_rate)
+                self.sock.sendall(header)
+                self.sock.sendall(memoryview(data).cast('B'))
+                self.sequence += 1
+        except OSError:
+            pass
+        finally:
+            self.running = False
+            self.sock.close()
+            self._on_close(self)
+
+    def close(self):
+        """断开连接"""
+        with self._cond:
+            self.running = False
+            self._cond.notify()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+
+
+class StreamClient(object):
+    """
+    StreamServer 的客户端，分析机器用它订阅实时数据，不需要访问 Intan 的记录文件。
+    """
+
+    def __init__(self, host='127.0.0.1', port=5100, unix_path=None, channels=None, timeout=None):
+        """
+        Args:
+            host, port: 服务端 TCP 地址
+            unix_path: 服务端使用 Unix 域套接字时的路径
+            channels: 订阅的通道名或序号列表，None 表示全部
+            timeout: 套接字超时（秒）
+        """
+        if unix_path:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(timeout)
+            self.sock.connect(unix_path)
+        else:
+            self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.sendall((json.dumps({'channels': channels}) + '\n').encode('utf-8'))
+        self._reader = self.sock.makefile('rb')
+        self.info = json.loads(self._reader.readline().decode('utf-8'))
+        self.dtype = np.dtype(self.info.get('dtype', '<i2'))
+
+    def recv_frame(self):
+        """
+        接收一帧
+
+        Returns:
+            (header, data)：header 为帧头字段的字典，data 为 (通道数, 样本数) 的数组，类型为握手回复的 dtype；
+            连接关闭时返回 (None, None)
+        """
+        raw = self._reader.read(FRAME_HEADER.size)
+        if len(raw) < FRAME_HEADER.size:
+            return None, None
+        magic, version, flags, sequence, start, first_timestamp, n_channels, n_samples, sample_rate = \
+            FRAME_HEADER.unpack(raw)
+        if magic != FRAME_MAGIC:
+            raise ValueError("Bad frame magic: {!r}".format(magic))
+        size = n_channels * n_samples * self.dtype.itemsize
+        payload = self._reader.read(size)
+        if len(payload) < size:
+            return None, None
+        header = {
+            'version': version,
+            'flags': flags,
+            'sequence': sequence,
+            'start': start,
+            'first_timestamp': first_timestamp,
+            'sample_rate': sample_rate
+        }
+        return header, np.frombuffer(payload, dtype=self.dtype).reshape(n_channels, n_samples)
+
+    def close(self):
+        self._reader.close()
+        self.sock.close()
@@ -0,0 +1,84 @@
+# test_artifact_template.py
+import unittest
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from artifact_template import ArtifactTemplateStage
+from stim_artifact import StimArtifactStage, AMP_SETTLE_BIT
+from stim_conditions import StimConditions, condition_key
+from data_readers import StimDataReader
+from ingest_pipeline import ChannelManifest, IngestChunk, IngestPipeline
+
+
+class TestArtifactTemplate(unittest.TestCase):
+
+    def setUp(self):
+        self.fs = 30000
+        self.manifest = ChannelManifest(self.fs, {'amp': 4, 'stim': 1},
+                                        {'amp': ['A-000', 'A-001', 'A-002', 'A-003'], 'stim': ['A-000']},
+                                        {'amp': np.int16, 'stim': np.uint16})
+        n = 3 * self.fs
+        rng = np.random.default_rng(6)
+        self.signal = rng.normal(0, 10, (4, n)).astype(np.float32)
+        self.amp = self.signal.copy()
+        self.stim = np.zeros((1, n), dtype=np.uint16)
+        # 每 10 ms 一个脉冲，伪迹为指数衰减，各通道幅度不同；前一半和后一半是两种刺激条件
+        shape = 2000 * np.exp(-np.arange(90) / 15.0)
+        self.scales = {0: np.array([1.0, 0.5, -0.3, 0.1]), 1: np.array([-2.0, 1.0, 0.2, 0.4])}
+        self.onsets = np.arange(1000, n - 200, 300)
+        for onset in self.onsets:
+            condition = 0 if onset < n // 2 else 1
+            self.stim[0, onset:onset + 6] = 10 | AMP_SETTLE_BIT
+            self.amp[:, onset:onset + 90] += self.scales[condition][:, None] * shape
+
+        self.conditions = StimConditions()
+        self.conditions.set_condition(condition_key([10, 10], [200, 200, 0, 1000], 1))
+        self.pipeline = IngestPipeline()
+        self.pipeline.add_stage(StimArtifactStage(conditions=self.conditions))
+        self.stage = ArtifactTemplateStage(window_ms=3.0, n_average=20)
+        self.pipeline.add_stage(self.stage)
+        self.pipeline.configure(self.manifest)
+
+    def _run(self, size=1777):
+        half = self.amp.shape[1] // 2
+        for start, stop in ((0, half), (half, self.amp.shape[1])):
+            if start == half:
+                self.conditions.set_condition(condition_key([20, 20], [200, 200, 0, 1000], 1))
+            for begin in range(start, stop, size):
+                self._process(begin, min(begin + size, stop))
+
+    def _process(self, begin, end):
+        self.pipeline.process(IngestChunk(begin, np.arange(begin, end),
+                                          {'amp': self.amp[:, begin:end], 'stim': self.stim[:, begin:end]},
+                                          self.fs, converters={'stim': StimDataReader().convert}))
+
+    def test_templates_per_condition(self):
+        """测试两种条件分别建立模板，并与真实伪迹一致"""
+        self._run()
+        shape = 2000 * np.exp(-np.arange(90) / 15.0)
+        for condition in (0, 1):
+            template, count = self.stage.template(condition, 0)
+            self.assertGreater(count, 100)
+            # 模板按脉冲前一个样本去基线，噪声在平均后很小
+            expected = self.scales[condition][:, None] * shape
+            np.testing.assert_allclose(template, expected, atol=15)
+
+    def test_subtracts_artifact(self):
+        """测试模板稳定后的脉冲窗口里残余伪迹接近噪声水平"""
+        self._run()
+        clean, t = self.stage.rings['artifact_free'].read_samples(0, self.amp.shape[1])
+        # 每种条件跳过前面模板还没稳定的脉冲
+        half = self.amp.shape[1] // 2
+        late = self.onsets[((self.onsets > 20000) & (self.onsets < half)) | (self.onsets > half + 20000)]
+        windows = late[:, None] + np.arange(90)
+        residual = clean[:, windows] - self.signal[:, windows]
+        self.assertLess(np.abs(residual).mean(), 10)
+        # 原始数据里的伪迹远大于残余
+        self.assertGreater(np.abs(self.amp[:, windows] - self.signal[:, windows]).mean(), 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+# test_band_power.py
+import unittest
+import os
+import sys
+
+import numpy as np
+from scipy import signal
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from band_power import BandPowerStage
+from decimation import DecimatorStage
+from ingest_pipeline import ChannelManifest, IngestChunk, IngestPipeline
+
+
+def _signals(fs, seconds, seed):
+    t = np.arange(int(fs * seconds)) / float(fs)
+    rng = np.random.default_rng(seed)
+    return (np.vstack([100 * np.sin(2 * np.pi * f * t) for f in (6.0, 20.0, 50.0)])
+            + rng.normal(0, 5, (3, t.size))).astype(np.float32)
+
+
+class TestBandPower(unittest.TestCase):
+
+    def test_matches_scipy_welch(self):
+        """测试最新的频谱与 scipy.signal.welch 对最近几段的结果一致"""
+        fs = 1000
+        manifest = ChannelManifest(fs, {'amp': 3}, {'amp': ['A-000', 'A-001', 'A-002']}, {'amp': np.int16})
+        data = _signals(fs, 10, 9)
+        stage = BandPowerStage(source='amp', window_seconds=1.0, rate_hz=4, n_average=4)
+        stage.configure(manifest)
+        start = 0
+        for size in (333, 1000, 77, 4590, 4000):
+            stage.process(IngestChunk(start, np.arange(start, start + size), {'amp': data[:, start:start + size]}, fs))
+            start += size
+
+        # 10 s 数据，最后一段为 [9000, 10000)，前面 3 段步长 250
+        segment = data[:, 8250:10000]
+        frequencies, expected = signal.welch(segment, fs, window='hann', nperseg=1000, noverlap=750, axis=1)
+        np.testing.assert_allclose(stage.frequencies, frequencies)
+        np.testing.assert_allclose(stage.spectrum, expected, rtol=1e-3, atol=1e-4)
+
+        ring = stage.rings['band_power']
+        self.assertEqual(ring.sample_rate, 4)
+        # 37 段，第一段 [0, 1000) 的最后一个样本在步长 250 下是第 3 个输出样本
+        self.assertEqual(ring.total_written, 40)
+        # 索引 k 和时间戳 k 是同一个时刻：read_samples 和 read_range 读到同一个向量
+        features, t = ring.read_samples(20, 21)
+        np.testing.assert_allclose(t, [20 / 4.0])
+        np.testing.assert_array_equal(ring.read_range(5.0, 5.25)[0], features)
+        self.assertEqual(ring.channel_names[:3], ['A-000:theta', 'A-000:beta', 'A-000:gamma'])
+        # 每个通道主要的功率落在对应的频带，正弦功率为 A² / 2
+        dominant = np.argmax(stage.band_power, axis=1)
+        self.assertEqual(list(dominant), [0, 1, 2])
+        np.testing.assert_allclose(stage.band_power[[0, 1, 2], [0, 1, 2]], 5000, rtol=0.05)
+
+    def test_reads_decimated_stream(self):
+        """测试从降采样后的 LFP 数据流增量读取，输出时间与原始数据一致"""
+        fs = 30000
+        manifest = ChannelManifest(fs, {'amp': 3}, {'amp': ['A-000', 'A-001', 'A-002']}, {'amp': np.int16})
+        data = _signals(fs, 4, 10)
+        pipeline = IngestPipeline()
+        pipeline.add_stage(DecimatorStage(factor=30))
+        stage = BandPowerStage(rate_hz=10, n_average=2)
+        pipeline.add_stage(stage)
+        pipeline.configure(manifest)
+        for start in range(0, data.shape[1], 3000):
+            pipeline.process(IngestChunk(start, np.arange(start, start + 3000),
+                                         {'amp': data[:, start:start + 3000]}, fs))
+
+        self.assertEqual(stage.sample_rate, 1000)
+        self.assertIs(pipeline.get_ring('band_power'), stage.rings['band_power'])
+        features, t = stage.rings['band_power'].read_latest(1000)
+        self.assertEqual(features.shape[0], 9)
+        self.assertAlmostEqual(t[-1], 4.0, delta=0.11)
+        self.assertEqual(list(np.argmax(stage.band_power, axis=1)), [0, 1, 2])
+
+    def test_resumed_channel_does_not_average_zeros(self):
+        """测试被排除的通道恢复后，第一段的估计就是它自己的周期图，不和被排除期间的 0 平均"""
+        fs = 1000
+        manifest = ChannelManifest(fs, {'amp': 3}, {'amp': ['A-000', 'A-001', 'A-002']}, {'amp': np.int16})
+        data = _signals(fs, 6, 11)
+        stage = BandPowerStage(source='amp', window_seconds=1.0, rate_hz=4, n_average=4)
+        stage.configure(manifest)
+
+        def feed(start, stop):
+            stage.process(IngestChunk(start, np.arange(start, stop), {'amp': data[:, start:stop]}, fs))
+
+        feed(0, 3000)
+        stage.channel_mask = np.array([True, False, True])
+        feed(3000, 5000)
+        self.assertEqual(stage.spectrum[1].max(), 0)
+        stage.channel_mask = None
+        feed(5000, 5250)
+
+        _, expected = signal.welch(data[1, 4250:5250], fs, window='hann', nperseg=1000, axis=-1)
+        np.testing.assert_allclose(stage.spectrum[1], expected, rtol=1e-3, atol=1e-4)
+        _, expected = signal.welch(data[0, 3500:5250], fs, window='hann', nperseg=1000, noverlap=750, axis=-1)
+        np.testing.assert_allclose(stage.spectrum[0], expected, rtol=1e-3, atol=1e-4)
+
+
+if __name__ == '__main__':
+    unittest.main()
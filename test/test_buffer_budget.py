@@ -0,0 +1,53 @@
+# test_buffer_budget.py
+import unittest
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from buffer_budget import BufferBudget, MemoryBudgetError
+
+
+class TestBufferBudget(unittest.TestCase):
+
+    def setUp(self):
+        self.dtypes = {'amp': np.int16, 'stim': np.uint16, 'digital_in': np.uint16}
+
+    def test_capacity_scales_with_channel_count(self):
+        """测试同样的预算下，通道越多能保留的历史越短"""
+        budget = BufferBudget(2 * 1024 ** 3, history_seconds=600)
+        small = budget.plan_capacity(30000, {'amp': 32, 'stim': 0, 'digital_in': 1}, self.dtypes)
+        large = budget.plan_capacity(30000, {'amp': 512, 'stim': 512, 'digital_in': 1}, self.dtypes)
+
+        self.assertEqual(small, 30000 * 600)
+        self.assertLess(large, small)
+        frame_bytes = 8 + 2 * (512 + 512 + 1)
+        self.assertLessEqual(large * frame_bytes, 2 * 1024 ** 3)
+
+    def test_strict_policy_refuses(self):
+        """测试 strict 策略在预算不足时拒绝"""
+        budget = BufferBudget(100 * 1024 ** 2, history_seconds=600, policy='strict')
+        with self.assertRaises(MemoryBudgetError):
+            budget.plan_capacity(30000, {'amp': 128}, self.dtypes)
+
+    def test_reserved_bytes_come_off_the_budget(self):
+        """测试派生数据流占用的内存先从预算里扣掉，剩下的给原始缓冲区"""
+        counts = {'amp': 128, 'digital_in': 1}
+        frame_bytes = 8 + 2 * 129
+        budget = BufferBudget(100 * frame_bytes * 30000, history_seconds=100)
+        self.assertEqual(budget.plan_capacity(30000, counts, self.dtypes), 100 * 30000)
+        capacity = budget.plan_capacity(30000, counts, self.dtypes, reserved_bytes=40 * frame_bytes * 30000)
+        self.assertEqual(capacity, 60 * 30000)
+        strict = BufferBudget(100 * frame_bytes * 30000, history_seconds=100, policy='strict')
+        with self.assertRaises(MemoryBudgetError):
+            strict.plan_capacity(30000, counts, self.dtypes, reserved_bytes=1)
+
+    def test_unlimited_budget(self):
+        """测试不设预算时按期望历史分配"""
+        budget = BufferBudget(None, history_seconds=10)
+        self.assertEqual(budget.plan_capacity(30000, {'amp': 128}, self.dtypes), 300000)
+
+
+if __name__ == '__main__':
+    unittest.main()
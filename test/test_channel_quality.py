@@ -0,0 +1,121 @@
+# test_channel_quality.py
+import unittest
+import os
+import sys
+from unittest import mock
+
+import numpy as np
+from scipy import signal
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from channel_stats import ChannelStatsStage
+from channel_quality import ChannelQualityStage, FLAG_FLAT, FLAG_SATURATED, FLAG_NOISY
+from filter_bank import FilterBankStage
+from decimation import DecimatorStage
+from covariance import CovarianceStage
+from spike_detection import SpikeDetectionStage
+from stream_server import StreamServer
+from ingest_pipeline import ChannelManifest, IngestChunk, IngestPipeline
+
+
+class TestChannelQuality(unittest.TestCase):
+
+    def setUp(self):
+        self.fs = 30000
+        self.names = ['A-000', 'A-001', 'A-002', 'A-003', 'A-004']
+        rng = np.random.default_rng(3)
+        n = 2 * self.fs
+        self.raw = rng.normal(0, 50, (5, n))
+        self.raw[1] = 12                                   # 平直
+        self.raw[2] = rng.normal(0, 30000, n)              # 大量饱和
+        self.raw[3] = rng.normal(0, 1000, n)               # 噪声异常
+        self.raw = self.raw.clip(-32767, 32767).astype(np.int16)
+
+        self.pipeline = IngestPipeline()
+        self.quality = ChannelQualityStage(recover_seconds=0.5)
+        self.detector = SpikeDetectionStage(source='amp')
+        self.server = StreamServer()
+        for stage in (ChannelStatsStage(), self.quality, self.detector, self.server):
+            self.pipeline.add_stage(stage)
+        self.pipeline.configure(ChannelManifest(self.fs, {'amp': 5}, {'amp': self.names}, {'amp': np.int16}))
+
+    def _run(self, start, stop, size=3000):
+        for begin in range(start, stop, size):
+            raw = self.raw[:, begin:begin + size]
+            self.pipeline.process(IngestChunk(begin, np.arange(begin, begin + raw.shape[1]), {'amp': raw}, self.fs,
+                                              converters={'amp': lambda x: x * 0.195}))
+
+    def test_flags_and_applies_masks(self):
+        """测试标记平直、饱和、噪声异常的通道，并把掩码设置到下游阶段"""
+        self._run(0, 30000)
+        self.assertEqual(list(self.quality.flags), [0, FLAG_FLAT, FLAG_SATURATED | FLAG_NOISY, FLAG_NOISY, 0])
+        self.assertEqual(self.quality.bad_channels, ['A-001', 'A-002', 'A-003'])
+        expected = [True, False, False, False, True]
+        self.assertEqual(list(self.detector.channel_mask), expected)
+        self.assertEqual(self.server._resolve_channels(None), [0, 4])
+        self.assertEqual(self.server._resolve_channels(['A-001']), [1])
+        # 被排除的通道不再检测尖峰
+        spikes = self.detector.events.query()
+        self.assertTrue(np.all(np.isin(spikes['channel'], [0, 4])))
+
+    def test_channel_recovers_after_hold(self):
+        """测试通道恢复正常后保持 recover_seconds 才重新启用"""
+        self._run(0, 15000)
+        self.assertFalse(self.quality.mask[1])
+        self.raw[1, 15000:] = np.random.default_rng(4).normal(0, 50, self.raw.shape[1] - 15000)
+        self._run(15000, 27000)
+        self.assertEqual(self.quality.flags[1], 0)
+        self.assertFalse(self.quality.mask[1])
+        self._run(27000, 36000)
+        self.assertTrue(self.quality.mask[1])
+        self.assertTrue(self.detector.channel_mask[1])
+
+    def test_masked_channels_not_processed(self):
+        """测试被排除的通道不进入滤波、降采样、检测和协方差的计算，输出为 0"""
+        pipeline = IngestPipeline()
+        detector = SpikeDetectionStage()
+        decimator = DecimatorStage()
+        covariance = CovarianceStage()
+        for stage in (ChannelStatsStage(), ChannelQualityStage(), FilterBankStage(), decimator, detector,
+                      covariance):
+            pipeline.add_stage(stage)
+        pipeline.configure(ChannelManifest(self.fs, {'amp': 5}, {'amp': self.names}, {'amp': np.int16}))
+        self.pipeline = pipeline
+        self._run(0, 3000)
+        self.assertEqual(list(detector.channel_mask), [True, False, False, False, True])
+
+        rows = []
+        sosfilt = signal.sosfilt
+        noise = detector._update_noise
+
+        def spy_sosfilt(sos, x, *args, **kwargs):
+            rows.append(x.shape[0])
+            return sosfilt(sos, x, *args, **kwargs)
+
+        def spy_noise(data, *args):
+            rows.append(data.shape[0])
+            return noise(data, *args)
+
+        # 被排除通道的降采样历史填成 NaN，算过的话会被覆盖
+        decimator._history[1:4] = np.nan
+        with mock.patch('filter_bank.signal.sosfilt', spy_sosfilt), \
+                mock.patch.object(detector, '_update_noise', spy_noise):
+            self._run(3000, 30000)
+        # 每块两路滤波加一次噪声估计，都只有 2 个可用通道
+        self.assertEqual(rows, [2] * 27)
+        self.assertTrue(np.all(np.isnan(decimator._history[1:4])))
+
+        spikes = pipeline.get_ring('spikes').read_samples(3000, 30000)[0]
+        lfp = pipeline.get_ring('lfp_1k').read_samples(100, 1000)[0]
+        for output in (spikes, lfp):
+            self.assertFalse(np.any(output[1:4]))
+            self.assertTrue(np.all(np.any(output[[0, 4]], axis=1)))
+        self.assertEqual(covariance._state[0].shape, (2, 2))
+        cov = covariance.covariance()
+        self.assertEqual(cov.shape, (5, 5))
+        self.assertFalse(np.any(cov[1:4]))
+        self.assertTrue(np.all(np.isin(detector.events.query()['channel'], [0, 4])))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+# test_channel_stats.py
+import unittest
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from channel_stats import ChannelStatsStage
+from ingest_pipeline import ChannelManifest, IngestChunk
+
+
+def _to_uv(raw):
+    return raw.astype(np.float32) * 0.195
+
+
+class TestChannelStats(unittest.TestCase):
+
+    def setUp(self):
+        self.fs = 30000
+        self.manifest = ChannelManifest(self.fs, {'amp': 3}, {'amp': ['A-000', 'A-001', 'A-002']},
+                                        {'amp': np.int16})
+        rng = np.random.default_rng(2)
+        n = 2 * self.fs
+        self.raw = np.vstack([
+            rng.normal(100, 50, n),       # 正常噪声，带直流偏置
+            np.full(n, 7),                # 平直
+            rng.normal(0, 20000, n)       # 噪声很大，部分样本饱和
+        ]).clip(-32768, 32767).astype(np.int16)
+        self.raw[2, ::1000] = 32767
+
+    def _run(self, stage, sizes, start=0):
+        for size in sizes:
+            raw = self.raw[:, start:start + size]
+            stage.process(IngestChunk(start, np.arange(start, start + size), {'amp': raw}, self.fs,
+                                      converters={'amp': _to_uv}))
+            start += size
+        return start
+
+    def test_running_statistics_match_batch(self):
+        """测试全程统计与整段计算一致，块大小不影响结果"""
+        stage = ChannelStatsStage(time_constants=(0.1, 1.0))
+        stage.configure(self.manifest)
+        self.assertIsNone(stage.snapshot())
+        self._run(stage, [3000, 1, 777, 20000, 36222])
+
+        snapshot = stage.snapshot()
+        data = _to_uv(self.raw).astype(np.float64)
+        self.assertEqual(snapshot['samples'], self.raw.shape[1])
+        np.testing.assert_allclose(snapshot['mean_all'], data.mean(axis=1), rtol=1e-5, atol=1e-3)
+        np.testing.assert_allclose(snapshot['std_all'], data.std(axis=1, ddof=1), rtol=1e-5, atol=1e-3)
+        np.testing.assert_allclose(snapshot['peak_all'], np.abs(data).max(axis=1), rtol=1e-6)
+        np.testing.assert_array_equal(snapshot['saturation_count'],
+                                      np.count_nonzero(np.abs(self.raw.astype(np.int32)) >= 32767, axis=1))
+        # 指数加权统计在平稳信号上收敛到真实值
+        self.assertEqual(snapshot['std'].shape, (2, 3))
+        np.testing.assert_allclose(snapshot['std'][:, 0], 50 * 0.195, rtol=0.1)
+        np.testing.assert_allclose(snapshot['rms'][:, 0], np.hypot(100, 50) * 0.195, rtol=0.1)
+        np.testing.assert_allclose(snapshot['mean'][:, 1], 7 * 0.195, rtol=1e-5)
+        self.assertTrue(np.all(snapshot['saturation_fraction'][:, 2] > 0))
+        self.assertTrue(np.all(snapshot['saturation_fraction'][:, :2] == 0))
+
+    def test_flatline_across_chunks(self):
+        """测试连续不变的样本跨块累计，信号恢复变化后清零"""
+        stage = ChannelStatsStage(flatline_ms=50)
+        stage.configure(self.manifest)
+        start = self._run(stage, [600, 600])
+        snapshot = stage.snapshot()
+        self.assertEqual(list(snapshot['flatline']), [False, False, False])
+        self.assertAlmostEqual(snapshot['flat_ms'][1], 40.0)
+
+        self._run(stage, [600], start)
+        snapshot = stage.snapshot()
+        self.assertEqual(list(snapshot['flatline']), [False, True, False])
+        self.assertAlmostEqual(snapshot['flat_ms'][1], 60.0)
+
+        self.raw[1, start + 600:start + 900] += 1
+        self._run(stage, [600], start + 600)
+        snapshot = stage.snapshot()
+        self.assertFalse(snapshot['flatline'][1])
+        self.assertAlmostEqual(snapshot['flat_ms'][1], 10.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
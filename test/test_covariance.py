@@ -0,0 +1,68 @@
+# test_covariance.py
+import unittest
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from covariance import CovarianceStage
+from ingest_pipeline import ChannelManifest, IngestChunk
+
+
+class TestCovariance(unittest.TestCase):
+
+    def setUp(self):
+        self.fs = 1000
+        self.manifest = ChannelManifest(self.fs, {'amp': 4}, {'amp': ['A-000', 'A-001', 'A-002', 'A-003']},
+                                        {'amp': np.int16})
+        rng = np.random.default_rng(12)
+        n = 20 * self.fs
+        common = rng.normal(0, 10, n)
+        self.data = np.vstack([common + rng.normal(0, 5, n),
+                               common + rng.normal(0, 5, n) + 3000,    # 大的直流偏置
+                               rng.normal(0, 10, n),
+                               np.zeros(n)]).astype(np.float32)
+        # 后一半通道 2 变成与通道 0 反相关
+        self.data[2, n // 2:] = -common[n // 2:] + rng.normal(0, 5, n - n // 2)
+
+    def _run(self, stage, sizes, start=0):
+        for size in sizes:
+            stage.process(IngestChunk(start, np.arange(start, start + size),
+                                      {'amp': self.data[:, start:start + size]}, self.fs))
+            start += size
+        return start
+
+    def test_sliding_window_is_exact(self):
+        """测试滑动窗口的协方差与直接对最后一个窗口计算一致，包括整体重算前后"""
+        stage = CovarianceStage(source='amp', mode='window', window_seconds=2.0, recompute_seconds=7.0)
+        stage.configure(self.manifest)
+        stop = self._run(stage, [100, 1, 2999, 333, 4000, 1567, 500, 700, 300, 1200])
+        window = self.data[:, stop - 2000:stop].astype(np.float64)
+        np.testing.assert_allclose(stage.covariance(), np.cov(window, bias=True), rtol=1e-4, atol=1e-3)
+        self.assertEqual(stage.samples, 2000)
+        corr = stage.correlation()
+        np.testing.assert_allclose(corr[:3, :3], np.corrcoef(window[:3]), atol=1e-4)
+        # 平直通道的相关为 0
+        self.assertTrue(np.all(corr[3] == 0))
+        self.assertLess(corr[0, 2], -0.7)
+
+    def test_exponential_forgetting(self):
+        """测试指数遗忘：时间常数很长时等于全程协方差，较短时跟上相关结构的变化"""
+        stage = CovarianceStage(source='amp', time_constant=1e9)
+        stage.configure(self.manifest)
+        self._run(stage, [3000] * 6 + [2000])
+        np.testing.assert_allclose(stage.covariance(), np.cov(self.data.astype(np.float64), bias=True),
+                                   rtol=1e-4, atol=1e-3)
+
+        stage = CovarianceStage(source='amp', time_constant=1.0)
+        stage.configure(self.manifest)
+        stop = self._run(stage, [500] * 19)
+        self.assertGreater(stage.correlation()[0, 2], -0.2)
+        self._run(stage, [500] * 21, stop)
+        self.assertLess(stage.correlation()[0, 2], -0.7)
+        self.assertGreater(stage.correlation()[0, 1], 0.7)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+# test_data_ready.py
+import unittest
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PyQt5.QtCore import QCoreApplication
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from RealRHXDataRead import RealTimeDataReader
+
+
+class TestDataReady(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # 信号从加载线程发出，排队到主线程的事件循环里投递
+        cls.app = QCoreApplication.instance() or QCoreApplication([])
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, True)
+        self.reader = RealTimeDataReader()
+        self.addCleanup(self.reader.close)
+        self.windows = []
+        self.reader.dataReady.connect(self.windows.append)
+        self.reader.set_monitoring_directory(self.root)
+        time.sleep(0.5)
+        self.directory = os.path.join(self.root, 'segment')
+        os.makedirs(self.directory)
+        self.written = 0
+        self._write(0)
+        time.sleep(0.5)
+
+    def _write(self, n):
+        """按 Intan 的文件格式追加 n 个样本，时间戳最后写"""
+        t = np.arange(self.written, self.written + n, dtype=np.int32)
+        for i in range(32):
+            with open(os.path.join(self.directory, 'amp-A-{:03d}.dat'.format(i)), 'ab') as f:
+                f.write((t % 300 + i).astype(np.int16).tobytes())
+        with open(os.path.join(self.directory, 'board-DIGITAL-IN-01.dat'), 'ab') as f:
+            f.write((t % 2).astype(np.uint16).tobytes())
+        with open(os.path.join(self.directory, 'time.dat'), 'ab') as f:
+            f.write(t.tobytes())
+        self.written += n
+
+    def _wait_for(self, total, timeout=5.0):
+        deadline = time.time() + timeout
+        while time.time() < deadline and (not self.windows or self.windows[-1].stop < total):
+            self.app.processEvents()
+            time.sleep(0.01)
+
+    def test_windows_cover_stream_without_gaps(self):
+        """测试信号携带的句柄首尾相接，读出的数据正确"""
+        for _ in range(5):
+            self._write(3000)
+            time.sleep(0.05)
+        self._wait_for(15000)
+
+        self.assertEqual(self.windows[0].start, 0)
+        self.assertEqual(self.windows[-1].stop, 15000)
+        for previous, window in zip(self.windows, self.windows[1:]):
+            self.assertEqual(previous.stop, window.start)
+
+        amp, stim, t, digital = self.windows[-1].read(last_ms=10)
+        self.assertEqual(amp.shape, (32, 300))
+        np.testing.assert_allclose(t * 30000, np.arange(14700, 15000))
+
+    def test_rate_is_coalesced(self):
+        """测试限速期间的多块数据合并到一个句柄里"""
+        self.reader.data_ready_max_rate_hz = 1
+        self._write(3000)
+        self._wait_for(3000)
+        self._write(3000)
+        time.sleep(0.3)
+        self._write(3000)
+        self._wait_for(9000, timeout=3.0)
+
+        self.assertEqual([(w.start, w.stop) for w in self.windows], [(0, 3000), (3000, 9000)])
+        self.assertTrue(self.windows[0].is_valid())
+
+
+if __name__ == '__main__':
+    unittest.main()
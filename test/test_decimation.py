@@ -0,0 +1,67 @@
+# test_decimation.py
+import unittest
+import os
+import sys
+
+import numpy as np
+from scipy import signal
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from decimation import DecimatorStage
+from ingest_pipeline import ChannelManifest, IngestChunk
+
+
+class TestDecimator(unittest.TestCase):
+
+    def setUp(self):
+        self.fs = 30000
+        self.manifest = ChannelManifest(self.fs, {'amp': 3}, {'amp': ['A-000', 'A-001', 'A-002']},
+                                        {'amp': np.int16})
+        t = np.arange(3 * self.fs) / float(self.fs)
+        rng = np.random.default_rng(1)
+        self.data = (np.vstack([np.sin(2 * np.pi * f * t) * 100 for f in (10, 40, 120)])
+                     + rng.normal(0, 20, (3, t.size))).astype(np.float32)
+
+    def _run(self, stage, start, sizes):
+        for size in sizes:
+            stage.process(IngestChunk(start, np.arange(start, start + size),
+                                      {'amp': self.data[:, start:start + size]}, self.fs))
+            start += size
+
+    def test_matches_filter_then_downsample(self):
+        """测试多相实现与先整段 FIR 滤波再抽取一致"""
+        stage = DecimatorStage(factor=30, history_seconds=10)
+        stage.configure(self.manifest)
+        self._run(stage, 0, [3000, 1777, 1, 5222, 20000])
+
+        taps = stage._phases[:, ::-1].reshape(-1)
+        padded = np.concatenate((np.repeat(self.data[:, :1], taps.size, axis=1), self.data[:, :30000]), axis=1)
+        expected = signal.lfilter(taps, 1.0, padded, axis=1)[:, taps.size:][:, ::30]
+
+        ring = stage.rings['lfp_1k']
+        self.assertEqual(ring.sample_rate, 1000)
+        self.assertEqual(ring.total_written, 1000)
+        lfp, t = ring.read_samples(0, 1000)
+        np.testing.assert_allclose(lfp, expected, rtol=1e-3, atol=1e-2)
+        np.testing.assert_allclose(t, np.arange(1000) / 1000.0)
+
+    def test_read_data_and_alignment_mid_stream(self):
+        """测试中途开始时输出索引与原始数据对齐，并支持 read_data / read_range"""
+        stage = DecimatorStage(factor=30)
+        stage.configure(self.manifest)
+        self._run(stage, 9013, [3000] * 20)
+
+        ring = stage.rings['lfp_1k']
+        self.assertEqual(ring.sample_buffer.oldest_index, 301)
+        self.assertEqual(ring.total_written, (9013 + 60000) // 30 + 1)
+        lfp, t = ring.read_data(100)
+        self.assertEqual(lfp.shape, (3, 100))
+        lfp, t = ring.read_range(1.0, 1.5)
+        self.assertEqual(lfp.shape, (3, 500))
+        self.assertAlmostEqual(t[0], 1.0)
+        # 10 Hz 信号在通带内保留下来
+        self.assertGreater(np.abs(lfp[0]).max(), 80)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+# test_evoked_response.py
+import unittest
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from evoked_response import EvokedResponseStage
+from stim_artifact import STIM_DTYPE
+from ingest_pipeline import ChannelManifest, IngestChunk
+
+
+class TestEvokedResponse(unittest.TestCase):
+
+    def setUp(self):
+        self.fs = 30000
+        self.manifest = ChannelManifest(self.fs, {'amp': 3}, {'amp': ['A-000', 'A-001', 'A-002']},
+                                        {'amp': np.int16})
+        n = 4 * self.fs
+        rng = np.random.default_rng(7)
+        self.data = rng.normal(0, 5, (3, n)).astype(np.float32)
+        self.response = 50 * np.sin(np.arange(1500) / 100.0)
+        pulses = []
+        for i, onset in enumerate(range(200, n - 3000, 2000)):
+            stim_channel, condition = i % 2, (i // 2) % 2
+            self.data[:, onset:onset + 1500] += (stim_channel + 1) * (condition + 1) * self.response
+            pulses.append((onset, stim_channel, 10.0, condition))
+        self.pulses = np.array(pulses, dtype=STIM_DTYPE)
+
+    def _run(self, stage, size):
+        for start in range(0, self.data.shape[1], size):
+            stop = min(start + size, self.data.shape[1])
+            chunk = IngestChunk(start, np.arange(start, stop), {}, self.fs)
+            chunk.streams['clean'] = self.data[:, start:stop]
+            index = self.pulses['index']
+            chunk.events['stim_artifact'] = self.pulses[(index >= start) & (index < stop)]
+            stage.process(chunk)
+
+    def test_matches_offline_average(self):
+        """测试在线均值、标准差与离线对所有 epoch 计算的结果一致，与分块大小无关"""
+        for size in (3000, 1111):
+            stage = EvokedResponseStage(source='clean', pre_ms=5, post_ms=50)
+            stage.configure(self.manifest)
+            self._run(stage, size)
+            self.assertEqual(stage.conditions, [(0, 0), (0, 1), (1, 0), (1, 1)])
+            for condition, stim_channel in stage.conditions:
+                selected = self.pulses[(self.pulses['condition'] == condition)
+                                       & (self.pulses['channel'] == stim_channel)]
+                epochs = np.stack([self.data[:, i - 150:i + 1500] for i in selected['index']])
+                result = stage.response(condition, stim_channel)
+                self.assertEqual(result['count'], selected.size)
+                np.testing.assert_allclose(result['mean'], epochs.mean(axis=0), atol=1e-3)
+                np.testing.assert_allclose(result['std'], epochs.std(axis=0, ddof=1), rtol=1e-3)
+                self.assertAlmostEqual(result['t_ms'][150], 0.0)
+
+    def test_baseline_and_incomplete_windows(self):
+        """测试去基线，以及窗口还没结束的脉冲暂不计入"""
+        stage = EvokedResponseStage(source='clean', pre_ms=5, post_ms=50, subtract_baseline=True)
+        stage.configure(self.manifest)
+        self._run(stage, 3000)
+        result = stage.response(1, 1)
+        gain = 4 * self.response
+        np.testing.assert_allclose(result['mean'][:, 150:], np.tile(gain, (3, 1)), atol=5)
+        self.assertLess(np.abs(result['mean'][:, :150].mean()), 1e-3)
+        self.assertIsNone(stage.response(2, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
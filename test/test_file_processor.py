@@ -2,6 +2,7 @@
 import unittest
 import tempfile
 import os
+import shutil
 import sys
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -45,5 +46,58 @@ class TestFileProcessor(unittest.TestCase):
             # 清理
             os.unlink(amp_file)
 
+    def _touch(self, directory, name):
+        path = os.path.join(directory, name)
+        with open(path, 'wb') as f:
+            f.write(b'\x00\x00\x00\x00')
+        return path
+
+    def test_next_segment_is_staged(self):
+        """测试分段续接：新目录的文件预打开，当前段文件保持打开"""
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, True)
+        first = os.path.join(root, 'FileName_250101_100000')
+        second = os.path.join(root, 'FileName_250101_100500')
+        os.makedirs(first)
+        os.makedirs(second)
+
+        current = self.processor.process_new_file(self._touch(first, 'time.dat'))
+        self.processor.process_new_file(self._touch(first, 'amp-A-000.dat'))
+        staged = self.processor.process_new_file(self._touch(second, 'time.dat'))
+        self.processor.process_new_file(self._touch(second, 'amp-A-000.dat'))
+
+        self.assertEqual(self.processor.current_directory, first)
+        self.assertTrue(self.processor.has_pending_segment())
+        self.assertFalse(current.file_descriptor.closed)
+        self.assertEqual(self.processor.get_file_count_by_type('amp'), 1)
+        self.assertEqual(self.processor.get_pending_file_count_by_type('amp'), 1)
+
+        self.assertEqual(self.processor.promote_pending_segment(), second)
+        self.assertTrue(current.file_descriptor.closed)
+        self.assertFalse(staged.file_descriptor.closed)
+        self.assertFalse(self.processor.has_pending_segment())
+        self.assertIs(self.processor.get_files_by_type('timestamp')[0], staged)
+        self.assertEqual(self.processor.get_file_count_by_type('amp'), 1)
+
+        self.assertEqual(self.processor.reset(), 2)
+
+    def test_next_segment_keeps_channel_order(self):
+        """测试下一段的文件被发现的顺序不同时，切换后通道顺序与当前段一致"""
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, True)
+        first = os.path.join(root, 'FileName_250101_100000')
+        second = os.path.join(root, 'FileName_250101_100500')
+        os.makedirs(first)
+        os.makedirs(second)
+
+        for name in ('amp-A-000.dat', 'amp-A-001.dat', 'amp-A-002.dat'):
+            self.processor.process_new_file(self._touch(first, name))
+        for name in ('amp-A-002.dat', 'amp-A-000.dat', 'amp-A-001.dat'):
+            self.processor.process_new_file(self._touch(second, name))
+
+        self.processor.promote_pending_segment()
+        self.assertEqual(self.processor.get_channel_names('amp'), ['A-000', 'A-001', 'A-002'])
+        self.processor.reset()
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
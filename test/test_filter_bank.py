@@ -0,0 +1,70 @@
+# test_filter_bank.py
+import unittest
+import os
+import sys
+
+import numpy as np
+from scipy import signal
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from filter_bank import FilterBankStage
+from ingest_pipeline import ChannelManifest, IngestChunk
+
+
+class TestFilterBank(unittest.TestCase):
+
+    def setUp(self):
+        self.fs = 30000
+        self.manifest = ChannelManifest(self.fs, {'amp': 4}, {'amp': ['A-000', 'A-001', 'A-002', 'A-003']},
+                                        {'amp': np.int16})
+        rng = np.random.default_rng(0)
+        t = np.arange(2 * self.fs) / float(self.fs)
+        self.raw = (rng.normal(0, 50, (4, 2 * self.fs)) + 2000 * np.sin(2 * np.pi * 50 * t)).astype(np.int16)
+
+    def _run(self, stage, sizes):
+        start = 0
+        for size in sizes:
+            chunk = IngestChunk(start, np.arange(start, start + size), {'amp': self.raw[:, start:start + size]},
+                                self.fs, {'amp': lambda x: x * 0.195})
+            stage.process(chunk)
+            start += size
+        return chunk
+
+    def test_chunked_output_matches_continuous_filter(self):
+        """测试分块滤波与整段滤波一致（状态跨块延续）"""
+        stage = FilterBankStage(history_seconds=2)
+        stage.configure(self.manifest)
+        chunk = self._run(stage, [3000, 1234, 5766, 50000])
+
+        data = (self.raw[:, :self.fs] * 0.195).astype(np.float32)
+        sos = stage.sos['spikes']
+        zi = signal.sosfilt_zi(sos)[:, None, :] * data[:, :1][None, :, :]
+        expected = signal.sosfilt(sos, data, axis=1, zi=zi)[0]
+        spikes, t = stage.rings['spikes'].read_samples(0, self.fs)
+        np.testing.assert_allclose(spikes, expected, rtol=1e-4, atol=1e-3)
+        self.assertIs(chunk.streams['spikes'].dtype, np.dtype(np.float32))
+        self.assertEqual(stage.rings['lfp'].total_written, 2 * self.fs)
+
+    def test_notch_removes_line_noise(self):
+        """测试工频干扰被陷波去掉"""
+        stage = FilterBankStage(filters={'lfp': ('bandpass', (1, 300))}, notch_hz=50)
+        stage.configure(self.manifest)
+        self._run(stage, [3000] * 20)
+        lfp, t = stage.rings['lfp'].read_latest(500)
+        self.assertLess(np.abs(lfp).max(), 0.05 * 2000 * 0.195)
+
+    def test_ring_aligns_when_added_mid_stream(self):
+        """测试中途加入的阶段输出与原始数据索引对齐"""
+        stage = FilterBankStage()
+        stage.configure(self.manifest)
+        chunk = IngestChunk(9000, np.arange(9000, 12000), {'amp': self.raw[:, :3000]}, self.fs)
+        stage.process(chunk)
+        ring = stage.rings['spikes']
+        self.assertEqual((ring.sample_buffer.oldest_index, ring.total_written), (9000, 12000))
+        data, t = ring.read_range(0.3, 0.35)
+        self.assertEqual(data.shape, (4, 1500))
+        self.assertAlmostEqual(t[0], 0.3)
+
+
+if __name__ == '__main__':
+    unittest.main()
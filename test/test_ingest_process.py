@@ -0,0 +1,97 @@
+# test_ingest_process.py
+import unittest
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ingest_process import ProcessDataReader
+
+
+class TestProcessDataReader(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, True)
+        self.reader = ProcessDataReader('bcr_ingest_{}'.format(uuid.uuid4().hex[:8]))
+        self.addCleanup(self.reader.close)
+
+    def _write(self, directory, start, n, channels=32):
+        """按 Intan 的文件格式追加 n 个样本，时间戳最后写"""
+        t = np.arange(start, start + n, dtype=np.int32)
+        for i in range(channels):
+            with open(os.path.join(directory, 'amp-A-{:03d}.dat'.format(i)), 'ab') as f:
+                f.write((t % 300 + i).astype(np.int16).tobytes())
+        with open(os.path.join(directory, 'board-DIGITAL-IN-01.dat'), 'ab') as f:
+            f.write((t % 2).astype(np.uint16).tobytes())
+        with open(os.path.join(directory, 'time.dat'), 'ab') as f:
+            f.write(t.tobytes())
+
+    def test_child_process_ingests_into_shared_memory(self):
+        """测试子进程加载的数据通过共享内存读到，并收到新数据通知"""
+        self.assertTrue(self.reader.set_monitoring_directory(self.root))
+        directory = os.path.join(self.root, 'segment')
+        os.makedirs(directory)
+        self._write(directory, 0, 0)
+        time.sleep(0.5)
+        self._write(directory, 0, 6000)
+
+        latest = None
+        deadline = time.time() + 10
+        while (latest or 0) < 6000 and time.time() < deadline:
+            latest = self.reader.wait_for_data(timeout=1.0) or latest
+        self.assertEqual(latest, 6000)
+
+        amp, stim, t, digital = self.reader.read_data(100)
+        self.assertEqual(amp.shape, (32, 3000))
+        self.assertIsNone(stim)
+        np.testing.assert_allclose(t * 30000, np.arange(3000))
+        # 通道按文件出现的顺序排列，用共享内存里的通道表找到 A-001
+        row = self.reader.sample_buffer.channel_names['amp'].index('A-001')
+        np.testing.assert_allclose(amp[row], (np.arange(3000) % 300 + 1) * 0.195)
+
+    def _wait_for(self, total, timeout=10.0):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            latest = self.reader.wait_for_data(timeout=1.0)
+            if latest is not None and latest >= total:
+                return
+
+    def test_reallocation_attaches_new_generation(self):
+        """测试子进程重新分配缓冲区后父进程挂上新名称的一代，旧一代的视图仍然可读"""
+        self.assertTrue(self.reader.set_monitoring_directory(self.root))
+        first = os.path.join(self.root, 'segment')
+        os.makedirs(first)
+        self._write(first, 0, 0)
+        time.sleep(0.5)
+        self._write(first, 0, 3000)
+        self._wait_for(3000)
+        old = self.reader.sample_buffer
+        views = old.view_samples(0, 100)
+
+        # 换到通道更多的目录，子进程按新的通道数重新分配
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, True)
+        self.assertTrue(self.reader.set_monitoring_directory(root))
+        second = os.path.join(root, 'segment')
+        os.makedirs(second)
+        self._write(second, 0, 0, channels=33)
+        time.sleep(0.5)
+        self._write(second, 0, 3000, channels=33)
+        self._wait_for(3000)
+
+        buffer = self.reader.sample_buffer
+        self.assertEqual(buffer.channel_counts['amp'], 33)
+        self.assertEqual(old.name, self.reader.shared_memory_name + '_1')
+        self.assertEqual(buffer.name, self.reader.shared_memory_name + '_2')
+        np.testing.assert_array_equal(views['t'], np.arange(100))
+        self.assertEqual(views['amp'].shape, (32, 100))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+# test_mua_envelope.py
+import unittest
+import os
+import sys
+
+import numpy as np
+from scipy import signal
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mua_envelope import MUAEnvelopeStage
+from decimation import DecimatorStage
+from ingest_pipeline import ChannelManifest, IngestChunk, IngestPipeline
+
+
+class TestMUAEnvelope(unittest.TestCase):
+
+    def setUp(self):
+        self.fs = 30000
+        self.manifest = ChannelManifest(self.fs, {'amp': 2}, {'amp': ['A-000', 'A-001']}, {'amp': np.int16})
+        rng = np.random.default_rng(11)
+        n = 2 * self.fs
+        self.data = rng.normal(0, 5, (2, n)).astype(np.float32)
+        # 通道 0 在 [0.5 s, 1.0 s) 有强的高频活动，另外加上大的低频 LFP
+        self.data[0, 15000:30000] += rng.normal(0, 50, 15000).astype(np.float32)
+        self.data += (200 * np.sin(2 * np.pi * 5 * np.arange(n) / self.fs)).astype(np.float32)
+
+    def _run(self, stage, start, sizes):
+        for size in sizes:
+            stage.process(IngestChunk(start, np.arange(start, start + size),
+                                      {'amp': self.data[:, start - self.offset:start - self.offset + size]}, self.fs))
+            start += size
+
+    def test_matches_offline_and_chunking(self):
+        """测试与整段离线滤波后抽取一致，与分块方式无关"""
+        self.offset = 0
+        stage = MUAEnvelopeStage()
+        stage.configure(self.manifest)
+        self._run(stage, 0, [3000, 1, 29, 7777, 19193, 30000])
+
+        band = signal.sosfilt(stage._bandpass, self.data, axis=1)
+        expected = signal.sosfilt(stage._lowpass, np.abs(band), axis=1)[:, ::30]
+        ring = stage.rings['mua']
+        self.assertEqual(ring.sample_rate, 1000)
+        self.assertEqual(ring.total_written, 2000)
+        envelope, t = ring.read_samples(0, 2000)
+        np.testing.assert_allclose(envelope, expected, rtol=1e-4, atol=1e-3)
+        np.testing.assert_allclose(t, np.arange(2000) / 1000.0)
+
+    def test_envelope_tracks_activity(self):
+        """测试包络反映高频活动，不受低频 LFP 影响；中途开始时索引对齐"""
+        self.offset = 9013
+        stage = MUAEnvelopeStage()
+        stage.configure(self.manifest)
+        self._run(stage, 9013, [3000] * 20)
+        ring = stage.rings['mua']
+        self.assertEqual(ring.sample_buffer.oldest_index, 301)
+        envelope, t = ring.read_samples(301 + 700, 301 + 900)
+        quiet, t = ring.read_samples(301 + 1300, 301 + 1900)
+        self.assertGreater(envelope[0].mean(), 5 * quiet[0].mean())
+        self.assertLess(abs(envelope[1].mean() - quiet[1].mean()), quiet[1].mean())
+
+    def test_aligned_with_decimator(self):
+        """测试包络和 DecimatorStage 同一个输出索引取自同一个原始样本：冲激响应都与离线结果在 k × factor 处抽取一致"""
+        start = 9013
+        data = np.zeros((2, 30000), dtype=np.float32)
+        data[:, 12000 - start] = 1000.0     # 冲激在绝对索引 12000（30 的整数倍）
+        pipeline = IngestPipeline()
+        decimator = DecimatorStage()
+        stage = MUAEnvelopeStage()
+        pipeline.add_stage(decimator)
+        pipeline.add_stage(stage)
+        pipeline.configure(self.manifest)
+        for begin in range(0, data.shape[1], 2999):
+            stop = min(begin + 2999, data.shape[1])
+            pipeline.process(IngestChunk(start + begin, np.arange(start + begin, start + stop),
+                                         {'amp': data[:, begin:stop]}, self.fs))
+
+        # 本地索引 17 是第一个绝对索引为 30 的整数倍的样本
+        first = (-start) % 30
+        band = signal.sosfilt(stage._bandpass, data, axis=1)
+        envelope = signal.sosfilt(stage._lowpass, np.abs(band), axis=1)[:, first::30]
+        taps = signal.firwin(decimator.taps_per_phase * 30, decimator.cutoff_ratio * self.fs / 60.0, fs=self.fs)
+        lfp = signal.lfilter(taps, 1.0, data, axis=1)[:, first::30]
+
+        mua_ring, lfp_ring = stage.rings['mua'], decimator.rings['lfp_1k']
+        index = (start + first) // 30
+        self.assertEqual(mua_ring.sample_buffer.oldest_index, index)
+        self.assertEqual(lfp_ring.sample_buffer.oldest_index, index)
+        stop = min(mua_ring.total_written, lfp_ring.total_written)
+        mua, t_mua = mua_ring.read_samples(index, stop)
+        decimated, t_lfp = lfp_ring.read_samples(index, stop)
+        np.testing.assert_array_equal(t_mua, t_lfp)
+        np.testing.assert_allclose(mua, envelope[:, :stop - index], rtol=1e-4, atol=1e-3)
+        np.testing.assert_allclose(decimated, lfp[:, :stop - index], rtol=1e-4, atol=1e-3)
+        # 冲激所在的输出样本（12000 // 30）上 LFP 已经有响应，包络在它之前为 0
+        self.assertGreater(np.abs(decimated[0, 400 - index:]).max(), 1.0)
+        self.assertFalse(np.any(mua[:, :400 - index]))
+        self.assertGreater(mua[0, 400 - index], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
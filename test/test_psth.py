@@ -0,0 +1,101 @@
+# test_psth.py
+import unittest
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from psth import PSTHStage
+from event_store import EventStore
+from spike_detection import SPIKE_DTYPE
+from stim_artifact import STIM_DTYPE
+from ingest_pipeline import ChannelManifest, IngestChunk, IngestPipeline, PipelineStage
+
+
+class _Replay(PipelineStage):
+    """按块把预先生成的事件写入事件存储，模拟检测阶段"""
+
+    def __init__(self, name, records, delay=0):
+        self.name = name
+        self.records = records
+        self.delay = delay
+        self.events = EventStore(records.dtype, 100000)
+
+    def process(self, chunk):
+        index = self.records['index']
+        stop = chunk.stop - self.delay
+        self.events.append(self.records[(index >= stop - chunk.size) & (index < stop)])
+
+
+class TestPSTH(unittest.TestCase):
+
+    def setUp(self):
+        self.fs = 30000
+        self.manifest = ChannelManifest(self.fs, {'amp': 4}, {'amp': ['A-000', 'A-001', 'A-002', 'A-003']},
+                                        {'amp': np.int16})
+        rng = np.random.default_rng(8)
+        self.n = 20 * self.fs
+        onsets = np.arange(3000, self.n - 15000, 9000)
+        self.stims = np.zeros(onsets.size, dtype=STIM_DTYPE)
+        self.stims['index'] = onsets
+        self.stims['channel'] = np.arange(onsets.size) % 2
+        self.stims['condition'] = (np.arange(onsets.size) // 2) % 3
+        # 背景发放加上刺激后 10-20 ms 的诱发尖峰
+        times = [rng.integers(0, self.n, 3000)]
+        channels = [rng.integers(0, 4, 3000)]
+        for onset in onsets:
+            times.append(onset + rng.integers(300, 600, 5))
+            channels.append(rng.integers(0, 2, 5))
+        times, channels = np.concatenate(times), np.concatenate(channels)
+        order = np.argsort(times, kind='stable')
+        self.spikes = np.zeros(times.size, dtype=SPIKE_DTYPE)
+        self.spikes['index'] = times[order]
+        self.spikes['channel'] = channels[order]
+
+    def _run(self, stage, size, spike_delay=0):
+        pipeline = IngestPipeline()
+        pipeline.add_stage(_Replay('spike_detection', self.spikes, spike_delay))
+        pipeline.add_stage(_Replay('stim_artifact', self.stims))
+        pipeline.add_stage(stage)
+        pipeline.configure(self.manifest)
+        for start in range(0, self.n, size):
+            stop = min(start + size, self.n)
+            pipeline.process(IngestChunk(start, np.arange(start, stop), {}, self.fs))
+
+    def _expected(self, condition, stim_channel, pre, span, bin_size):
+        counts = np.zeros((4, span // bin_size), dtype=np.int64)
+        selected = self.stims[(self.stims['condition'] == condition) & (self.stims['channel'] == stim_channel)]
+        for onset in selected['index']:
+            offset = self.spikes['index'] - (onset - pre)
+            inside = (offset >= 0) & (offset < span)
+            np.add.at(counts, (self.spikes['channel'][inside], offset[inside] // bin_size), 1)
+        return counts, selected.size
+
+    def test_matches_brute_force(self):
+        """测试增量归并计数与逐个刺激扫描所有尖峰的结果一致"""
+        stage = PSTHStage(pre_ms=50, post_ms=200, bin_ms=5, latency_ms=10, max_conditions=2)
+        self._run(stage, 3000, spike_delay=150)
+        self.assertEqual(len(stage.conditions), 6)
+        for condition, stim_channel in stage.conditions:
+            result = stage.psth(condition, stim_channel)
+            counts, trials = self._expected(condition, stim_channel, 1500, 7500, 150)
+            self.assertEqual(result['trials'], trials)
+            np.testing.assert_array_equal(result['counts'], counts)
+        self.assertEqual(len(stage.bin_edges_ms), 51)
+        self.assertAlmostEqual(stage.bin_edges_ms[10], 0.0)
+
+    def test_evoked_bins_and_buffer_trimmed(self):
+        """测试诱发尖峰落在 10-20 ms 的时间窗，尖峰缓存不会随时间增长"""
+        stage = PSTHStage(pre_ms=10, post_ms=40, bin_ms=10, latency_ms=1)
+        self._run(stage, 1000)
+        result = stage.psth(0, 0)
+        evoked = result['counts'][:2, 2].sum()
+        # 每次刺激 5 个诱发尖峰，再加上偶尔落进来的背景尖峰
+        self.assertGreaterEqual(evoked, 5 * result['trials'])
+        self.assertLess(evoked, 6 * result['trials'])
+        self.assertLess(stage._spikes.size, 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
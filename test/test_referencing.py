@@ -0,0 +1,68 @@
+# test_referencing.py
+import unittest
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from referencing import ReferenceStage, port_groups
+from ingest_pipeline import ChannelManifest, IngestChunk
+
+
+class TestReference(unittest.TestCase):
+
+    def setUp(self):
+        self.fs = 30000
+        self.names = ['A-000', 'A-001', 'A-002', 'B-000', 'B-001', 'B-002']
+        self.manifest = ChannelManifest(self.fs, {'amp': 6}, {'amp': self.names}, {'amp': np.int16})
+        self.data = np.random.default_rng(5).normal(0, 20, (6, 6000)).astype(np.float32)
+
+    def _run(self, stage, sizes=(2000, 1000, 3000)):
+        start = 0
+        for size in sizes:
+            chunk = IngestChunk(start, np.arange(start, start + size), {'amp': self.data[:, start:start + size]},
+                                self.fs)
+            stage.process(chunk)
+            start += size
+        return chunk
+
+    def test_global_car(self):
+        """测试全局共平均参考写入数据流和 chunk.streams"""
+        stage = ReferenceStage()
+        stage.configure(self.manifest)
+        chunk = self._run(stage)
+        expected = self.data - self.data.mean(axis=0)
+        np.testing.assert_allclose(chunk.streams['referenced'], expected[:, 3000:], atol=1e-4)
+        data, t = stage.rings['referenced'].read_samples(0, 6000)
+        np.testing.assert_allclose(data, expected, atol=1e-4)
+
+    def test_stale_mask_is_ignored(self):
+        """测试长度与通道数不符的掩码（上一个通道清单留下的）被忽略，按全部通道计算"""
+        expected = self.data - self.data.mean(axis=0)
+        for mask in ([True, False, True], [True] * 5 + [False] * 4):
+            stage = ReferenceStage()
+            stage.configure(self.manifest)
+            stage.channel_mask = np.array(mask)
+            self.assertIsNone(stage.active_channels(6))
+            chunk = self._run(stage)
+            np.testing.assert_allclose(chunk.streams['referenced'], expected[:, 3000:], atol=1e-4)
+
+    def test_port_groups_respect_mask(self):
+        """测试按端口分组，被排除的通道不参与参考，自己的输出为 0"""
+        self.assertEqual(port_groups(self.names), {'A': [0, 1, 2], 'B': [3, 4, 5]})
+        for method, reduce in (('mean', np.mean), ('median', np.median)):
+            stage = ReferenceStage(method=method, groups='port')
+            stage.configure(self.manifest)
+            stage.channel_mask = np.array([True, False, True, True, True, True])
+            self._run(stage)
+            data, t = stage.rings['referenced'].read_samples(0, 6000)
+            reference_a = reduce(self.data[[0, 2]], axis=0)
+            reference_b = reduce(self.data[3:], axis=0)
+            np.testing.assert_allclose(data[[0, 2]], self.data[[0, 2]] - reference_a, atol=1e-4)
+            self.assertFalse(np.any(data[1]))
+            np.testing.assert_allclose(data[3:], self.data[3:] - reference_b, atol=1e-4)
+
+
+if __name__ == '__main__':
+    unittest.main()
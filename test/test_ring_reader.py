@@ -0,0 +1,151 @@
+# test_ring_reader.py
+import unittest
+import asyncio
+import os
+import sys
+import threading
+import time
+import uuid
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data_readers import DataReaderFactory
+from log_manager import LogManager
+from ring_reader import RingReaderMixin, DataWindow
+from sample_ring_buffer import SampleRingBuffer
+from shared_ring import SharedSampleRingBuffer
+
+
+class _RingReader(RingReaderMixin):
+    """只有样本缓冲区的读取器，写入由测试线程完成"""
+
+    def __init__(self, capacity=30000):
+        self.sample_rate = 30000
+        self.sample_buffer = SampleRingBuffer(capacity, self.sample_rate, {'amp': 2, 'stim': 0},
+                                              {'amp': np.int16, 'stim': np.uint16})
+        self.reader_factory = DataReaderFactory()
+        self._read_cursor = 0
+        self._read_epoch = 0
+        self.max_read_lag_ms = 500
+        self._stream_waiters = []
+        self._logger = LogManager.get_logger("TestRingReader")
+
+    def _check_read_ready(self):
+        return True
+
+    def write(self, n):
+        start = self.sample_buffer.total_written
+        t = np.arange(start, start + n, dtype=np.int64)
+        self.sample_buffer.write(t, {'amp': np.vstack([t, -t]).astype(np.int16), 'stim': np.zeros((0, n), np.uint16)})
+        self._notify_streams(self.sample_buffer.total_written)
+
+
+class TestStream(unittest.TestCase):
+
+    def _feed(self, reader, blocks, n, interval):
+        def run():
+            for _ in range(blocks):
+                time.sleep(interval)
+                reader.write(n)
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def test_windows_hop_over_live_data(self):
+        """测试重叠窗口按 hop 前进，数据正确"""
+        reader = _RingReader()
+        reader.write(1000)
+
+        async def consume():
+            windows = []
+            async for window in reader.stream(10, 5):
+                windows.append((window.start, window.stop, window.read()[2]))
+                if len(windows) == 6:
+                    break
+            return windows
+
+        feeder = self._feed(reader, 20, 150, 0.005)
+        windows = asyncio.run(consume())
+        feeder.join()
+
+        self.assertEqual([(w[0], w[1]) for w in windows], [(1000 + 150 * k, 1300 + 150 * k) for k in range(6)])
+        np.testing.assert_allclose(windows[2][2] * 30000, np.arange(1300, 1600))
+        self.assertEqual(reader._stream_waiters, [])
+
+    def test_slow_consumer_reports_backpressure(self):
+        """测试消费者太慢时报告积压，超过上限后跳到最新"""
+        reader = _RingReader()
+        reader.write(1000)
+
+        async def consume():
+            stream = reader.stream(10, max_backlog_ms=50)
+            asyncio.get_running_loop().call_later(0.01, reader.write, 300)
+            windows = [await stream.__anext__()]
+            reader.write(1200)
+            windows.append(await stream.__anext__())
+            reader.write(3000)
+            windows.append(await stream.__anext__())
+            await stream.aclose()
+            return windows
+
+        first, second, third = asyncio.run(consume())
+
+        self.assertEqual((first.start, first.backlog_samples, first.dropped_samples), (1000, 0, 0))
+        self.assertEqual((second.start, second.backlog_samples), (1300, 900))
+        self.assertAlmostEqual(second.backlog_ms, 30.0)
+        self.assertEqual((third.start, third.stop, third.dropped_samples), (5200, 5500, 3600))
+        self.assertEqual(reader._stream_waiters, [])
+
+
+class TestSlidingWindows(unittest.TestCase):
+
+    def test_overlapping_windows_are_views(self):
+        """测试重叠窗口直接指向缓冲区，不回绕时零拷贝"""
+        reader = _RingReader(capacity=30000)
+        reader.write(100)
+        windows = reader.sliding_windows(200, 20, timeout=1.0)
+        threading.Timer(0.05, reader.write, (6000,)).start()
+        window = next(windows)
+        windows.close()
+
+        self.assertEqual((window.start, window.stop), (100, 6100))
+        view = window.view()
+        self.assertTrue(np.shares_memory(view['amp'], reader.sample_buffer.signals['amp']))
+        np.testing.assert_array_equal(view['t'], np.arange(100, 6100))
+        self.assertTrue(window.is_valid())
+        self.assertEqual(reader._stream_waiters, [])
+
+    def test_hop_smaller_than_window(self):
+        """测试窗口长度 W、间隔 H 时每 H 个样本产出一个窗口"""
+        reader = _RingReader(capacity=30000)
+        reader.write(10)
+        reader.write(6000 + 600 * 3)
+        starts = [w.start for w in reader.sliding_windows(200, 20, timeout=0)]
+        self.assertEqual(starts, [])
+
+        windows = reader.sliding_windows(200, 20, timeout=0.5)
+        threading.Timer(0.05, reader.write, (6000 + 600 * 3,)).start()
+        starts = [w.start for w in windows]
+        self.assertEqual(starts, [7810 + 600 * k for k in range(4)])
+
+    def test_window_after_reallocation(self):
+        """测试缓冲区重新分配（旧的共享缓冲区已经 close）后，之前发出的句柄返回 None 而不是报错"""
+        reader = _RingReader()
+        reader.sample_buffer = SharedSampleRingBuffer('bcr_test_{}'.format(uuid.uuid4().hex[:8]), 1000, 30000,
+                                                      {'amp': 2, 'stim': 0}, {'amp': np.int16, 'stim': np.uint16})
+        reader.write(100)
+        window = DataWindow(reader, 0, 100, reader.sample_buffer.epoch)
+        self.assertIsNotNone(window.view())
+
+        reader.sample_buffer.close()
+        reader.sample_buffer = SampleRingBuffer(1000, 30000, {'amp': 2, 'stim': 0},
+                                                {'amp': np.int16, 'stim': np.uint16})
+        self.assertIsNone(window.view())
+        self.assertIsNone(window.samples())
+        self.assertEqual(window.read(), (None, None, None, None))
+        self.assertFalse(window.is_valid())
+
+
+if __name__ == '__main__':
+    unittest.main()
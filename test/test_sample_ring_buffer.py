@@ -0,0 +1,133 @@
+# test_sample_ring_buffer.py
+import unittest
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sample_ring_buffer import SampleRingBuffer
+
+
+class TestSampleRingBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.buffer = SampleRingBuffer(1000, 1000, {'amp': 2, 'digital_in': 1},
+                                       {'amp': np.int16, 'digital_in': np.uint16})
+
+    def _write(self, timestamps):
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        amp = np.vstack((timestamps, -timestamps)).astype(np.int16)
+        self.buffer.write(timestamps, {'amp': amp, 'digital_in': (timestamps % 2)[None, :].astype(np.uint16)})
+
+    def test_wraparound(self):
+        """测试回绕后按绝对索引读取"""
+        for start in range(0, 2500, 300):
+            self._write(np.arange(start, start + 300))
+
+        self.assertEqual(self.buffer.total_written, 2700)
+        self.assertEqual(self.buffer.oldest_index, 1700)
+        self.assertIsNone(self.buffer.read_samples(1600, 1800))
+
+        window = self.buffer.read_samples(1900, 2100)
+        np.testing.assert_array_equal(window['t'], np.arange(1900, 2100))
+        np.testing.assert_array_equal(window['amp'][1], -np.arange(1900, 2100))
+
+    def test_read_range_without_gaps(self):
+        """测试时间戳连续时的算术定位"""
+        self._write(np.arange(500, 1400))
+
+        window = self.buffer.read_range(0.6, 0.7)
+        np.testing.assert_array_equal(window['t'], np.arange(600, 700))
+
+        window = self.buffer.read_around(1.0, 20, 10)
+        np.testing.assert_array_equal(window['amp'][0], np.arange(980, 1010))
+
+    def test_read_range_with_gaps(self):
+        """测试时间戳有间断时的二分查找定位"""
+        self._write(np.arange(0, 600))
+        self._write(np.arange(700, 1000))
+        self._write(np.concatenate((np.arange(1000, 1100), np.arange(1200, 1400))))
+
+        window = self.buffer.read_range(0.65, 0.75)
+        np.testing.assert_array_equal(window['t'], np.arange(700, 750))
+
+        window = self.buffer.read_range(1.05, 1.25)
+        np.testing.assert_array_equal(window['t'], np.concatenate((np.arange(1050, 1100), np.arange(1200, 1250))))
+
+        self.assertIsNone(self.buffer.read_range(2.0, 3.0))
+
+    def test_timestamp_search_after_skip_to(self):
+        """测试 skip_to() 之后没写满的缓冲区有间断时，只在有效样本里查找，不会落到没写过的位置"""
+        # 先写满一遍再清空，物理数组里留下旧的时间戳
+        self._write(np.arange(0, 1000))
+        for base in (2500, 2900):
+            self.buffer.clear()
+            self.buffer.skip_to(base)
+            self._write(np.arange(5000, 5050))
+            self._write(np.arange(5100, 5250))
+            self.assertEqual(self.buffer.oldest_index, base)
+            self.assertEqual(self.buffer.index_of_timestamp(4000), base)
+            self.assertEqual(self.buffer.index_of_timestamp(5120), base + 70)
+            self.assertEqual(self.buffer.index_of_timestamp(6000), base + 200)
+
+            window = self.buffer.read_range(5.04, 5.11)
+            np.testing.assert_array_equal(window['t'], np.r_[5040:5050, 5100:5110])
+            self.assertIsNone(self.buffer.read_range(6.0, 7.0))
+
+    def test_concurrent_readers_never_see_torn_windows(self):
+        """单写多读压力测试：写线程不停覆盖，读线程读到的窗口必须完整一致"""
+        buffer = SampleRingBuffer(4096, 30000, {'amp': 4}, {'amp': np.int16})
+        stop = threading.Event()
+        stats = {'reads': 0, 'rejected': 0, 'corrupted': 0}
+        lock = threading.Lock()
+
+        def writer():
+            start = 0
+            while not stop.is_set():
+                timestamps = np.arange(start, start + 300, dtype=np.int64)
+                amp = ((timestamps[None, :] + np.arange(4)[:, None]) % 30000).astype(np.int16)
+                buffer.write(timestamps, {'amp': amp})
+                start += 300
+                if buffer.epoch == 0 and start > 10 ** 6:
+                    buffer.clear()
+
+        def reader():
+            reads = rejected = corrupted = 0
+            while not stop.is_set():
+                newest = buffer.total_written
+                begin = max(newest - 3500, 0)
+                window = buffer.read_samples(begin, begin + 600)
+                reads += 1
+                if window is None:
+                    rejected += 1
+                    continue
+                t = window['t']
+                expected = ((t[None, :] + np.arange(4)[:, None]) % 30000).astype(np.int16)
+                if np.any(np.diff(t) != 1) or not np.array_equal(window['amp'], expected):
+                    corrupted += 1
+            with lock:
+                stats['reads'] += reads
+                stats['rejected'] += rejected
+                stats['corrupted'] += corrupted
+
+        threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(4)]
+        t_start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(1.0)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - t_start
+
+        summary = "{} reads in {:.2f}s ({:.0f} reads/s), {} rejected, {} written".format(
+            stats['reads'], elapsed, stats['reads'] / elapsed, stats['rejected'], buffer.total_written)
+        self.assertGreater(stats['reads'], 0, summary)
+        self.assertEqual(stats['corrupted'], 0, summary)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+# test_segment_rollover.py
+import unittest
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from RealRHXDataRead import RealTimeDataReader
+
+
+class TestSegmentRollover(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, True)
+        self.reader = RealTimeDataReader()
+        self.addCleanup(self.reader.close)
+        self.reader.set_monitoring_directory(self.root)
+        time.sleep(0.5)
+
+    def _write(self, directory, t):
+        """按 Intan 的文件格式在 directory 里追加时间戳为 t 的样本，时间戳最后写"""
+        t = np.asarray(t, dtype=np.int32)
+        for i in range(32):
+            with open(os.path.join(directory, 'amp-A-{:03d}.dat'.format(i)), 'ab') as f:
+                f.write((t % 300 + i).astype(np.int16).tobytes())
+        with open(os.path.join(directory, 'board-DIGITAL-IN-01.dat'), 'ab') as f:
+            f.write((t % 2).astype(np.uint16).tobytes())
+        with open(os.path.join(directory, 'time.dat'), 'ab') as f:
+            f.write(t.tobytes())
+
+    def _segment(self, name):
+        directory = os.path.join(self.root, name)
+        os.makedirs(directory)
+        return directory
+
+    def _wait_for(self, total, timeout=5.0):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            buffer = self.reader.sample_buffer
+            if buffer is not None and buffer.total_written >= total:
+                return
+            time.sleep(0.01)
+
+    def _run(self, second_start):
+        """第一段写 10500 个样本，第二段从 second_start 开始再写 6000 个，返回读到的时间戳和第一段之后的 epoch"""
+        first = self._segment('segment-1')
+        self._write(first, [])
+        time.sleep(0.5)
+        for start in range(0, 10500, 3500):
+            self._write(first, np.arange(start, start + 3500))
+            time.sleep(0.05)
+        self._wait_for(10500)
+        epoch = self.reader.sample_buffer.epoch
+
+        second = self._segment('segment-2')
+        self._write(second, [])
+        time.sleep(0.5)
+        for start in range(second_start, second_start + 6000, 3000):
+            self._write(second, np.arange(start, start + 3000))
+            time.sleep(0.05)
+        self._wait_for(16500)
+        return self.reader.sample_buffer.read_samples(0, 16500), epoch
+
+    def test_allocates_once_channel_set_is_stable(self):
+        """测试通道文件陆续出现时不会每来一个文件重建缓冲区，时间戳开始写入后按最终的通道数分配一次"""
+        allocations = []
+        allocate = self.reader._allocate_sample_buffer
+
+        def spy(channel_counts):
+            allocations.append(dict(channel_counts))
+            allocate(channel_counts)
+
+        self.reader._allocate_sample_buffer = spy
+        directory = self._segment('segment-1')
+        for name in ['time.dat', 'board-DIGITAL-IN-01.dat'] + ['amp-A-{:03d}.dat'.format(i) for i in range(64)]:
+            open(os.path.join(directory, name), 'ab').close()
+            time.sleep(0.005)
+        time.sleep(0.5)
+        self.assertIsNone(self.reader.sample_buffer)
+
+        t = np.arange(3000, dtype=np.int32)
+        for i in range(64):
+            with open(os.path.join(directory, 'amp-A-{:03d}.dat'.format(i)), 'ab') as f:
+                f.write((t % 300 + i).astype(np.int16).tobytes())
+        with open(os.path.join(directory, 'board-DIGITAL-IN-01.dat'), 'ab') as f:
+            f.write((t % 2).astype(np.uint16).tobytes())
+        with open(os.path.join(directory, 'time.dat'), 'ab') as f:
+            f.write(t.tobytes())
+        self._wait_for(3000)
+        self.assertEqual(allocations, [{'amp': 64, 'stim': 0, 'digital_in': 1}])
+        self.assertEqual(self.reader.sample_buffer.total_written, 3000)
+
+    def test_continuing_counter(self):
+        """测试下一段的时间戳接着上一段时直接续接，缓冲区不清空"""
+        window, epoch = self._run(10500)
+        buffer = self.reader.sample_buffer
+        self.assertEqual(buffer.total_written, 16500)
+        self.assertEqual(buffer.epoch, epoch)
+        np.testing.assert_array_equal(window['t'], np.arange(16500))
+        self.assertEqual(self.reader._timestamp_offset, 0)
+
+    def test_restarted_counter(self):
+        """测试下一段的时间戳从 0 重新开始时整段平移，时间戳仍然单调连续"""
+        window, epoch = self._run(0)
+        buffer = self.reader.sample_buffer
+        self.assertEqual(buffer.total_written, 16500)
+        self.assertEqual(buffer.epoch, epoch)
+        self.assertEqual(self.reader._timestamp_offset, 10500)
+        np.testing.assert_array_equal(window['t'], np.arange(16500))
+        # 原始数据按各段自己的样本计数生成，第二段从 0 开始；行的顺序是文件被发现的顺序，按通道名对照
+        channels = [int(name[2:]) for name in self.reader.file_processor.get_channel_names('amp')]
+        expected = np.concatenate([np.arange(10500), np.arange(6000)]) % 300
+        np.testing.assert_array_equal(window['amp'], expected + np.array(channels)[:, None])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+# test_shared_ring.py
+import unittest
+import multiprocessing
+import os
+import sys
+import uuid
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared_ring import SharedSampleRingBuffer
+
+
+def _attached_sum(name, start, stop, queue):
+    """子进程：挂上共享缓冲区并返回一段数据的校验和"""
+    ring = SharedSampleRingBuffer.attach(name)
+    window = ring.read_samples(start, stop)
+    queue.put((int(window['t'].sum()), int(window['amp'].astype(np.int64).sum()), ring.channel_names['amp']))
+    window = None
+    ring.close()
+
+
+class TestSharedRing(unittest.TestCase):
+
+    def setUp(self):
+        self.name = 'bcr_test_{}'.format(uuid.uuid4().hex[:8])
+        self.ring = SharedSampleRingBuffer(self.name, 1000, 1000, {'amp': 3, 'stim': 0},
+                                           {'amp': np.int16, 'stim': np.uint16},
+                                           {'amp': ['A-000', 'A-001', 'A-002']})
+        self.addCleanup(self.ring.close)
+
+    def _write(self, start, stop):
+        timestamps = np.arange(start, stop, dtype=np.int64)
+        amp = np.vstack([timestamps + c for c in range(3)]).astype(np.int16)
+        self.ring.write(timestamps, {'amp': amp, 'stim': np.zeros((0, stop - start), np.uint16)})
+
+    def test_attached_views_follow_writer(self):
+        """测试只读挂载后看到的游标、数据与采集端一致"""
+        client = SharedSampleRingBuffer.attach(self.name)
+        self.addCleanup(client.close)
+        self.assertEqual(client.channel_names['amp'], ['A-000', 'A-001', 'A-002'])
+        self.assertEqual(client.total_written, 0)
+
+        self._write(0, 1200)
+        self.assertEqual(client.total_written, 1200)
+        self.assertEqual(client.sequence, self.ring.sequence)
+
+        window = client.read_range(0.5, 0.6)
+        np.testing.assert_array_equal(window['amp'][2], np.arange(502, 602))
+
+        views = client.view_samples(900, 950)
+        self.assertFalse(views['amp'].flags.writeable)
+        self.assertTrue(np.shares_memory(views['amp'], client.signals['amp']))
+        np.testing.assert_array_equal(views['t'], np.arange(900, 950))
+        self.assertTrue(client.is_intact(900))
+        views = None
+
+        with self.assertRaises(RuntimeError):
+            client.write(np.arange(3), {'amp': np.zeros((3, 3), np.int16)})
+
+    def test_close_keeps_live_views(self):
+        """测试 close 之后还拿着的视图仍然可读，最后一个视图释放后才解除映射"""
+        self._write(0, 100)
+        client = SharedSampleRingBuffer.attach(self.name)
+        views = client.view_samples(10, 20)
+        client.close()
+        self.ring.close()
+        np.testing.assert_array_equal(views['amp'][1], np.arange(11, 21))
+        self.assertTrue(client._finalizer.alive)
+        views = None
+        self.assertFalse(client._finalizer.alive)
+        self.assertFalse(self.ring._finalizer.alive)
+
+    def test_attach_from_another_process(self):
+        """测试其他进程挂载读取"""
+        self._write(0, 800)
+        context = multiprocessing.get_context('spawn')
+        queue = context.Queue()
+        process = context.Process(target=_attached_sum, args=(self.name, 100, 200, queue))
+        process.start()
+        t_sum, amp_sum, names = queue.get(timeout=30)
+        process.join(timeout=30)
+
+        self.assertEqual(t_sum, int(np.arange(100, 200).sum()))
+        self.assertEqual(amp_sum, int(sum(np.arange(100, 200).sum() + 100 * c for c in range(3))))
+        self.assertEqual(names, ['A-000', 'A-001', 'A-002'])
+        # 子进程退出后共享内存仍然存在
+        client = SharedSampleRingBuffer.attach(self.name)
+        self.addCleanup(client.close)
+        self.assertEqual(client.total_written, 800)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+# test_snippet_store.py
+import unittest
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ingest_pipeline import ChannelManifest, IngestChunk, IngestPipeline, PipelineStage
+from snippet_store import SnippetExtractionStage
+from spike_detection import SpikeDetectionStage
+from stream_ring import StreamRing
+
+
+class _Passthrough(PipelineStage):
+    """把原始数据原样写进 'spikes' 数据流，代替滤波器组"""
+
+    name = 'passthrough'
+
+    def configure(self, manifest):
+        self.rings = {'spikes': StreamRing('spikes', manifest.sample_rate, manifest.channel_names['amp'], 1.0)}
+
+    def process(self, chunk):
+        data = chunk.stream('amp')
+        chunk.streams['spikes'] = data
+        self.rings['spikes'].write(chunk.start, chunk.timestamps, data)
+
+
+class TestSnippetExtraction(unittest.TestCase):
+
+    def setUp(self):
+        self.fs = 30000
+        rng = np.random.default_rng(3)
+        self.data = rng.normal(0, 10, (8, 30000)).astype(np.float32)
+        self.peaks = {(2, 1500): -200, (2, 2990): -150, (7, 9000): -250, (0, 29950): -200}
+        for (channel, index), amplitude in self.peaks.items():
+            self.data[channel, index - 2:index + 3] += amplitude * np.array([0.3, 0.7, 1, 0.7, 0.3])
+
+        self.pipeline = IngestPipeline()
+        self.pipeline.add_stage(_Passthrough())
+        self.pipeline.add_stage(SpikeDetectionStage(threshold_sigma=6))
+        self.extraction = SnippetExtractionStage(pre_ms=1.0, post_ms=2.0, n_neighbors=4, capacity=3)
+        self.pipeline.add_stage(self.extraction)
+        names = ['A-{:03d}'.format(i) for i in range(8)]
+        self.pipeline.configure(ChannelManifest(self.fs, {'amp': 8}, {'amp': names}, {'amp': np.float32}))
+
+    def _run(self, stop):
+        for start in range(0, stop, 3000):
+            self.pipeline.process(IngestChunk(start, np.arange(start, start + 3000),
+                                              {'amp': self.data[:, start:start + 3000]}, self.fs))
+
+    def test_waveforms_come_from_neighborhood(self):
+        """测试片段取自邻域通道，峰值后的数据跨块时等到写入后再提取"""
+        self._run(12000)
+        store = self.extraction.store
+        records, waveforms = store.query()
+        self.assertEqual(list(records['index']), [1500, 2990, 9000])
+        self.assertEqual(waveforms.shape, (3, 4, 90))
+
+        neighbors = store.neighbors[7]
+        self.assertEqual(list(neighbors), [4, 5, 6, 7])
+        np.testing.assert_array_equal(waveforms[2], self.data[4:8, 9000 - 30:9000 + 60])
+        self.assertEqual(waveforms[1, 2, 30], self.data[2, 2990])
+
+        records, waveforms = store.query(2000, 10000, channels=[7])
+        self.assertEqual(list(records['index']), [9000])
+
+    def test_ring_eviction(self):
+        """测试容量满后覆盖最老的片段"""
+        self._run(30000)
+        records, waveforms = self.extraction.store.query()
+        # 29950 的峰值后 2 ms 还没写入
+        self.assertEqual(list(records['index']), [1500, 2990, 9000])
+        self.data = np.concatenate((self.data, self.data[:, :3000]), axis=1)
+        self.pipeline.process(IngestChunk(30000, np.arange(30000, 33000), {'amp': self.data[:, 30000:]}, self.fs))
+        records, waveforms = self.extraction.store.query()
+        # 追加的一块是开头的重复，1500 处的尖峰再出现一次
+        self.assertEqual(list(records['index']), [9000, 29950, 31500])
+        np.testing.assert_array_equal(waveforms[1], self.data[0:4, 29920:30010])
+
+
+if __name__ == '__main__':
+    unittest.main()
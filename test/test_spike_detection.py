@@ -0,0 +1,64 @@
+# test_spike_detection.py
+import unittest
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ingest_pipeline import ChannelManifest, IngestChunk
+from spike_detection import SpikeDetectionStage
+
+
+class TestSpikeDetection(unittest.TestCase):
+
+    def setUp(self):
+        self.fs = 30000
+        rng = np.random.default_rng(2)
+        self.data = rng.normal(0, 10, (4, 60000)).astype(np.float32)
+        # 通道 1 上的尖峰：峰值位置 -> 幅度，2998 的峰值窗口跨越 3000 的块边界，20010 在 20000 之后的不应期内
+        self.spikes = {1000: -200, 2998: -150, 3040: -150, 20000: -180, 20010: -180, 45000: -300}
+        for index, amplitude in self.spikes.items():
+            self.data[1, index - 3:index + 4] += amplitude * np.array([0.2, 0.5, 0.8, 1, 0.8, 0.5, 0.2])
+        self.data[3, 30000] -= 500
+        manifest = ChannelManifest(self.fs, {'amp': 4}, {'amp': ['A-000', 'A-001', 'A-002', 'A-003']},
+                                   {'amp': np.int16})
+        self.stage = SpikeDetectionStage(refractory_ms=1.0)
+        self.stage.configure(manifest)
+
+    def _run(self, sizes):
+        start = 0
+        for size in sizes:
+            chunk = IngestChunk(start, np.arange(start, start + size), {}, self.fs)
+            chunk.streams['spikes'] = self.data[:, start:start + size]
+            self.stage.process(chunk)
+            start += size
+
+    def test_detects_across_chunk_boundaries(self):
+        """测试跨块的尖峰不丢，不应期内的重复尖峰被去掉"""
+        self._run([3000] * 20)
+        events = self.stage.events.query()
+
+        channel_1 = events[events['channel'] == 1]
+        self.assertEqual(list(channel_1['index']), [1000, 2998, 3040, 20000, 45000])
+        self.assertAlmostEqual(float(channel_1['amplitude'][-1]), -300, delta=40)
+        self.assertEqual(list(events[events['channel'] == 3]['index']), [30000])
+        self.assertTrue(np.all(np.diff(events['index']) >= 0))
+        np.testing.assert_allclose(self.stage.noise, 10, rtol=0.15)
+
+    def test_chunking_does_not_change_result(self):
+        """测试不同的分块方式检测结果一致，并按时间和通道查询"""
+        # 噪声估计只用第一块，排除分块对阈值的影响
+        self.stage.noise_time_constant = 1e9
+        self._run([3000] * 20)
+        expected = self.stage.events.query()
+        self.stage.reset()
+        self._run([3000, 17, 9983, 7000, 5] + [5000] * 7 + [4995])
+        np.testing.assert_array_equal(self.stage.events.query(), expected)
+
+        window = self.stage.events.query(2000, 25000, channels=[1])
+        self.assertEqual(list(window['index']), [2998, 3040, 20000])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+# test_stim_artifact.py
+import unittest
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from stim_artifact import StimArtifactStage, AMP_SETTLE_BIT, CHARGE_RECOVERY_BIT
+from data_readers import StimDataReader
+from ingest_pipeline import ChannelManifest, IngestChunk
+
+
+class TestStimArtifact(unittest.TestCase):
+
+    def setUp(self):
+        self.fs = 30000
+        self.manifest = ChannelManifest(self.fs, {'amp': 3, 'stim': 2},
+                                        {'amp': ['A-000', 'A-001', 'A-002'], 'stim': ['A-000', 'A-001']},
+                                        {'amp': np.int16, 'stim': np.uint16})
+        n = 9000
+        self.amp = np.tile(np.linspace(0, 90, n, dtype=np.float32), (3, 1))
+        self.stim = np.zeros((2, n), dtype=np.uint16)
+        # 双相脉冲：6 个样本负相（符号位为 1）、3 个样本相间延迟、6 个样本正相，再加 6 个样本电荷恢复
+        for channel, onset in ((0, 1000), (1, 2990), (0, 6000)):
+            self.stim[channel, onset:onset + 6] = 10 | 256 | AMP_SETTLE_BIT
+            self.stim[channel, onset + 9:onset + 15] = 10 | AMP_SETTLE_BIT
+            self.stim[channel, onset + 15:onset + 21] = CHARGE_RECOVERY_BIT
+            self.amp[:, onset:onset + 21] += 5000
+        self.converters = {'stim': StimDataReader().convert}
+
+    def _run(self, stage, sizes=(3000, 3000, 3000)):
+        start = 0
+        for size in sizes:
+            stop = start + size
+            stage.process(IngestChunk(start, np.arange(start, stop),
+                                      {'amp': self.amp[:, start:stop], 'stim': self.stim[:, start:stop]},
+                                      self.fs, converters=self.converters))
+            start = stop
+
+    def test_records_pulses(self):
+        """测试双相脉冲只记一次，电流按第一相换算"""
+        stage = StimArtifactStage()
+        stage.configure(self.manifest)
+        self._run(stage)
+        pulses = stage.events.query()
+        self.assertEqual(list(pulses['index']), [1000, 2990, 6000])
+        self.assertEqual(list(pulses['channel']), [0, 1, 0])
+        np.testing.assert_allclose(pulses['amplitude'], [-100, -100, -100])
+
+    def test_interpolates_across_chunks(self):
+        """测试刺激期间及前后余量线性插值，跨块的区间也连续"""
+        stage = StimArtifactStage(pre_ms=0.1, post_ms=1.0)
+        stage.configure(self.manifest)
+        self._run(stage)
+        clean, t = stage.rings['clean'].read_samples(0, 9000)
+        ramp = np.linspace(0, 90, 9000, dtype=np.float32)
+        # 块内的伪迹区间插值后回到斜坡上
+        outside = np.r_[0:2987, 3041:9000]
+        np.testing.assert_allclose(clean[:, outside], np.tile(ramp[outside], (3, 1)), atol=1e-2)
+        # 跨块的区间先保持前一个正常值，下一块再从这个值插值到第一个正常样本
+        np.testing.assert_allclose(clean[:, 2987:3000], ramp[2986], atol=1e-3)
+        self.assertTrue(np.all(np.diff(clean[0, 2986:3042]) >= 0))
+        self.assertLess(clean.max(), 90.01)
+        # 6000 处的脉冲正好在块开头，pre 余量落在已经输出的上一块里
+        self.assertEqual(stage.blanked_samples, 3 * (3 + 21 + 30) - 3)
+
+    def test_zero_mode(self):
+        """测试置零模式的区间"""
+        stage = StimArtifactStage(pre_ms=0.1, post_ms=1.0, mode='zero')
+        stage.configure(self.manifest)
+        self._run(stage, (2995, 6005))
+        clean, t = stage.rings['clean'].read_samples(0, 9000)
+        blanked = np.flatnonzero(clean[0] == 0)
+        expected = np.r_[0, np.arange(997, 1051), np.arange(2987, 3041), np.arange(5997, 6051)]
+        np.testing.assert_array_equal(blanked, expected)
+
+    def test_train_pulses_recorded_separately(self):
+        """测试 1 kHz 脉冲串每个脉冲各记一个事件，置零区间连成一段"""
+        self.stim[:] = 0
+        onsets = 1000 + 30 * np.arange(5)
+        for onset in onsets:
+            self.stim[0, onset:onset + 6] = 10 | 256
+            self.stim[0, onset + 9:onset + 15] = 10
+        stage = StimArtifactStage(pre_ms=0.1, post_ms=1.0, mode='zero')
+        stage.configure(self.manifest)
+        self._run(stage)
+        pulses = stage.events.query()
+        np.testing.assert_array_equal(pulses['index'], onsets)
+        clean, t = stage.rings['clean'].read_samples(0, 9000)
+        blanked = np.flatnonzero(clean[1] == 0)
+        np.testing.assert_array_equal(blanked, np.r_[0, 997:onsets[-1] + 15 + 30])
+
+
+if __name__ == '__main__':
+    unittest.main()
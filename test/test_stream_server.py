@@ -0,0 +1,117 @@
+# test_stream_server.py
+import unittest
+import os
+import socket
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ingest_pipeline import ChannelManifest, IngestChunk
+from stream_server import StreamServer, StreamClient, FLAG_DROPPED, FLAG_COALESCED
+
+
+class TestStreamServer(unittest.TestCase):
+
+    def _start_server(self, **kwargs):
+        server = StreamServer(port=0, **kwargs)
+        server.configure(ChannelManifest(30000, {'amp': 4}, {'amp': ['A-000', 'A-001', 'A-002', 'A-003']},
+                                         {'amp': np.int16}))
+        server.start()
+        self.addCleanup(server.stop)
+        return server
+
+    def _connect(self, server, channels):
+        client = StreamClient(port=server.address[1], channels=channels, timeout=10)
+        self.addCleanup(client.close)
+        deadline = time.time() + 5
+        while len(server.clients) < 1 and time.time() < deadline:
+            time.sleep(0.01)
+        return client
+
+    def _chunk(self, start, n):
+        timestamps = np.arange(start, start + n, dtype=np.int64)
+        amp = np.vstack([timestamps * (c + 1) for c in range(4)]).astype(np.int16)
+        return IngestChunk(start, timestamps, {'amp': amp}, 30000)
+
+    def test_channel_selection(self):
+        """测试按通道订阅，帧内容与采集数据一致"""
+        server = self._start_server()
+        client = self._connect(server, ['A-002', 0])
+        self.assertEqual(client.info['channels'], ['A-002', 'A-000'])
+
+        server.process(self._chunk(0, 300))
+        server.process(self._chunk(300, 300))
+
+        header, data = client.recv_frame()
+        self.assertEqual(header['start'], 0)
+        self.assertEqual(header['sample_rate'], 30000)
+        np.testing.assert_array_equal(data[0], (np.arange(300) * 3).astype(np.int16))
+        np.testing.assert_array_equal(data[1], np.arange(300).astype(np.int16))
+
+        header, data = client.recv_frame()
+        self.assertEqual((header['sequence'], header['start'], header['flags']), (1, 300, 0))
+
+    def test_silent_client_does_not_block_others(self):
+        """测试不发订阅的客户端不会挡住其他客户端；握手回复数字输入的真实数据类型"""
+        server = StreamServer(port=0, signal_type='digital_in')
+        server.configure(ChannelManifest(30000, {'amp': 4, 'digital_in': 1}, {'digital_in': ['DIGITAL-IN-01']},
+                                         {'amp': np.int16, 'digital_in': np.uint16}))
+        server.start()
+        self.addCleanup(server.stop)
+        silent = socket.create_connection(('127.0.0.1', server.address[1]))
+        self.addCleanup(silent.close)
+        time.sleep(0.1)
+
+        started = time.time()
+        client = self._connect(server, None)
+        self.assertLess(time.time() - started, 2.0)
+        self.assertEqual(client.info['dtype'], '<u2')
+        digital = np.array([[0, 1, 40000, 65535]], dtype=np.uint16)
+        server.process(IngestChunk(0, np.arange(4), {'digital_in': digital}, 30000))
+        header, data = client.recv_frame()
+        self.assertEqual(data.dtype, np.uint16)
+        np.testing.assert_array_equal(data, digital)
+
+    def test_slow_client_coalesce(self):
+        """测试慢客户端：加载线程不阻塞，排队的块被合并"""
+        server = self._start_server(max_queue=2, slow_client_policy='coalesce', max_coalesce_samples=10 ** 7)
+        client = self._connect(server, None)
+
+        t_start = time.perf_counter()
+        for k in range(40):
+            server.process(self._chunk(k * 100000, 100000))
+        elapsed = time.perf_counter() - t_start
+        self.assertLess(elapsed, 2.0)
+
+        received = 0
+        flags = 0
+        while received < 40 * 100000:
+            header, data = client.recv_frame()
+            self.assertEqual(header['start'], received)
+            received += data.shape[1]
+            flags |= header['flags']
+        self.assertTrue(flags & FLAG_COALESCED)
+        self.assertFalse(flags & FLAG_DROPPED)
+
+    def test_slow_client_drop(self):
+        """测试慢客户端：drop 策略丢最老的块并在帧里标记"""
+        server = self._start_server(max_queue=2, slow_client_policy='drop')
+        client = self._connect(server, None)
+
+        for k in range(40):
+            server.process(self._chunk(k * 100000, 100000))
+
+        flags = 0
+        last_start = -1
+        while last_start < 39 * 100000:
+            header, data = client.recv_frame()
+            last_start = header['start']
+            flags |= header['flags']
+        self.assertTrue(flags & FLAG_DROPPED)
+        self.assertGreater(server.clients[0].dropped_chunks, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
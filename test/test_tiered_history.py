@@ -0,0 +1,62 @@
+# test_tiered_history.py
+import unittest
+import tempfile
+import shutil
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sample_ring_buffer import SampleRingBuffer
+from tiered_history import SpillStore
+
+
+class TestTieredHistory(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        counts = {'amp': 2}
+        dtypes = {'amp': np.int16}
+        self.spill = SpillStore(self.directory, 4000, 1000, counts, dtypes)
+        self.buffer = SampleRingBuffer(1000, 1000, counts, dtypes, spill=self.spill)
+
+    def _write(self, start, stop):
+        timestamps = np.arange(start, stop, dtype=np.int64)
+        self.buffer.write(timestamps, {'amp': np.vstack((timestamps, timestamps // 2)).astype(np.int16)})
+
+    def test_evicted_samples_are_spilled(self):
+        """测试被内存环挤出的样本进入磁盘层，绝对索引保持一致"""
+        for start in range(0, 4000, 700):
+            self._write(start, min(start + 700, 4000))
+
+        self.assertEqual(self.buffer.oldest_index, 3000)
+        self.assertEqual(self.spill.total_written, 3000)
+        self.assertEqual(self.buffer.earliest_index, 0)
+
+        window = self.buffer.read_samples(2500, 3500)
+        np.testing.assert_array_equal(window['t'], np.arange(2500, 3500))
+        np.testing.assert_array_equal(window['amp'][0], np.arange(2500, 3500))
+
+    def test_read_range_spans_tiers(self):
+        """测试按时间查询时透明地跨越两层"""
+        self._write(0, 3000)
+        self._write(3500, 6500)  # 中间丢了 500 个样本
+
+        window = self.buffer.read_range(2.9, 3.6)
+        np.testing.assert_array_equal(window['t'], np.concatenate((np.arange(2900, 3000), np.arange(3500, 3600))))
+
+        # 磁盘层也满了以后，最老的样本被覆盖
+        self.assertEqual(self.buffer.earliest_index, 1000)
+        self.assertIsNone(self.buffer.read_range(0.0, 0.1))
+
+    def test_close_removes_files(self):
+        """测试关闭后删除 spill 文件"""
+        self._write(0, 1500)
+        self.spill.close()
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
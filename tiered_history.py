@@ -0,0 +1,59 @@
+import os
+import numpy as np
+
+from log_manager import LogManager
+from sample_ring_buffer import SampleRingBuffer
+
+
+class SpillStore(SampleRingBuffer):
+    """
+    磁盘上的历史样本层。
+
+    内存中的 SampleRingBuffer 覆盖最老的样本之前，先把它们追加到这里。存储格式与内存环相同：
+    每种信号一个 (通道数, 容量) 的 memmap 文件，保持原始数据类型（amp 为 int16），
+    时间戳单独一个 int64 文件作为索引。绝对样本索引与内存环一致，所以跨两层的查询只需按索引拼接。
+    占用的只是页缓存，进程内存不随历史长度增长。
+    """
+
+    def __init__(self, directory, capacity, sample_rate, channel_counts, dtypes):
+        """
+        参数:
+            directory (str): 存放 spill 文件的本地目录（建议放在本地盘，不要和 Intan 的记录目录混用）。
+            capacity (int): 磁盘层保存的样本数。
+            sample_rate (int): 采样率。
+            channel_counts (dict): 信号类型 -> 通道数。
+            dtypes (dict): 信号类型 -> 原始数据类型。
+        """
+        self.directory = directory
+        self.file_paths = []
+        os.makedirs(directory, exist_ok=True)
+        super(SpillStore, self).__init__(capacity, sample_rate, channel_counts, dtypes)
+        self._logger = LogManager.get_logger("SpillStore")
+        self._logger.info("Spill store ready: {} samples in {}", self.capacity, directory)
+
+    def _allocate(self, name, shape, dtype):
+        """每种信号一个 memmap 文件"""
+        path = os.path.join(self.directory, 'spill_{}.dat'.format(name))
+        self.file_paths.append(path)
+        if 0 in shape:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='w+', shape=shape)
+
+    def close(self, remove_files=True):
+        """释放 memmap，默认删除 spill 文件"""
+        arrays = [self.timestamps] + list(self.signals.values())
+        mmaps = [a._mmap for a in arrays if getattr(a, '_mmap', None) is not None]
+        self.timestamps = None
+        self.signals = {}
+        del arrays
+        for mm in mmaps:
+            try:
+                mm.close()
+            except BufferError:
+                # 外部还持有视图时只能等垃圾回收
+                self._logger.warning("Spill file still referenced, leaving it open")
+                remove_files = False
+        if remove_files:
+            for path in self.file_paths:
+                if os.path.exists(path):
+                    os.remove(path)